@@ -3,15 +3,20 @@ FastAPI 應用程式入口
 """
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
+from contextlib import asynccontextmanager
 import os
+import threading
 from dotenv import load_dotenv
 
-from services.barcode import BarcodeParser, BarcodeGenerator, CRC16
-from services.sheet import sheet_service
+from services.analytics import DIMENSIONS, to_epoch, NO_TIMESTAMP
+from services.barcode import BarcodeParser, BarcodeGenerator, barcode_memo
+from services.storage import log_storage, get_log_storage, current_log_storage, shutdown_log_storage
+from services.sheet_io import sheet_io, SheetIOTimeout
+from services.sheet_quota import SheetQuotaDeadlineExceeded
 from services.config_loader import config_loader
 from services.qrcode_generator import QRCodeGenerator
 import re
@@ -19,7 +24,40 @@ import math
 
 load_dotenv()
 
-app = FastAPI(title="工廠製程物流追溯與分析系統", version="0.0.7")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    應用程式生命週期
+    啟動時在背景線程建立存儲後端（驗證憑證、載入快照、首次同步），服務不必等待 Google API 即可開始接受連線；
+    載入完成前，查詢會在 sheet_io 線程中等待，就緒狀態見 /api/health/ready。
+    結束時停止存儲後端的背景線程（寫入日誌、定期同步、複寫）並寫入快照，再關閉 sheet_io 線程池
+    """
+    threading.Thread(target=get_log_storage, name="storage-init", daemon=True).start()
+    yield
+    shutdown_log_storage()
+    sheet_io.shutdown()
+
+
+app = FastAPI(title="工廠製程物流追溯與分析系統", version="0.0.7", lifespan=lifespan)
+
+# Google Sheets 呼叫逾時：返回 504，讓前端提示稍後重試
+@app.exception_handler(SheetIOTimeout)
+async def sheet_io_timeout_handler(request, exc: SheetIOTimeout):
+    return JSONResponse(
+        status_code=504,
+        content={"detail": f"Google Sheets 回應逾時（超過 {exc.timeout} 秒），請稍後再試"}
+    )
+
+
+# Google Sheets 配額不足（等待配額會超過逾時）：返回 503，讓前端提示稍後重試
+@app.exception_handler(SheetQuotaDeadlineExceeded)
+async def sheet_quota_deadline_handler(request, exc: SheetQuotaDeadlineExceeded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Google Sheets 配額暫時不足，請稍後再試"}
+    )
+
 
 # 掛載靜態檔案目錄
 static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -85,7 +123,7 @@ class FirstStationRequest(BaseModel):
 # 背景任務：寫入 Google Sheets
 def write_to_sheet(log_data: dict):
     """背景任務：寫入記錄到 Google Sheets"""
-    sheet_service.write_log(log_data)
+    log_storage.write_log(log_data)
 
 
 @app.get("/")
@@ -117,7 +155,7 @@ async def get_previous_station_barcodes_api(order: str, current_station_id: str)
     if not order or not current_station_id:
         raise HTTPException(status_code=400, detail="工單號和當前站點不能為空")
     
-    barcodes = sheet_service.get_previous_station_barcodes(order, current_station_id)
+    barcodes = await sheet_io.run_local(log_storage.get_previous_station_barcodes, order, current_station_id)
     
     return {
         "success": True,
@@ -126,7 +164,7 @@ async def get_previous_station_barcodes_api(order: str, current_station_id: str)
 
 
 @app.get("/api/scan/current-station-inbound-barcodes")
-async def get_current_station_inbound_barcodes_api(station_id: str):
+async def get_current_station_inbound_barcodes_api(station_id: str, offset: int = 0, limit: Optional[int] = None):
     """
     查詢當前站點的所有遷入條碼（IN 記錄）
     
@@ -134,18 +172,24 @@ async def get_current_station_inbound_barcodes_api(station_id: str):
     
     Args:
         station_id: 站點代號（例如：P1, P2）
+        offset: 分頁起始位置（可選）
+        limit: 每頁筆數（可選，不指定則返回全部）
     
     Returns:
-        當前站點的遷入條碼列表
+        當前站點的遷入條碼列表，total 為尚未遷出的條碼總數
     """
     if not station_id:
         raise HTTPException(status_code=400, detail="站點代號不能為空")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="分頁參數不能為負數")
     
-    barcodes = sheet_service.get_inbound_barcodes_at_station(station_id)
+    barcodes = await sheet_io.run_local(log_storage.get_inbound_barcodes_at_station, station_id, offset, limit)
+    total = await sheet_io.run_local(log_storage.count_inbound_barcodes_at_station, station_id)
     
     return {
         "success": True,
-        "data": barcodes
+        "data": barcodes,
+        "total": total
     }
 
 
@@ -158,7 +202,7 @@ async def check_barcode(request: CheckBarcodeRequest):
     返回建議的操作類型：'inbound', 'outbound', 'first'
     """
     # 先嘗試完整解析條碼
-    parsed = BarcodeParser.parse(request.barcode)
+    parsed = barcode_memo.parse(request.barcode)
     
     # 如果完整解析失敗，嘗試部分解析（至少識別工單號和製程代號）
     if not parsed:
@@ -195,7 +239,7 @@ async def check_barcode(request: CheckBarcodeRequest):
         }
     
     # 對於完整條碼，驗證 CRC16 校驗碼
-    if not CRC16.verify(request.barcode):
+    if not barcode_memo.verify(request.barcode):
         raise HTTPException(status_code=400, detail="條碼校驗碼錯誤")
     
     # 取得當前站點
@@ -211,8 +255,8 @@ async def check_barcode(request: CheckBarcodeRequest):
     # ========== 情況 1：本站條碼 ==========
     if barcode_order == current_order:
         # 本站條碼：根據進出記錄判斷是遷出還是遷入
-        has_in_at_current = sheet_service.has_inbound_record_at_station(request.barcode, current_station)
-        has_out_at_current = sheet_service.has_outbound_record_at_station(request.barcode, current_station)
+        has_in_at_current = await sheet_io.run_local(log_storage.has_inbound_record_at_station, request.barcode, current_station)
+        has_out_at_current = await sheet_io.run_local(log_storage.has_outbound_record_at_station, request.barcode, current_station)
         
         if has_in_at_current:
             # 有遷入記錄 → 遷出
@@ -256,7 +300,7 @@ async def check_barcode(request: CheckBarcodeRequest):
     
     # ========== 情況 2：非本站條碼 ==========
     # 檢查是否在其他站有遷入記錄
-    has_in_at_other_stations = sheet_service.has_inbound_record_at_other_stations(request.barcode, current_station)
+    has_in_at_other_stations = await sheet_io.run_local(log_storage.has_inbound_record_at_other_stations, request.barcode, current_station)
     
     if has_in_at_other_stations:
         # 在其他站有遷入記錄 → 只允許查詢
@@ -405,7 +449,7 @@ async def get_inbound_quantity(order: str, station_id: str):
         該工單在該站點的遷入總數量
     """
     # 查詢該工單的所有記錄
-    logs = sheet_service.get_logs_by_order(order, limit=1000)
+    logs = await sheet_io.run_local(log_storage.get_logs_by_order, order, limit=1000)
     
     # 過濾出該站點的 IN 記錄
     total_qty = 0
@@ -466,12 +510,12 @@ async def scan_inbound(request: InboundRequest, background_tasks: BackgroundTask
     4. 若驗證通過，使用 BackgroundTasks 寫入 Google Sheets
     """
     # 解析條碼
-    parsed = BarcodeParser.parse(request.barcode)
+    parsed = barcode_memo.parse(request.barcode)
     if not parsed:
         raise HTTPException(status_code=400, detail="條碼格式錯誤，無法解析")
     
     # 驗證 CRC16 校驗碼
-    if not CRC16.verify(request.barcode):
+    if not barcode_memo.verify(request.barcode):
         raise HTTPException(status_code=400, detail="條碼校驗碼錯誤")
     
     # 取得 SKU 和上一站
@@ -481,7 +525,7 @@ async def scan_inbound(request: InboundRequest, background_tasks: BackgroundTask
     
     # 檢查該條碼在當前站點是否已有 IN 記錄
     # 如果該條碼在當前站點已經遷入過，應該使用遷出功能，不能再遷入
-    has_in_at_current = sheet_service.has_inbound_record_at_station(request.barcode, curr_station)
+    has_in_at_current = await sheet_io.run_local(log_storage.has_inbound_record_at_station, request.barcode, curr_station)
     
     if has_in_at_current:
         # 如果當前站點已有 IN 記錄，返回特殊狀態，讓前端切換到遷出
@@ -501,7 +545,7 @@ async def scan_inbound(request: InboundRequest, background_tasks: BackgroundTask
     # 應該直接使用遷出功能，不要再遷入
     # 注意：這裡檢查的是「當前站點」的遷出記錄，而不是「任何站點」的遷出記錄
     # 因為上游站點的遷出記錄不應該阻止下游站點的遷入
-    has_out_at_current = sheet_service.has_outbound_record_at_station(request.barcode, curr_station)
+    has_out_at_current = await sheet_io.run_local(log_storage.has_outbound_record_at_station, request.barcode, curr_station)
     
     if has_out_at_current:
         # 如果當前站點已有 OUT 記錄，返回特殊狀態，讓前端切換到遷出
@@ -538,18 +582,20 @@ async def scan_inbound(request: InboundRequest, background_tasks: BackgroundTask
     
     # 批量檢查所有條碼的 IN 記錄狀態（一次性 API 調用）
     print(f"[批量遷入] 批量檢查 {len(barcodes_to_process)} 個條碼的遷入記錄狀態")
-    inbound_status = sheet_service.batch_check_inbound_records(barcodes_to_process, curr_station)
+    inbound_status = await sheet_io.run_local(log_storage.batch_check_inbound_records, barcodes_to_process, curr_station)
+    # 一次驗證所有條碼的 CRC16 校驗碼
+    crc_status = barcode_memo.verify_many(barcodes_to_process)
     
     for idx, barcode_to_process in enumerate(barcodes_to_process):
         print(f"[批量遷入] 處理第 {idx + 1}/{len(barcodes_to_process)} 個條碼：{barcode_to_process}")
         # 解析條碼
-        parsed_barcode = BarcodeParser.parse(barcode_to_process)
+        parsed_barcode = barcode_memo.parse(barcode_to_process)
         if not parsed_barcode:
             failed_barcodes.append(barcode_to_process)
             continue
         
-        # 驗證 CRC16 校驗碼
-        if not CRC16.verify(barcode_to_process):
+        # 驗證 CRC16 校驗碼（使用批量驗證結果）
+        if not crc_status[barcode_to_process]:
             failed_barcodes.append(barcode_to_process)
             continue
         
@@ -586,7 +632,8 @@ async def scan_inbound(request: InboundRequest, background_tasks: BackgroundTask
     # 批量寫入所有有效記錄（一次性 API 調用）
     if valid_logs:
         print(f"[批量遷入] 準備批量寫入 {len(valid_logs)} 筆記錄")
-        success_count, failed_indices = sheet_service.write_logs_batch(valid_logs)
+        # 先寫入本機日誌再由背景提交（不設逾時，避免逾時後重試重複寫入）
+        success_count, failed_indices = await sheet_io.run_write(log_storage.submit_logs, valid_logs)
         if failed_indices:
             # 如果有失敗的記錄，記錄對應的條碼
             for idx in failed_indices:
@@ -646,12 +693,12 @@ async def scan_outbound(request: OutboundRequest):
     6. 寫入 Google Sheets（每個箱子一筆記錄）
     """
     # 解析舊條碼
-    parsed = BarcodeParser.parse(request.barcode)
+    parsed = barcode_memo.parse(request.barcode)
     if not parsed:
         raise HTTPException(status_code=400, detail="條碼格式錯誤，無法解析")
     
     # 驗證 CRC16 校驗碼
-    if not CRC16.verify(request.barcode):
+    if not barcode_memo.verify(request.barcode):
         raise HTTPException(status_code=400, detail="條碼校驗碼錯誤")
     
     # 檢查是否有良品或不良品項目
@@ -720,35 +767,22 @@ async def scan_outbound(request: OutboundRequest):
         # 計算需要幾個箱子
         num_boxes = math.ceil(qty / container_capacity)
         
-        # 計算每個箱子的數量
-        boxes = []
-        remaining_qty = qty
+        # 計算每個箱子的數量：最後一箱包含所有剩餘數量（尾數），其他箱子使用容器容量
+        box_qtys = [container_capacity] * (num_boxes - 1) + [qty - container_capacity * (num_boxes - 1)]
         
-        for box_num in range(1, num_boxes + 1):
-            if box_num == num_boxes:
-                # 最後一箱：包含所有剩餘數量（尾數）
-                box_qty = remaining_qty
-            else:
-                # 其他箱子：使用容器容量
-                box_qty = container_capacity
-                remaining_qty -= container_capacity
-            
-            # 生成箱號（01, 02, 03...）
+        # 一次生成所有箱子的新條碼（工單、SKU 沿用舊條碼，製程、容器、貨態使用本次遷出的值）
+        # 箱號為 01, 02, 03...
+        new_barcodes = BarcodeGenerator.generate_series(
+            {**parsed, "process": request.current_station_id, "container": container_code,
+             "status": status or parsed['status']},
+            [{"box_seq": str(box_num).zfill(2), "qty": str(box_qty).zfill(4)}
+             for box_num, box_qty in enumerate(box_qtys, start=1)]
+        )
+        
+        boxes = []
+        for box_num, (box_qty, new_barcode) in enumerate(zip(box_qtys, new_barcodes), start=1):
             box_seq = str(box_num).zfill(2)
             
-            # 生成新條碼
-            new_barcode = BarcodeGenerator.generate_from_previous(
-                previous_barcode=request.barcode,
-                new_process=request.current_station_id,
-                new_container=container_code,
-                new_box_seq=box_seq,
-                new_status=status,
-                new_qty=str(box_qty).zfill(4)
-            )
-            
-            if not new_barcode:
-                raise HTTPException(status_code=500, detail=f"生成{item_type}第 {box_num} 箱條碼失敗")
-            
             # 組合成完整的條碼 URL
             if domain:
                 new_barcode_with_domain = f"{domain}/b={new_barcode}"
@@ -810,7 +844,8 @@ async def scan_outbound(request: OutboundRequest):
     
     # 批量寫入 Google Sheets
     if all_logs:
-        success_count, failed_indices = sheet_service.write_logs_batch(all_logs)
+        # 先寫入本機日誌再由背景提交（不設逾時，避免逾時後重試重複寫入）
+        success_count, failed_indices = await sheet_io.run_write(log_storage.submit_logs, all_logs)
         if success_count < len(all_logs):
             # 部分或全部寫入失敗
             raise HTTPException(
@@ -842,243 +877,14 @@ async def scan_trace(request: TraceRequest):
     根據條碼查詢該工單的時間軸與良率統計
     按製程站點分組，計算出入時間、總耗時間、投入數量、產出數量
     """
-    from collections import defaultdict
-    from datetime import datetime
-    
     # 解析條碼
-    parsed = BarcodeParser.parse(request.barcode)
+    parsed = barcode_memo.parse(request.barcode)
     if not parsed:
         raise HTTPException(status_code=400, detail="條碼格式錯誤，無法解析")
     
-    # 查詢該工單的所有記錄
+    # 讀取該工單的追溯彙總（站點時間軸與統計隨每筆記錄增量維護，見 services/order_trace.py）
     order = parsed['order']
-    logs = sheet_service.get_logs_by_order(order)
-    
-    # 按製程站點分組記錄
-    station_logs = defaultdict(lambda: {"in": [], "out": []})
-    
-    for log in logs:
-        process = log.get("process", "").upper()
-        action = log.get("action", "").upper()
-        timestamp_str = log.get("timestamp", "")
-        
-        # 解析時間戳記
-        try:
-            if isinstance(timestamp_str, str) and timestamp_str.strip():
-                # 嘗試多種時間格式
-                timestamp = None
-                for fmt in ["%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S.%f"]:
-                    try:
-                        timestamp = datetime.strptime(timestamp_str.strip(), fmt)
-                        break
-                    except:
-                        continue
-                if timestamp is None:
-                    continue  # 如果所有格式都失敗，跳過這筆記錄
-            elif isinstance(timestamp_str, datetime):
-                timestamp = timestamp_str
-            else:
-                continue  # 無效的時間戳記，跳過
-        except Exception as e:
-            print(f"解析時間戳記失敗：{timestamp_str}, 錯誤：{e}")
-            continue
-        
-        log_entry = {
-            "timestamp": timestamp,
-            "timestamp_str": timestamp_str,
-            "operator": log.get("operator", ""),
-            "qty": int(log.get("qty", 0) or 0),
-            "status": log.get("status", ""),
-            "container": log.get("container", ""),
-            "box_seq": log.get("box_seq", ""),
-            "cycle_time": float(log.get("cycle_time", 0) or 0)
-        }
-        
-        if action == "IN":
-            station_logs[process]["in"].append(log_entry)
-        elif action == "OUT":
-            station_logs[process]["out"].append(log_entry)
-    
-    # 按時間排序每個站點的記錄
-    for process in station_logs:
-        station_logs[process]["in"].sort(key=lambda x: x["timestamp"])
-        station_logs[process]["out"].sort(key=lambda x: x["timestamp"])
-    
-    # 定義站點順序（用於確定首站和計算投入數量）
-    station_order = {'P1': 1, 'P2': 2, 'P3': 3, 'P4': 4, 'P5': 5}
-    
-    # 找到首站（第一個有OUT記錄的站點，按站點順序）
-    first_station = None
-    first_station_order = None
-    for process, records in station_logs.items():
-        if records["out"]:  # 有遷出記錄
-            process_order = station_order.get(process, 999)
-            if first_station_order is None or process_order < first_station_order:
-                first_station = process
-                first_station_order = process_order
-    
-    # 構建站點時間軸（按站點順序排序，而不是按時間）
-    station_timeline = []
-    # 按站點順序處理每個站點
-    sorted_processes = sorted(station_logs.keys(), key=lambda p: station_order.get(p, 999))
-    
-    # 用於追蹤上一站的產出良品數量
-    previous_station_good_qty = None
-    
-    for process in sorted_processes:
-        records = station_logs[process]
-        
-        # 找到最早的記錄時間
-        earliest_time = None
-        if records["in"]:
-            earliest_time = records["in"][0]["timestamp"]
-        if records["out"]:
-            out_time = records["out"][0]["timestamp"]
-            if earliest_time is None or out_time < earliest_time:
-                earliest_time = out_time
-        
-        if earliest_time:
-            # 計算投入數量：
-            # - 如果是首站，使用所有 IN 記錄的數量總和
-            # - 如果不是首站，使用上一站的產出良品數量
-            if process == first_station:
-                # 首站：投入數量 = 所有 IN 記錄的數量總和
-                input_qty = sum(r["qty"] for r in records["in"])
-            else:
-                # 非首站：投入數量 = 上一站的產出良品數量
-                input_qty = previous_station_good_qty if previous_station_good_qty is not None else 0
-            
-            # 計算產出數量（所有 OUT 記錄的數量總和）
-            output_qty = sum(r["qty"] for r in records["out"])
-            
-            # 計算產出良品數量（所有 OUT 記錄中狀態為 G 的數量總和）
-            output_good_qty = sum(r["qty"] for r in records["out"] if r["status"].upper() == "G")
-            
-            # 計算產出不良品數量（所有 OUT 記錄中狀態不是 G 的數量總和）
-            output_bad_qty = sum(r["qty"] for r in records["out"] if r["status"].upper() != "G")
-            
-            # 更新上一站的產出良品數量（用於下一個站點的投入數量計算）
-            previous_station_good_qty = output_good_qty
-            
-            # 計算總耗時間（從最早 IN 到最晚 OUT）
-            total_time = None
-            if records["in"] and records["out"]:
-                first_in = records["in"][0]["timestamp"]
-                last_out = records["out"][-1]["timestamp"]
-                time_diff = last_out - first_in
-                total_seconds = time_diff.total_seconds()
-                hours = int(total_seconds // 3600)
-                minutes = int((total_seconds % 3600) // 60)
-                seconds = int(total_seconds % 60)
-                total_time = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            
-            # 獲取出入時間
-            in_time = records["in"][0]["timestamp_str"] if records["in"] else None
-            out_time = records["out"][-1]["timestamp_str"] if records["out"] else None
-            
-            station_timeline.append({
-                "process": process,
-                "earliest_time": earliest_time.isoformat() if earliest_time else None,
-                "in_time": in_time,
-                "out_time": out_time,
-                "total_time": total_time,
-                "input_qty": input_qty,
-                "output_qty": output_qty,
-                "output_good_qty": output_good_qty,
-                "output_bad_qty": output_bad_qty,
-                "in_records": records["in"],
-                "out_records": records["out"]
-            })
-    
-    # 按站點順序排序（P1, P2, P3, P4, P5），而不是按時間
-    station_timeline.sort(key=lambda x: station_order.get(x["process"], 999))
-    
-    # ========== 計算統計數據（根據新的邏輯）==========
-    # 1. 總數 = 首站遷出的良品與不良品加總
-    # 找到首站（第一個有 OUT 記錄的站點，按時間順序）
-    first_station = None
-    first_station_time = None
-    
-    # 找到最早有遷出記錄的站點（按時間排序）
-    for process, records in station_logs.items():
-        if records["out"]:  # 有遷出記錄
-            # 找到最早的遷出時間
-            earliest_out_time = records["out"][0]["timestamp"]
-            
-            # 如果這是第一個找到的站點，或者時間更早，則更新首站
-            if first_station_time is None or earliest_out_time < first_station_time:
-                first_station = process
-                first_station_time = earliest_out_time
-    
-    # 計算首站遷出的總數（良品 + 不良品）
-    total_qty = 0
-    if first_station and first_station in station_logs:
-        for out_record in station_logs[first_station]["out"]:
-            total_qty += out_record["qty"]
-    
-    # 2. 找到最終站（最後一個有 OUT 記錄的站點，按時間順序）
-    final_station = None
-    final_station_time = None
-    
-    for process, records in station_logs.items():
-        if records["out"]:  # 有遷出記錄
-            # 找到最晚的遷出時間
-            latest_out_time = records["out"][-1]["timestamp"]
-            
-            # 如果這是第一個找到的站點，或者時間更晚，則更新最終站
-            if final_station_time is None or latest_out_time > final_station_time:
-                final_station = process
-                final_station_time = latest_out_time
-    
-    # 3. 計算最終站的良品數量
-    final_good_qty = 0
-    
-    if final_station and final_station in station_logs:
-        for out_record in station_logs[final_station]["out"]:
-            qty = out_record["qty"]
-            status = out_record["status"].upper()
-            if status == "G":  # 良品
-                final_good_qty += qty
-    
-    # 4. 計算全製程不良品 = 首站投入總數 - 最終站良品數
-    total_defect_qty = total_qty - final_good_qty
-    
-    # 5. 計算直通率 = 最終站良品數 / 首站投入總數 × 100%
-    first_pass_rate = (final_good_qty / total_qty * 100) if total_qty > 0 else 0
-    
-    # 6. 計算全製程用時（累加各製程的總耗時間）
-    total_process_time_seconds = 0
-    for station in station_timeline:
-        if station.get("total_time"):
-            # 解析時間格式 "HH:MM:SS"
-            time_parts = station["total_time"].split(":")
-            if len(time_parts) == 3:
-                hours = int(time_parts[0])
-                minutes = int(time_parts[1])
-                seconds = int(time_parts[2])
-                total_process_time_seconds += hours * 3600 + minutes * 60 + seconds
-    
-    # 格式化全製程用時
-    total_hours = int(total_process_time_seconds // 3600)
-    total_minutes = int((total_process_time_seconds % 3600) // 60)
-    total_seconds = int(total_process_time_seconds % 60)
-    total_process_time = f"{total_hours:02d}:{total_minutes:02d}:{total_seconds:02d}"
-    
-    # 5. 計算各製程站的良率（產出良品數量 / 投入數量）
-    # 注意：當站良率必須基於投入數量計算，而不是產出總數
-    station_yield_rates = {}
-    for process, records in station_logs.items():
-        # 計算投入數量（所有 IN 記錄的數量總和）
-        input_qty = sum(r["qty"] for r in records["in"])
-        
-        # 計算產出良品數量（所有 OUT 記錄中狀態為 G 的數量總和）
-        output_good_qty = sum(r["qty"] for r in records["out"] if r["status"].upper() == "G")
-        
-        # 當站良率 = 產出良品數量 / 投入數量（必須有投入記錄才能計算）
-        # 如果沒有投入記錄，則不計算當站良率（避免使用產出總數作為分母）
-        if input_qty > 0 and records["out"]:  # 必須同時有投入和產出記錄
-            station_yield = (output_good_qty / input_qty * 100)
-            station_yield_rates[process] = round(station_yield, 2)
+    trace = await sheet_io.run_local(log_storage.get_order_trace, order)
     
     # 從 SKU 提取產品線和機種信息
     sku = parsed['sku']
@@ -1120,16 +926,8 @@ async def scan_trace(request: TraceRequest):
             "series_name": series_name,
             "model_code": model_code,
             "model_name": model_name,
-            "station_timeline": station_timeline,
-            "statistics": {
-                "total_qty": total_qty,  # 首站遷出的總數
-                "final_good_qty": final_good_qty,  # 最終站的良品數量
-                "total_defect_qty": total_defect_qty,  # 全製程不良品 = 首站投入總數 - 最終站良品數
-                "first_pass_rate": round(first_pass_rate, 2),  # 直通率 = 最終站良品數 / 首站投入總數 × 100%
-                "yield_rate": round((final_good_qty / total_qty * 100) if total_qty > 0 else 0, 2),  # 良率 = 良品/總數
-                "total_process_time": total_process_time,  # 全製程用時（累加各製程的總耗時間）
-                "station_yield_rates": station_yield_rates  # 各製程站的良率
-            }
+            "station_timeline": trace["station_timeline"],
+            "statistics": trace["statistics"]
         }
     }
 
@@ -1188,40 +986,28 @@ async def scan_first(request: FirstStationRequest, background_tasks: BackgroundT
     # 尾數統一放在最後一箱
     num_boxes = math.ceil(total_qty / container_capacity)
     
-    # 計算每個箱子的數量
-    boxes = []
-    remaining_qty = total_qty
+    # 計算每個箱子的數量：最後一箱包含所有剩餘數量（尾數），其他箱子使用容器容量
+    box_qtys = [container_capacity] * (num_boxes - 1) + [total_qty - container_capacity * (num_boxes - 1)]
     
-    for box_num in range(1, num_boxes + 1):
-        if box_num == num_boxes:
-            # 最後一箱：包含所有剩餘數量（尾數）
-            box_qty = remaining_qty
-        else:
-            # 其他箱子：使用容器容量
-            box_qty = container_capacity
-            remaining_qty -= container_capacity
-        
-        # 生成箱號（01, 02, 03...）
+    # 一次生成所有箱子的條碼（箱號為 01, 02, 03...）
+    barcodes = BarcodeGenerator.generate_series(
+        {"order": order_upper, "process": request.current_station_id, "sku": sku,
+         "container": container_code, "status": request.status},
+        [{"box_seq": str(box_num).zfill(2), "qty": str(box_qty).zfill(4)}
+         for box_num, box_qty in enumerate(box_qtys, start=1)]
+    )
+    
+    # 取得 domain 設定
+    domain = config_loader.get_value("settings", "Settings", "domain", "")
+    if domain:
+        domain = domain.rstrip('/')
+    
+    boxes = []
+    for box_num, (box_qty, barcode) in enumerate(zip(box_qtys, barcodes), start=1):
         box_seq = str(box_num).zfill(2)
         
-        # 生成條碼
-        barcode = BarcodeGenerator.generate(
-            order=order_upper,
-            process=request.current_station_id,
-            sku=sku,
-            container=container_code,
-            box_seq=box_seq,
-            status=request.status,
-            qty=str(box_qty).zfill(4)
-        )
-        
-        if not barcode:
-            raise HTTPException(status_code=500, detail=f"生成第 {box_num} 箱條碼失敗")
-        
-        # 取得 domain 設定，並組合成完整的條碼 URL
-        domain = config_loader.get_value("settings", "Settings", "domain", "")
+        # 組合成完整的條碼 URL
         if domain:
-            domain = domain.rstrip('/')
             new_barcode_with_domain = f"{domain}/b={barcode}"
         else:
             new_barcode_with_domain = barcode
@@ -1241,10 +1027,10 @@ async def scan_first(request: FirstStationRequest, background_tasks: BackgroundT
     # 計算工時
     cycle_time = 0
     
-    # 為每個箱子寫入 Google Sheets
-    all_write_success = True
+    # 所有箱子的記錄一次提交（先寫入本機日誌，再由背景線程批量寫入 Google Sheets）
+    all_logs = []
     for box in boxes:
-        log_data = {
+        all_logs.append({
             "timestamp": datetime.now(),
             "action": "OUT",
             "operator": request.operator_id,
@@ -1258,14 +1044,10 @@ async def scan_first(request: FirstStationRequest, background_tasks: BackgroundT
             "cycle_time": cycle_time,
             "scanned_barcode": "",
             "new_barcode": box["barcode_url"]
-        }
-        
-        write_success = sheet_service.write_log(log_data)
-        if not write_success:
-            all_write_success = False
-            break
+        })
     
-    if not all_write_success:
+    success_count, failed_indices = await sheet_io.run_write(log_storage.submit_logs, all_logs)
+    if success_count < len(all_logs):
         # 寫入失敗，返回錯誤，讓前端顯示錯誤訊息並允許重試
         raise HTTPException(
             status_code=500, 
@@ -1289,6 +1071,128 @@ async def scan_first(request: FirstStationRequest, background_tasks: BackgroundT
     }
 
 
+
+@app.get("/api/analytics/yield")
+async def get_yield_analytics(group_by: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+    """
+    良率與產能分析 API
+    
+    依工單、站點、SKU、操作員分組統計投入/產出/良品/不良品數量、良率與每小時產能
+    
+    Args:
+        group_by: 分組維度（order, station, sku, operator，可用逗號分隔多個；不指定則全部）
+        start: 起始時間（可選，例如 2025-01-01 00:00:00，包含）
+        end: 結束時間（可選，不包含）
+    
+    Returns:
+        {維度: [分組統計]}
+    """
+    if group_by:
+        dimensions = tuple(d.strip().lower() for d in group_by.split(",") if d.strip())
+        invalid = [d for d in dimensions if d not in DIMENSIONS]
+        if invalid or not dimensions:
+            raise HTTPException(status_code=400, detail=f"不支援的分組維度：{', '.join(invalid)}（可用：{', '.join(DIMENSIONS)}）")
+    else:
+        dimensions = DIMENSIONS
+    
+    range_seconds = []
+    for value in (start, end):
+        seconds = to_epoch(value) if value else None
+        if seconds == NO_TIMESTAMP:
+            raise HTTPException(status_code=400, detail=f"時間格式錯誤：{value}")
+        range_seconds.append(seconds)
+    
+    data = await sheet_io.run_local(log_storage.get_yield_analytics, dimensions, range_seconds[0], range_seconds[1])
+    return {
+        "success": True,
+        "data": data
+    }
+
+
+@app.get("/api/health/ready")
+async def get_readiness():
+    """
+    取得服務就緒狀態（部署檢查、負載平衡使用）
+    
+    存儲後端已建立且緩存已載入（本機快照或首次同步）時返回 200，否則返回 503；
+    data 包含緩存來源（snapshot/sheet）、記錄數、上次同步時間等
+    """
+    storage = current_log_storage()
+    if storage is None:
+        status = {"ready": False, "source": None}
+    else:
+        status = storage.readiness()
+    return JSONResponse(
+        status_code=200 if status["ready"] else 503,
+        content={"success": status["ready"], "data": status}
+    )
+
+
+@app.get("/api/admin/sheet-io")
+async def get_sheet_io_status():
+    """
+    取得 Google Sheets 呼叫線程池狀態
+    
+    返回線程池大小、執行中的呼叫數、累計逾時次數
+    """
+    return {
+        "success": True,
+        "data": sheet_io.status()
+    }
+
+
+@app.get("/api/admin/barcode-cache")
+async def get_barcode_cache_status():
+    """
+    取得條碼解析/校驗結果緩存狀態
+    
+    返回容量、目前條碼數、命中/未命中次數與命中率
+    """
+    return {
+        "success": True,
+        "data": barcode_memo.status()
+    }
+
+
+@app.get("/api/admin/quota")
+async def get_quota_status():
+    """
+    取得 Google Sheets API 配額狀態
+    
+    返回讀取/寫入的每分鐘配額、剩餘令牌、剩餘比例（headroom）、等待數、重試與限流次數
+    """
+    return {
+        "success": True,
+        "data": await sheet_io.run_local(log_storage.quota_status)
+    }
+
+
+@app.get("/api/admin/replication")
+async def get_replication_status():
+    """
+    取得本機存儲複寫到 Google Sheets 的狀態
+    
+    返回高水位、落後筆數與時間（lag）、重試狀態等；未啟用複寫時 enabled 為 False
+    """
+    return {
+        "success": True,
+        "data": await sheet_io.run_local(log_storage.replication_status)
+    }
+
+
+@app.get("/api/admin/journal")
+async def get_journal_status():
+    """
+    取得寫入日誌狀態
+    
+    返回尚未寫入 Google Sheets 的記錄數、最舊記錄等待時間、重試狀態等
+    """
+    return {
+        "success": True,
+        "data": await sheet_io.run_local(log_storage.journal_status)
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+條碼處理效能測試腳本
+比較條碼解析（建立字典與 ParsedBarcode）、CRC16 逐位元計算、查表計算與前綴狀態延續計算、逐一驗證與批量驗證，
+以及逐箱與一次生成多箱條碼的耗時
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.barcode import BARCODE_PREFIX_LENGTH, BarcodeGenerator, BarcodeParser, CRC16
+
+
+def bitwise_crc16(data: str) -> str:
+    """逐位元計算 CRC16（查表實作之前的算法，作為比較基準）"""
+    crc = 0xFFFF
+    for byte in data.encode('utf-8'):
+        crc ^= (byte << 8)
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+    return format(crc, 'X').zfill(3)[-3:]
+
+
+def regex_parse(barcode: str):
+    """解析條碼並建立字典（ParsedBarcode 之前的做法，作為比較基準）"""
+    match = BarcodeParser.BARCODE_PATTERN.match(barcode.strip())
+    if not match:
+        return None
+    keys = ('order', 'process', 'sku', 'container', 'box_seq', 'status', 'qty', 'crc')
+    return dict(zip(keys, match.groups()))
+
+
+def report(name: str, func, count: int, repeat: int = 5):
+    """執行 repeat 輪、每輪 count 次，輸出最快一輪的每次平均耗時"""
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print(f"{name:<32} {best * 1e6 / count:8.2f} µs/筆（{count} 筆 {best * 1000:.1f} ms）")
+
+
+def main():
+    count = 10000
+    barcodes = [
+        BarcodeGenerator.generate("251119AA", "P2", "ST352", "A1", f"{i % 100:02d}", "G", f"{i % 10000:04d}")
+        for i in range(count)
+    ]
+    data_parts = [barcode[:-4] for barcode in barcodes]
+
+    print("=" * 60)
+    print(f"條碼解析（{count} 筆 34 碼條碼）")
+    print("=" * 60)
+    report("建立字典", lambda: [regex_parse(barcode) for barcode in barcodes], count)
+    report("ParsedBarcode BarcodeParser.parse", lambda: [BarcodeParser.parse(barcode) for barcode in barcodes], count)
+
+    print("=" * 60)
+    print(f"CRC16 計算（{count} 筆 31 碼資料）")
+    print("=" * 60)
+    report("逐位元計算", lambda: [bitwise_crc16(data) for data in data_parts], count)
+    report("查表計算 CRC16.calculate", lambda: [CRC16.calculate(data) for data in data_parts], count)
+    prefix_state = CRC16.prefix(data_parts[0][:BARCODE_PREFIX_LENGTH])
+    report("前綴狀態延續 CRC16State.extend", lambda: [
+        prefix_state.extend(data[BARCODE_PREFIX_LENGTH:]).checksum() for data in data_parts
+    ], count)
+
+    print("=" * 60)
+    print(f"條碼驗證（{count} 筆 34 碼條碼）")
+    print("=" * 60)
+    report("逐一驗證 CRC16.verify", lambda: [CRC16.verify(barcode) for barcode in barcodes], count)
+    report("批量驗證 CRC16.verify_many", lambda: CRC16.verify_many(barcodes), count)
+
+    boxes = [{"box_seq": f"{i:02d}", "qty": "0100"} for i in range(1, 21)]
+    print("=" * 60)
+    print(f"多箱條碼生成（每批 {len(boxes)} 箱）")
+    print("=" * 60)
+    report("逐箱 generate_from_previous", lambda: [
+        BarcodeGenerator.generate_from_previous(barcodes[0], "P3", "B2", box["box_seq"], "G", box["qty"])
+        for box in boxes
+    ], len(boxes))
+    report("一次 generate_series", lambda: BarcodeGenerator.generate_series(
+        {"order": "251119AA", "process": "P3", "sku": "ST352", "container": "B2", "status": "G"}, boxes
+    ), len(boxes))
+
+
+if __name__ == "__main__":
+    main()
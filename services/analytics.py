@@ -0,0 +1,301 @@
+"""
+記錄分析模組
+以欄式（columnar）結構保存記錄中分析需要的欄位：站點、工單、SKU、操作員以字典編碼為整數，
+動作與狀態為布林值，數量與時間為 int64；良率與產能統計只需對這些陣列走訪一次，
+統計結果依查詢條件緩存，之後只走訪新追加的記錄
+"""
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from services.log_record import LogRecord, normalize_order, normalize_station
+from services.order_trace import STATION_ORDER
+from services.timestamps import epoch_to_datetime, timestamp_epoch
+
+# 時間欄位中表示無法解析的時間戳記
+NO_TIMESTAMP = -1
+
+# 可分組的維度
+DIMENSIONS = ("order", "station", "sku", "operator")
+
+# 數量欄位（int64）可保存的範圍，超出範圍的數量視同無法解析（0）
+QTY_MIN = -(1 << 63)
+QTY_MAX = (1 << 63) - 1
+
+# 最多緩存的統計條件數（維度 + 時間範圍），超過時移除最久未使用的
+MAX_CACHED_SUMMARIES = 32
+
+
+def to_epoch(value) -> int:
+    """
+    將時間戳記轉換為秒數
+
+    Args:
+        value: 時間戳記字串或 datetime
+
+    Returns:
+        秒數，無法解析時返回 NO_TIMESTAMP
+    """
+    epoch = timestamp_epoch(value)
+    return NO_TIMESTAMP if epoch is None else int(epoch)
+
+
+def from_epoch(seconds: int) -> str:
+    """將秒數轉換回時間戳記字串（YYYY-MM-DD HH:MM:SS）"""
+    return epoch_to_datetime(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class _Dictionary:
+    """字典編碼：字串 <-> 連續整數代碼"""
+
+    def __init__(self, values=()):
+        self._codes: Dict[str, int] = {}
+        self.values: List[str] = []
+        for value in values:
+            self.encode(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class _Summary:
+    """一組統計條件（維度 + 時間範圍）的累計值，以分組代碼為索引，已處理到第 rows 列"""
+
+    def __init__(self, dimension_count: int):
+        self.rows = 0
+        self.records: List[List[int]] = [[] for _ in range(dimension_count)]
+        self.in_qty: List[List[int]] = [[] for _ in range(dimension_count)]
+        self.out_qty: List[List[int]] = [[] for _ in range(dimension_count)]
+        self.good_qty: List[List[int]] = [[] for _ in range(dimension_count)]
+        self.first_time: List[List[int]] = [[] for _ in range(dimension_count)]
+        self.last_time: List[List[int]] = [[] for _ in range(dimension_count)]
+
+    def grow(self, d: int, count: int):
+        """第 d 個維度的分組數增加到 count（字典編碼加入新值）"""
+        added = count - len(self.records[d])
+        if added > 0:
+            self.records[d].extend([0] * added)
+            self.in_qty[d].extend([0] * added)
+            self.out_qty[d].extend([0] * added)
+            self.good_qty[d].extend([0] * added)
+            self.first_time[d].extend([NO_TIMESTAMP] * added)
+            self.last_time[d].extend([NO_TIMESTAMP] * added)
+
+
+class LogColumns:
+    """
+    記錄的欄式存儲（只追加）
+
+    每筆記錄在 append() 時轉換一次，之後的統計只讀取型別陣列；
+    本類別不是線程安全的，但只追加，讀取端可先取得 len() 再只處理前 n 筆。
+    summarize() 的累計值依（維度, start, end）緩存，再次查詢時只走訪上次之後追加的列；
+    撤銷列（remove）時清除緩存，下次查詢重新走訪
+    """
+
+    def __init__(self, records=()):
+        self.station = array("l")
+        self.is_out = array("b")
+        self.is_good = array("b")
+        self.qty = array("q")
+        self.timestamp = array("q")
+        self.order = array("l")
+        self.sku = array("l")
+        self.operator = array("l")
+        self.dictionaries = {
+            "station": _Dictionary(STATION_ORDER),
+            "order": _Dictionary(),
+            "sku": _Dictionary(),
+            "operator": _Dictionary()
+        }
+        self.removed = set()  # 已撤銷的列（summarize 略過）
+        self._summaries: "OrderedDict[Tuple, _Summary]" = OrderedDict()
+        self._summary_lock = threading.Lock()
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        # timestamp 是每筆記錄最後寫入的欄位
+        return len(self.timestamp)
+
+    def append(self, record: Dict):
+        """
+        加入一筆記錄（解析時間戳記，只保留 IN/OUT 記錄）
+
+        Args:
+            record: 記錄字典（欄位同 COLUMNS）
+        """
+        self.append_parsed(record, timestamp_epoch(record.get("timestamp", "")))
+
+    def append_parsed(self, record: Dict, epoch: Optional[float]) -> Optional[int]:
+        """
+        加入一筆已解析時間戳記的記錄（只保留 IN/OUT 記錄）
+
+        Args:
+            record: 記錄字典（欄位同 COLUMNS）
+            epoch: 時間戳記的秒數（見 timestamps.timestamp_epoch），None 表示無法解析
+
+        Returns:
+            記錄所在的列（非 IN/OUT 記錄不加入，返回 None）
+        """
+        # 站點、工單、動作使用與索引、追溯、在製條碼相同的標準化鍵（LogRecord 在建立時已計算）
+        if isinstance(record, LogRecord):
+            action, station, order = record.action_key, record.station_key, record.order_key
+        else:
+            action = normalize_station(record.get("action"))
+            station = normalize_station(record.get("process"))
+            order = normalize_order(record.get("order"))
+        if action not in ("IN", "OUT"):
+            return None
+        try:
+            qty = int(record.get("qty", 0) or 0)
+        except (TypeError, ValueError):
+            qty = 0
+        if not QTY_MIN <= qty <= QTY_MAX:
+            qty = 0
+
+        # 先算出所有欄位的值再追加，各欄位的長度不會因為例外而不一致
+        dictionaries = self.dictionaries
+        station_code = dictionaries["station"].encode(station)
+        order_code = dictionaries["order"].encode(order)
+        sku_code = dictionaries["sku"].encode(normalize_station(record.get("sku")))
+        operator_code = dictionaries["operator"].encode(normalize_station(record.get("operator")))
+        is_good = normalize_station(record.get("status")) == "G"
+        timestamp = NO_TIMESTAMP if epoch is None else int(epoch)
+
+        self.station.append(station_code)
+        self.order.append(order_code)
+        self.sku.append(sku_code)
+        self.operator.append(operator_code)
+        self.is_out.append(action == "OUT")
+        self.is_good.append(is_good)
+        self.qty.append(qty)
+        self.timestamp.append(timestamp)
+        return len(self.timestamp) - 1
+
+    def remove(self, row: int):
+        """撤銷一列（欄位陣列只追加，撤銷的列在統計時略過；已緩存的累計值包含此列，因此清除）"""
+        with self._summary_lock:
+            self.removed.add(row)
+            self._summaries.clear()
+
+    def summarize(
+        self,
+        dimensions=DIMENSIONS,
+        start: Optional[int] = None,
+        end: Optional[int] = None
+    ) -> Dict[str, List[Dict]]:
+        """
+        依維度分組統計投入/產出/良品/不良品數量、良率與產能（所有維度在同一次走訪中計算）
+
+        Args:
+            dimensions: 要分組的維度（order, station, sku, operator）
+            start: 只統計時間 >= start 的記錄（秒數，None 表示不限制）
+            end: 只統計時間 < end 的記錄（秒數，None 表示不限制）
+
+        Returns:
+            {維度: [分組統計]}，每個分組包含 key, records, in_qty, out_qty, good_qty, bad_qty,
+            yield_rate（遷出良品 / 遷出總數 × 100%）, first_time, last_time, throughput_per_hour（每小時遷出數量）
+        """
+        # 先取得筆數，之後追加的記錄不影響這次統計
+        n = len(self)
+        dimensions = tuple(dimensions)
+        key = (dimensions, start, end)
+        with self._summary_lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary(len(dimensions))
+                if len(self._summaries) > MAX_CACHED_SUMMARIES:
+                    self._summaries.popitem(last=False)
+            else:
+                self._summaries.move_to_end(key)
+            # 分組數在取得筆數之後讀取，前 n 筆的代碼一定在範圍內
+            group_counts = [len(self.dictionaries[name]) for name in dimensions]
+            for d, count in enumerate(group_counts):
+                summary.grow(d, count)
+            if n > summary.rows:
+                self._accumulate(summary, dimensions, summary.rows, n, start, end)
+                summary.rows = n
+            return self._summary_result(summary, dimensions)
+
+    def _summary_result(self, summary: _Summary, dimensions: Tuple[str, ...]) -> Dict[str, List[Dict]]:
+        """由累計值產生各維度的分組統計（呼叫端需持有 _summary_lock）"""
+        records, in_qty, out_qty = summary.records, summary.in_qty, summary.out_qty
+        good_qty, first_time, last_time = summary.good_qty, summary.first_time, summary.last_time
+        result = {}
+        for d, name in enumerate(dimensions):
+            values = self.dictionaries[name].values
+            groups = []
+            for code in range(len(records[d])):
+                if not records[d][code]:
+                    continue
+                out_total = out_qty[d][code]
+                hours = (last_time[d][code] - first_time[d][code]) / 3600 if first_time[d][code] != NO_TIMESTAMP else 0
+                groups.append({
+                    "key": values[code],
+                    "records": records[d][code],
+                    "in_qty": in_qty[d][code],
+                    "out_qty": out_total,
+                    "good_qty": good_qty[d][code],
+                    "bad_qty": out_total - good_qty[d][code],
+                    "yield_rate": round(good_qty[d][code] / out_total * 100, 2) if out_total > 0 else None,
+                    "first_time": from_epoch(first_time[d][code]) if first_time[d][code] != NO_TIMESTAMP else None,
+                    "last_time": from_epoch(last_time[d][code]) if last_time[d][code] != NO_TIMESTAMP else None,
+                    "throughput_per_hour": round(out_total / hours, 2) if hours > 0 else None
+                })
+            if name == "station":
+                groups.sort(key=lambda g: (STATION_ORDER.get(g["key"], 999), g["key"]))
+            else:
+                groups.sort(key=lambda g: g["key"])
+            result[name] = groups
+        return result
+
+    def _accumulate(
+        self,
+        summary: _Summary,
+        dimensions: Tuple[str, ...],
+        begin: int,
+        n: int,
+        start: Optional[int],
+        end: Optional[int]
+    ):
+        """將第 begin 到 n 列（不含）計入累計值（呼叫端需持有 _summary_lock）"""
+        group_columns = [getattr(self, name) for name in dimensions]
+        records, in_qty, out_qty = summary.records, summary.in_qty, summary.out_qty
+        good_qty, first_time, last_time = summary.good_qty, summary.first_time, summary.last_time
+        dimension_range = range(len(dimensions))
+
+        # 陣列切片是連續記憶體複製；islice 需從頭略過前 begin 筆
+        rows = zip(
+            self.is_out[begin:n], self.is_good[begin:n], self.qty[begin:n], self.timestamp[begin:n],
+            zip(*(column[begin:n] for column in group_columns))
+        )
+        removed = self.removed
+        for row, (is_out, is_good, qty, timestamp, codes) in enumerate(rows, begin):
+            if removed and row in removed:
+                continue
+            if start is not None and (timestamp == NO_TIMESTAMP or timestamp < start):
+                continue
+            if end is not None and (timestamp == NO_TIMESTAMP or timestamp >= end):
+                continue
+            for d in dimension_range:
+                code = codes[d]
+                records[d][code] += 1
+                if is_out:
+                    out_qty[d][code] += qty
+                    if is_good:
+                        good_qty[d][code] += qty
+                else:
+                    in_qty[d][code] += qty
+                if timestamp != NO_TIMESTAMP:
+                    if first_time[d][code] == NO_TIMESTAMP or timestamp < first_time[d][code]:
+                        first_time[d][code] = timestamp
+                    if timestamp > last_time[d][code]:
+                        last_time[d][code] = timestamp
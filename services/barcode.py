@@ -3,8 +3,62 @@
 負責 34 碼條碼的解析、CRC16 校驗以及新條碼生成
 """
 import re
-from typing import Optional, Dict, Tuple
-from datetime import datetime
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Iterable, List, Mapping, Optional, Dict, Tuple, Union
+
+from services.config_loader import config_loader
+
+# 34 碼條碼的欄位（依條碼中的順序）與長度
+BARCODE_FIELDS = ('order', 'process', 'sku', 'container', 'box_seq', 'status', 'qty', 'crc')
+BARCODE_LENGTH = 34
+# 同一批箱子共用的前綴長度（工單-製程-SKU-容器-）
+BARCODE_PREFIX_LENGTH = 21
+
+# 條碼解析/校驗結果緩存的預設容量（可在 settings.ini 的 [BarcodeCache] 區段設定）
+DEFAULT_BARCODE_CACHE_SIZE = 4096
+
+_FIELD_INDEX = {name: i for i, name in enumerate(BARCODE_FIELDS)}
+
+
+class ParsedBarcode(namedtuple('ParsedBarcode', BARCODE_FIELDS)):
+    """
+    解析後的 34 碼條碼（唯讀 namedtuple）
+    
+    可用屬性（parsed.order）讀取，也保留字典的讀取方式：parsed['order']、parsed.get('sku', '')、
+    'qty' in parsed、keys()/items()、dict(parsed)，既有以字典使用解析結果的程式不需修改。
+    與 namedtuple 相同，直接走訪時返回欄位值；整數索引仍可使用
+    """
+    
+    __slots__ = ()
+    
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                key = _FIELD_INDEX[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+    
+    def get(self, key: str, default=None):
+        index = _FIELD_INDEX.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+    
+    def __contains__(self, key) -> bool:
+        return key in _FIELD_INDEX
+    
+    def keys(self):
+        return BARCODE_FIELDS
+    
+    def items(self):
+        return zip(BARCODE_FIELDS, self)
+    
+    def to_dict(self) -> Dict[str, str]:
+        """轉換為一般字典"""
+        return dict(zip(BARCODE_FIELDS, self))
+
+
+_new_parsed_barcode = tuple.__new__
 
 
 class BarcodeParser:
@@ -16,15 +70,18 @@ class BarcodeParser:
     )
     
     @staticmethod
-    def parse(barcode: str) -> Optional[Dict[str, str]]:
+    def parse(barcode: str) -> Optional[ParsedBarcode]:
         """
         解析 34 碼條碼
         
+        長度不是 34 碼時直接返回，不執行正規表示式；各欄位位置固定，由預先編譯的正規表示式
+        一次檢查分隔符號與字元並取出欄位，結果直接建立為 ParsedBarcode，不另外建立字典
+        
         Args:
             barcode: 34 碼條碼字串
         
         Returns:
-            解析後的字典，包含：
+            ParsedBarcode（可當作字典讀取），包含：
             - order: 工單號 (8碼)
             - process: 製程代號 (2碼)
             - sku: SKU (5碼，前2碼為系列，後3碼為機型)
@@ -35,20 +92,13 @@ class BarcodeParser:
             - crc: 校驗碼 (3碼)
             若解析失敗則返回 None
         """
-        match = BarcodeParser.BARCODE_PATTERN.match(barcode.strip())
+        barcode = barcode.strip()
+        if len(barcode) != BARCODE_LENGTH:
+            return None
+        match = BarcodeParser.BARCODE_PATTERN.match(barcode)
         if not match:
             return None
-        
-        return {
-            'order': match.group(1),
-            'process': match.group(2),
-            'sku': match.group(3),
-            'container': match.group(4),
-            'box_seq': match.group(5),
-            'status': match.group(6),
-            'qty': match.group(7),
-            'crc': match.group(8)
-        }
+        return _new_parsed_barcode(ParsedBarcode, match.groups())
     
     @staticmethod
     def parse_partial(barcode: str) -> Optional[Dict[str, str]]:
@@ -137,8 +187,89 @@ class BarcodeParser:
         return sku[2:5] if len(sku) >= 5 else ""
 
 
+def _build_crc16_table(polynomial: int) -> Tuple[int, ...]:
+    """建立 CRC16 查表：每個高位元組移出 8 位後對 CRC 的影響"""
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ polynomial
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+class CRC16State(namedtuple('CRC16State', ['value'], defaults=[0xFFFF])):
+    """
+    可延續的 CRC16 計算狀態（唯讀 namedtuple）
+    
+    同一工單、製程、SKU、容器的條碼前 21 碼相同，前綴的狀態計算一次後，
+    每個條碼只需從該狀態延續計算箱號、貨態、數量。extend 返回新的狀態，原狀態可重複使用；
+    狀態不可修改，可安全地在線程間共用或作為緩存的值。
+    value 為目前的 16 位元 CRC 值（預設為初始值 0xFFFF）
+    """
+    
+    __slots__ = ()
+    
+    def extend(self, data: str) -> "CRC16State":
+        """
+        延續計算一段資料
+        
+        Args:
+            data: 接在目前資料之後的字串
+        
+        Returns:
+            新的狀態（等同從頭計算目前資料加上 data）
+        """
+        table = CRC16.TABLE
+        crc = self.value
+        for byte in data.encode('utf-8'):
+            crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+        return CRC16State(crc)
+    
+    def checksum(self) -> str:
+        """目前資料的 3 碼十六進位校驗碼（同 CRC16.calculate）"""
+        return format(self.value, '03X')[-3:]
+    
+    def __repr__(self) -> str:
+        return f"CRC16State(0x{self.value:04X})"
+
+
 class CRC16:
-    """CRC16 校驗計算"""
+    """
+    CRC16 校驗計算（CRC-16/CCITT-FALSE：多項式 0x1021，初始值 0xFFFF）
+    
+    以 256 項查表逐位元組計算，每個位元組只需一次查表，不必逐位元運算 8 次。
+    共用前綴的條碼以 prefix 取得前綴狀態後延續計算（CRC16State），前綴只計算一次
+    """
+    
+    POLYNOMIAL = 0x1021
+    TABLE = _build_crc16_table(POLYNOMIAL)
+    
+    @staticmethod
+    def prefix(data: str = "") -> CRC16State:
+        """
+        計算一段前綴的 CRC16 狀態
+        
+        Args:
+            data: 前綴字串（例如同一批箱子共用的「工單-製程-SKU-容器-」）
+        
+        Returns:
+            CRC16State，之後以 extend(後綴).checksum() 取得完整資料的校驗碼
+        """
+        return CRC16State().extend(data)
+    
+    @staticmethod
+    def _checksum_shared(data_part: str, states: Dict[str, CRC16State]) -> str:
+        """計算條碼資料部分的校驗碼，同一前綴的狀態保存在 states 中共用"""
+        prefix = data_part[:BARCODE_PREFIX_LENGTH]
+        state = states.get(prefix)
+        if state is None:
+            state = states[prefix] = CRC16.prefix(prefix)
+        return state.extend(data_part[BARCODE_PREFIX_LENGTH:]).checksum()
     
     @staticmethod
     def calculate(data: str) -> str:
@@ -151,23 +282,13 @@ class CRC16:
         Returns:
             3碼十六進位校驗碼（大寫）
         """
-        # 簡化的 CRC16 計算（使用標準多項式 0x1021）
+        table = CRC16.TABLE
         crc = 0xFFFF
-        polynomial = 0x1021
-        
         for byte in data.encode('utf-8'):
-            crc ^= (byte << 8)
-            for _ in range(8):
-                if crc & 0x8000:
-                    crc = (crc << 1) ^ polynomial
-                else:
-                    crc <<= 1
-                crc &= 0xFFFF
-        
-        # 轉換為 3 碼十六進位字串（大寫）
-        crc_hex = format(crc, 'X')
-        # 確保是 3 碼，不足補 0
-        return crc_hex.zfill(3)[-3:]
+            crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+        
+        # 轉換為 3 碼十六進位字串（大寫），不足補 0
+        return format(crc, '03X')[-3:]
     
     @staticmethod
     def verify(barcode: str) -> bool:
@@ -186,14 +307,53 @@ class CRC16:
         
         # 取得不含校驗碼的部分（前31碼）
         data_part = barcode[:-4]  # 移除最後的 "-" 和 3碼校驗碼
-        calculated_crc = CRC16.calculate(data_part)
+        return CRC16.calculate(data_part) == parsed.crc
+    
+    @staticmethod
+    def verify_many(barcodes) -> Dict[str, bool]:
+        """
+        批量驗證條碼的 CRC16 校驗碼（結果與逐一呼叫 verify 相同）
         
-        return calculated_crc == parsed['crc']
+        同一工單、製程、SKU、容器的條碼共用前綴的 CRC16 狀態，每個條碼只延續計算後綴
+        
+        Args:
+            barcodes: 條碼列表
+        
+        Returns:
+            {條碼: 驗證是否通過}
+        """
+        parse = BarcodeParser.parse
+        checksum = CRC16._checksum_shared
+        states: Dict[str, CRC16State] = {}
+        result = {}
+        for barcode in barcodes:
+            if barcode in result:
+                continue
+            parsed = parse(barcode)
+            result[barcode] = parsed is not None and checksum(barcode[:-4], states) == parsed.crc
+        return result
 
 
 class BarcodeGenerator:
     """條碼生成器"""
     
+    @staticmethod
+    def _format_prefix(order: str, process: str, sku: str, container: str) -> str:
+        """格式化同一批箱子共用的欄位（工單-製程-SKU-容器-），各欄位補足或截斷為固定長度"""
+        order = order.upper().ljust(8, '0')[:8]
+        process = process.upper().ljust(2, '0')[:2]
+        sku = sku.upper().ljust(5, '0')[:5]
+        container = container.upper().ljust(2, '0')[:2]
+        return f"{order}-{process}-{sku}-{container}-"
+    
+    @staticmethod
+    def _format_suffix(box_seq: str, status: str, qty: str) -> str:
+        """格式化每箱不同的欄位（箱號-貨態-數量）"""
+        box_seq = box_seq.zfill(2)[:2]
+        status = status.upper()[:1]
+        qty = qty.zfill(4)[:4]
+        return f"{box_seq}-{status}-{qty}"
+    
     @staticmethod
     def generate(
         order: str,
@@ -219,17 +379,9 @@ class BarcodeGenerator:
         Returns:
             完整的 34 碼條碼字串
         """
-        # 格式化各欄位
-        order = order.upper().ljust(8, '0')[:8]
-        process = process.upper().ljust(2, '0')[:2]
-        sku = sku.upper().ljust(5, '0')[:5]
-        container = container.upper().ljust(2, '0')[:2]
-        box_seq = box_seq.zfill(2)[:2]
-        status = status.upper()[:1]
-        qty = qty.zfill(4)[:4]
-        
-        # 組合不含校驗碼的部分
-        data_part = f"{order}-{process}-{sku}-{container}-{box_seq}-{status}-{qty}"
+        # 格式化各欄位，組合不含校驗碼的部分
+        data_part = (BarcodeGenerator._format_prefix(order, process, sku, container) +
+                     BarcodeGenerator._format_suffix(box_seq, status, qty))
         
         # 計算 CRC16 校驗碼
         crc = CRC16.calculate(data_part)
@@ -262,7 +414,7 @@ class BarcodeGenerator:
         Returns:
             新條碼字串，若解析失敗則返回 None
         """
-        parsed = BarcodeParser.parse(previous_barcode)
+        parsed = barcode_memo.parse(previous_barcode)
         if not parsed:
             return None
         
@@ -276,3 +428,172 @@ class BarcodeGenerator:
             qty=new_qty or parsed['qty']
         )
 
+    
+    @staticmethod
+    def generate_series(
+        template: Union[str, Mapping[str, str]],
+        boxes: Iterable[Mapping[str, str]]
+    ) -> Optional[List[str]]:
+        """
+        一次生成同一批箱子的條碼（多箱遷出使用）
+        
+        工單、製程、SKU、容器在同一批箱子中相同，只解析、格式化與計算 CRC16 狀態一次；
+        每箱只格式化箱號、貨態、數量並從前綴狀態延續計算校驗碼。結果與逐箱呼叫 generate 相同
+        
+        Args:
+            template: 共用欄位：字典（order, process, sku, container，可含 status、qty 作為每箱的預設值），
+                      或舊條碼字串（解析一次，所有欄位沿用舊條碼）
+            boxes: 每箱的欄位：[{"box_seq": 箱號, "qty": 數量, "status": 貨態（可省略）}]
+        
+        Returns:
+            條碼列表（順序同 boxes），template 為無法解析的條碼時返回 None
+        """
+        if isinstance(template, str):
+            template = barcode_memo.parse(template)
+            if not template:
+                return None
+        
+        prefix = BarcodeGenerator._format_prefix(
+            template['order'], template['process'], template['sku'], template['container']
+        )
+        default_status = template.get('status', '')
+        default_qty = template.get('qty', '')
+        format_suffix = BarcodeGenerator._format_suffix
+        prefix_state = CRC16.prefix(prefix)
+        
+        barcodes = []
+        for box in boxes:
+            suffix = format_suffix(box['box_seq'], box.get('status') or default_status, box.get('qty') or default_qty)
+            barcodes.append(f"{prefix}{suffix}-{prefix_state.extend(suffix).checksum()}")
+        return barcodes
+
+
+class BarcodeMemo:
+    """
+    條碼解析與 CRC16 校驗結果緩存（有容量上限的 LRU，線程安全）
+    
+    同一個條碼在一次請求中會被解析、驗證多次，現場也會反覆掃描相同的標籤；
+    結果只與條碼字串有關，第一次查詢時同時解析與驗證，之後所有端點共用
+    """
+    
+    def __init__(self, max_size: int = DEFAULT_BARCODE_CACHE_SIZE):
+        """
+        Args:
+            max_size: 最多保留的條碼數（超過時移除最久未使用的）
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Optional[ParsedBarcode], bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    @classmethod
+    def from_config(cls) -> "BarcodeMemo":
+        """從 settings.ini 的 [BarcodeCache] 區段讀取設定"""
+        max_size = config_loader.get_value("settings", "BarcodeCache", "max_size", str(DEFAULT_BARCODE_CACHE_SIZE))
+        return cls(max_size=int(max_size))
+    
+    def lookup(self, barcode: str) -> Tuple[Optional[ParsedBarcode], bool]:
+        """
+        取得條碼的解析與校驗結果
+        
+        Args:
+            barcode: 條碼字串
+        
+        Returns:
+            (ParsedBarcode 或 None, CRC16 校驗是否通過)，結果與 BarcodeParser.parse、CRC16.verify 相同
+        """
+        with self._lock:
+            entry = self._entries.get(barcode)
+            if entry is not None:
+                self._entries.move_to_end(barcode)
+                self._hits += 1
+                return entry
+            self._misses += 1
+        
+        # 在鎖外計算，避免阻塞其他線程的查詢
+        parsed = BarcodeParser.parse(barcode)
+        entry = (parsed, parsed is not None and CRC16.calculate(barcode[:-4]) == parsed.crc)
+        self._store({barcode: entry})
+        return entry
+    
+    def _store(self, entries: Dict[str, Tuple[Optional[ParsedBarcode], bool]]):
+        """寫入計算結果，超過容量時移除最久未使用的條碼"""
+        with self._lock:
+            for barcode, entry in entries.items():
+                self._entries[barcode] = entry
+                self._entries.move_to_end(barcode)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def parse(self, barcode: str) -> Optional[ParsedBarcode]:
+        """解析 34 碼條碼（同 BarcodeParser.parse）"""
+        return self.lookup(barcode)[0]
+    
+    def verify(self, barcode: str) -> bool:
+        """驗證條碼的 CRC16 校驗碼（同 CRC16.verify）"""
+        return self.lookup(barcode)[1]
+    
+    def verify_many(self, barcodes) -> Dict[str, bool]:
+        """
+        批量驗證條碼的 CRC16 校驗碼（同 CRC16.verify_many）
+        
+        未緩存的條碼依前綴共用 CRC16 狀態計算（同 CRC16.verify_many），再一次寫入緩存
+        """
+        result = {}
+        missing = []
+        with self._lock:
+            entries = self._entries
+            for barcode in barcodes:
+                if barcode in result:
+                    continue
+                entry = entries.get(barcode)
+                if entry is None:
+                    result[barcode] = None
+                    missing.append(barcode)
+                    continue
+                entries.move_to_end(barcode)
+                self._hits += 1
+                result[barcode] = entry[1]
+            self._misses += len(missing)
+        
+        if missing:
+            parse = BarcodeParser.parse
+            checksum = CRC16._checksum_shared
+            states: Dict[str, CRC16State] = {}
+            computed = {}
+            for barcode in missing:
+                parsed = parse(barcode)
+                valid = parsed is not None and checksum(barcode[:-4], states) == parsed.crc
+                computed[barcode] = (parsed, valid)
+                result[barcode] = valid
+            self._store(computed)
+        return result
+    
+    def status(self) -> Dict:
+        """
+        取得緩存狀態
+        
+        Returns:
+            狀態字典：容量、目前條碼數、命中/未命中次數、命中率
+        """
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "max_size": self.max_size,
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else None
+            }
+    
+    def clear(self):
+        """清除緩存與計數"""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+
+# 建立全域實例（所有端點共用）
+barcode_memo = BarcodeMemo.from_config()
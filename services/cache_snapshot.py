@@ -0,0 +1,126 @@
+"""
+緩存快照模組
+將已同步的工作表記錄與同步水位（已同步的工作表列數）存到本機檔案；程序重啟時先載入快照，
+再從水位之後增量同步，不必重新下載整個工作表
+"""
+import marshal
+import math
+import mmap
+import os
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from services.log_record import LogRecord
+from services.sheet_schema import COLUMNS
+
+# 檔案開頭的識別碼
+MAGIC = b"LOGSNAP1"
+
+# 快照格式版本（內容格式改變時遞增，舊版快照直接忽略）
+SNAPSHOT_VERSION = 1
+
+
+class CacheSnapshot:
+    """
+    緩存快照檔
+
+    檔案格式為 MAGIC 加上 marshal 編碼的字典：
+    - version, sheet_id, columns（COLUMNS）, headers（工作表標題列）, saved_at
+    - row_count：已同步的工作表列數（含標題列），重啟後從這一列開始增量同步
+    - row_hashes：各列內容的雜湊值（int64 陣列的位元組），增量同步以此偵測修改
+    - epochs：各記錄的時間戳記秒數（float64 陣列的位元組，NaN 表示無法解析），載入時不必重新解析
+    - values：依 COLUMNS 順序的欄位值列表（每個欄位一個列表）
+
+    讀取時以 mmap 映射檔案後直接解碼，不另外複製整個檔案；寫入先寫暫存檔再替換，
+    程序在寫入途中結束也不會留下不完整的快照
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 快照檔路徑
+        """
+        self.path = path
+
+    def save(self, sheet_id: str, headers: List[str], row_count: int,
+             row_hashes: List[int], records: List[LogRecord]):
+        """
+        寫入快照
+
+        Args:
+            sheet_id: Google Sheet ID（載入時比對，避免載入其他工作表的快照）
+            headers: 工作表標題列
+            row_count: 已同步的工作表列數（含標題列）
+            row_hashes: 各列內容的雜湊值（長度同 row_count）
+            records: 已同步的記錄（只包含工作表中的記錄，不含本程序尚未同步確認的寫入）
+        """
+        nan = math.nan
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "sheet_id": sheet_id,
+            "columns": list(COLUMNS),
+            "headers": list(headers),
+            "saved_at": time.time(),
+            "row_count": row_count,
+            "row_hashes": array("q", row_hashes).tobytes(),
+            "epochs": array("d", (nan if record.epoch is None else record.epoch for record in records)).tobytes(),
+            "values": [[record[column] for record in records] for column in COLUMNS]
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            marshal.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self, sheet_id: str) -> Optional[Dict]:
+        """
+        載入快照
+
+        Args:
+            sheet_id: 目前使用的 Google Sheet ID
+
+        Returns:
+            {"headers", "row_count", "row_hashes", "records", "saved_at"}；
+            檔案不存在、格式不符、版本或工作表不同時返回 None
+        """
+        try:
+            with open(self.path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if mapped[:len(MAGIC)] != MAGIC:
+                        return None
+                    with memoryview(mapped) as view:
+                        data = marshal.loads(view[len(MAGIC):])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError, TypeError) as e:
+            print(f"[緩存快照] 讀取快照失敗，忽略快照：{e}")
+            return None
+
+        if (not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION or
+                data.get("sheet_id") != sheet_id or data.get("columns") != list(COLUMNS)):
+            return None
+
+        row_hashes = array("q")
+        row_hashes.frombytes(data["row_hashes"])
+        epochs = array("d")
+        epochs.frombytes(data["epochs"])
+        if len(row_hashes) != data["row_count"]:
+            return None
+
+        records = [
+            LogRecord(*values, epoch=None if math.isnan(epoch) else epoch)
+            for values, epoch in zip(zip(*data["values"]), epochs)
+        ]
+        return {
+            "headers": data["headers"],
+            "row_count": data["row_count"],
+            "row_hashes": row_hashes.tolist(),
+            "records": records,
+            "saved_at": data["saved_at"]
+        }
@@ -0,0 +1,158 @@
+"""
+緩存記錄模組
+緩存中的每筆記錄以 __slots__ 物件保存（不使用 13 個鍵的字典），重複出現的代碼
+（動作、站點、狀態、容器、SKU 等）使用 sys.intern 共用同一個字串物件；
+條碼、工單、站點、動作的標準化鍵（比對與索引使用）在建立記錄時計算一次。
+LogRecord 實作 Mapping 介面，既有以 record["order"]、record.get("order") 讀取的程式不需修改
+"""
+import sys
+from collections.abc import Mapping
+from typing import Optional
+
+from services.sheet_schema import COLUMNS
+from services.timestamps import timestamp_epoch
+
+
+def normalize_barcode(value) -> str:
+    """
+    標準化條碼（移除 domain 前綴，去除空白，轉大寫）
+
+    Args:
+        value: 條碼字串（可能包含 http://domain/b= 前綴）
+
+    Returns:
+        標準化後的條碼，空值返回空字串
+    """
+    if value is None:
+        return ""
+    value = str(value)
+    if "/b=" in value:
+        value = value.split("/b=")[-1]
+    return value.strip().upper()
+
+
+def normalize_order(value) -> str:
+    """
+    標準化工單號（轉大寫，去除前導零）
+
+    Args:
+        value: 工單號
+
+    Returns:
+        標準化後的工單號，空值返回空字串
+    """
+    if value is None:
+        return ""
+    value = str(value).strip().upper()
+    if not value:
+        return ""
+    return value.lstrip('0') or '0'
+
+
+def normalize_station(value) -> str:
+    """
+    標準化站點或動作代號（去除空白，轉大寫）
+
+    Args:
+        value: 站點代號（例如：p2）或動作（例如：in）
+
+    Returns:
+        標準化後的代號
+    """
+    if value is None:
+        return ""
+    return str(value).strip().upper()
+
+
+# 值的種類很少、在各記錄間大量重複的欄位（共用字串物件）
+INTERNED_FIELDS = frozenset({"action", "operator", "order", "process", "sku", "container",
+                             "box_seq", "qty", "status", "cycle_time"})
+
+_COLUMN_SET = frozenset(COLUMNS)
+_FIELDS = tuple(COLUMNS)
+_INTERN_FLAGS = tuple(column in INTERNED_FIELDS for column in COLUMNS)
+
+
+def _to_str(value) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+
+def _canonical(value: str, key: str) -> str:
+    """標準化結果與原值相同時沿用原字串物件（不另外保存一份）"""
+    return value if key == value else key
+
+
+class LogRecord(Mapping):
+    """
+    緩存記錄（唯讀）
+
+    欄位同 COLUMNS，值為字串。以下屬性在建立時計算一次，不屬於 Mapping 的鍵
+    （dict(record)、JSON 輸出與比對都只包含 COLUMNS）：
+    - epoch：時間戳記秒數（見 timestamps.timestamp_epoch）
+    - scanned_key、new_key：標準化條碼（normalize_barcode）
+    - order_key：標準化工單號（normalize_order，interned）
+    - station_key、action_key：標準化站點與動作（normalize_station，interned）
+    """
+
+    __slots__ = _FIELDS + ("epoch", "scanned_key", "new_key", "order_key", "station_key", "action_key")
+
+    def __init__(self, *values: str, epoch: Optional[float] = None):
+        """
+        Args:
+            values: 依 COLUMNS 順序的欄位值（字串）
+            epoch: 時間戳記秒數（None 表示由 timestamp 欄位解析）
+        """
+        setattr_ = object.__setattr__
+        intern = sys.intern
+        for name, value, interned in zip(_FIELDS, values, _INTERN_FLAGS):
+            value = _to_str(value)
+            setattr_(self, name, intern(value) if interned else value)
+        setattr_(self, "epoch", timestamp_epoch(values[0]) if epoch is None else epoch)
+        scanned, new = self.scanned_barcode, self.new_barcode
+        setattr_(self, "scanned_key", _canonical(scanned, normalize_barcode(scanned)))
+        setattr_(self, "new_key", _canonical(new, normalize_barcode(new)))
+        setattr_(self, "order_key", intern(normalize_order(self.order)))
+        setattr_(self, "station_key", intern(normalize_station(self.process)))
+        setattr_(self, "action_key", intern(normalize_station(self.action)))
+
+    @classmethod
+    def from_mapping(cls, record) -> "LogRecord":
+        """由記錄字典建立（缺少的欄位為空字串，COLUMNS 以外的鍵忽略）"""
+        if isinstance(record, LogRecord):
+            return record
+        get = record.get
+        return cls(*(get(column, "") for column in _FIELDS))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LogRecord 為唯讀物件")
+
+    def __getitem__(self, key: str) -> str:
+        if key in _COLUMN_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        if key in _COLUMN_SET:
+            return getattr(self, key)
+        return default
+
+    def __contains__(self, key) -> bool:
+        return key in _COLUMN_SET
+
+    def __iter__(self):
+        return iter(_FIELDS)
+
+    def __len__(self) -> int:
+        return len(_FIELDS)
+
+    def __reduce__(self):
+        return (LogRecord, tuple(getattr(self, name) for name in _FIELDS))
+
+    def __repr__(self) -> str:
+        return f"LogRecord({dict(self)!r})"
+
+    def to_dict(self) -> dict:
+        """轉換為一般字典（欄位同 COLUMNS）"""
+        return {name: getattr(self, name) for name in _FIELDS}
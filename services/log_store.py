@@ -0,0 +1,390 @@
+"""
+記錄存儲模組
+在記憶體中保存 Logs 工作表的所有記錄，並維護雜湊索引，讓條碼、工單、站點查詢不必逐筆掃描
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services.analytics import LogColumns
+from services.log_record import LogRecord, normalize_barcode, normalize_order, normalize_station
+from services.order_trace import OrderTraceCache
+
+# 在製條碼排序鍵中無法解析的時間戳記（排在最前面）
+NO_EPOCH = float("-inf")
+
+
+class StationWip:
+    """
+    單一站點的在製條碼（已遷入、尚未遷出），依遷入時間排序
+
+    每個條碼以第一筆遷入記錄為準；條碼在該站點出現遷出記錄後即移除，之後的遷入記錄不再列入。
+    移除採延遲刪除，失效項目過多時才重建排序列表，因此讀取第 offset 起的 k 筆約為 O(offset + k)。
+    排序列表只在尾端追加；需要插入中間或重建時建立新列表再替換，讀取端不加鎖也不會讀到重複項目
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[tuple, Dict]] = {}  # 條碼 -> (排序鍵, 遷入記錄)
+        self._order: List[tuple] = []  # 排序鍵 (時間戳記秒數, 記錄位置, 條碼)，可能包含已移除的項目
+        self._inbound_seen: Set[str] = set()
+        self._outbound: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(barcode: str, record: LogRecord, pos: int) -> tuple:
+        """
+        排序鍵：依解析後的時間戳記秒數排序（不同格式的時間戳記字串依字串排序會錯亂），
+        時間相同時依記錄位置；無法解析的時間戳記排在最前面（與 SQLite 的 NULL 排序一致）
+        """
+        return (NO_EPOCH if record.epoch is None else record.epoch, pos, barcode)
+
+    def add_inbound(self, barcode: str, record: LogRecord, pos: int):
+        """加入遷入記錄（同一條碼只保留第一筆，已遷出的條碼忽略）"""
+        if barcode in self._inbound_seen:
+            return
+        self._inbound_seen.add(barcode)
+        if barcode in self._outbound:
+            return
+        key = self._key(barcode, record, pos)
+        self._entries[barcode] = (key, record)
+        # 記錄大多依時間順序寫入，通常直接追加到尾端
+        if not self._order or key >= self._order[-1]:
+            self._order.append(key)
+        else:
+            order = list(self._order)
+            insort(order, key)
+            self._order = order
+
+    def reset(self, barcode: str, inbound: Optional[Tuple[LogRecord, int]], has_outbound: bool):
+        """
+        依條碼目前的記錄重新設定狀態（記錄被撤銷時使用）
+
+        Args:
+            barcode: 標準化條碼
+            inbound: 第一筆遷入記錄與其位置（沒有遷入記錄時為 None）
+            has_outbound: 是否有遷出記錄
+        """
+        if inbound is None:
+            self._inbound_seen.discard(barcode)
+        else:
+            self._inbound_seen.add(barcode)
+        if has_outbound:
+            self._outbound.add(barcode)
+        else:
+            self._outbound.discard(barcode)
+        self._entries.pop(barcode, None)
+        if inbound is not None and not has_outbound:
+            record, pos = inbound
+            key = self._key(barcode, record, pos)
+            index = bisect_left(self._order, key)
+            if index == len(self._order) or self._order[index] != key:
+                order = list(self._order)
+                order.insert(index, key)
+                self._order = order
+            self._entries[barcode] = (key, record)
+
+    def add_outbound(self, barcode: str):
+        """加入遷出記錄（條碼從在製列表移除）"""
+        self._outbound.add(barcode)
+        if self._entries.pop(barcode, None) is not None:
+            stale = len(self._order) - len(self._entries)
+            if stale > 64 and stale > len(self._entries):
+                self._order = [key for key in self._order if key[2] in self._entries]
+
+    def items(self, offset: int = 0, limit: Optional[int] = None, visible: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """
+        依遷入時間（由早到晚）取得在製條碼
+
+        Args:
+            offset: 略過的筆數
+            limit: 最多返回筆數（None 表示不限制）
+            visible: 只列出記錄位置小於此值的遷入記錄（None 表示不限制）
+
+        Returns:
+            [(條碼, 遷入記錄)] 列表
+        """
+        result = []
+        skipped = 0
+        for key in self._order:
+            entry = self._entries.get(key[2])
+            if entry is None or entry[0] != key:
+                continue
+            if visible is not None and key[1] >= visible:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            if limit is not None and len(result) >= limit:
+                break
+            result.append((key[2], entry[1]))
+        return result
+
+
+class LogStore:
+    """
+    記錄存儲（附雜湊索引）
+
+    記錄在 append 時轉換為 LogRecord（__slots__ 物件，時間戳記解析一次存於 epoch），
+    追溯彙總與欄式存儲都使用解析好的秒數。
+
+    索引內容為記錄在 _records 中的位置，依寫入順序排列：
+    - 條碼索引：scanned_barcode 與 new_barcode 的標準化條碼
+    - (條碼, 站點, 動作) 索引：只使用 scanned_barcode（遷入/遷出時掃描的條碼）
+    - 工單索引：標準化工單號
+    - 站點索引：(站點, 動作)
+    - 站點在製條碼：每個站點已遷入、尚未遷出的條碼（StationWip）
+    - 工單追溯彙總：查詢過的工單的站點時間軸與數量統計（OrderTraceCache）
+    - 欄式存儲：良率與產能分析使用的型別陣列（LogColumns）
+
+    撤銷（remove）不移動任何記錄：位置加入 _removed，查詢略過這些位置；站點在製條碼依該條碼其餘的記錄重設，
+    工單追溯彙總移除後於下次查詢時重建，欄式存儲標記該列。成本只與該記錄相關，不重建整個存儲。
+
+    線程安全：寫入（append/extend/remove）同一時間只能有一個線程，呼叫端需自行加鎖；
+    查詢不需加鎖，可與寫入同時進行。所有結構只追加（或建立新物件後替換），每筆記錄的索引都更新完後
+    才增加 _size，查詢開始時讀取 _size 並忽略位置不小於它的項目，因此看到的是某個時間點的完整前綴
+    （站點在製條碼的遷出移除可能比 _size 早生效）。工單追溯彙總的建立與更新以 _trace_lock 互斥
+    """
+
+    def __init__(self, records: Optional[Iterable[Dict]] = None):
+        self._records: List[LogRecord] = []
+        self._by_barcode: Dict[str, List[int]] = {}
+        self._by_barcode_station_action: Dict[Tuple[str, str, str], List[int]] = {}
+        self._by_order: Dict[str, List[int]] = {}
+        self._by_station_action: Dict[Tuple[str, str], List[int]] = {}
+        self._wip: Dict[str, StationWip] = {}
+        self._traces = OrderTraceCache()
+        self._trace_lock = threading.Lock()
+        self._size = 0  # 已完成索引、查詢可見的記錄數
+        self._removed: Set[int] = set()  # 已撤銷的記錄位置
+        self._column_rows = array("l")  # 各記錄在欄式存儲中的列（-1 表示不在欄式存儲中）
+        self.columns = LogColumns()
+        if records:
+            self.extend(records)
+
+    def __len__(self) -> int:
+        return self._size - len(self._removed)
+
+    def records(self) -> List[LogRecord]:
+        """取得所有記錄（依寫入順序，不含已撤銷的記錄）的淺複本"""
+        records = self._records[:self._size]
+        removed = self._removed
+        if removed:
+            return [record for pos, record in enumerate(records) if pos not in removed]
+        return records
+
+    def append(self, record: Dict):
+        """
+        新增一筆記錄並更新所有索引
+
+        Args:
+            record: 記錄（LogRecord 或欄位名稱同 COLUMNS 的字典，字典會轉換為 LogRecord）
+        """
+        record = LogRecord.from_mapping(record)
+        epoch = record.epoch
+        pos = len(self._records)
+        self._records.append(record)
+
+        # 標準化鍵在建立 LogRecord 時已計算一次
+        scanned_key = record.scanned_key
+        new_key = record.new_key
+        station = record.station_key
+        action = record.action_key
+        order_key = record.order_key
+
+        if scanned_key:
+            self._by_barcode.setdefault(scanned_key, []).append(pos)
+            self._by_barcode_station_action.setdefault((scanned_key, station, action), []).append(pos)
+        if new_key and new_key != scanned_key:
+            self._by_barcode.setdefault(new_key, []).append(pos)
+        if order_key:
+            with self._trace_lock:
+                self._by_order.setdefault(order_key, []).append(pos)
+                self._traces.on_append(order_key, record, epoch)
+        self._by_station_action.setdefault((station, action), []).append(pos)
+
+        row = self.columns.append_parsed(record, epoch)
+        self._column_rows.append(-1 if row is None else row)
+
+        if scanned_key and action in ("IN", "OUT"):
+            wip = self._wip.get(station)
+            if wip is None:
+                wip = self._wip[station] = StationWip()
+            if action == "IN":
+                wip.add_inbound(scanned_key, record, pos)
+            else:
+                wip.add_outbound(scanned_key)
+
+        # 所有索引更新完後才讓查詢看到這筆記錄
+        self._size = pos + 1
+
+    def extend(self, records: Iterable[Dict]):
+        """批量新增記錄"""
+        for record in records:
+            self.append(record)
+
+    def remove(self, record: Dict) -> bool:
+        """
+        撤銷最後一筆內容相同的記錄（例如寫入工作表失敗的本機寫入）
+
+        Args:
+            record: 記錄（LogRecord 或欄位名稱同 COLUMNS 的字典）
+
+        Returns:
+            是否找到並撤銷
+        """
+        record = LogRecord.from_mapping(record)
+        station, action = record.station_key, record.action_key
+        candidates = self._visible(self._by_station_action.get((station, action)))
+        pos = next((pos for pos in reversed(candidates) if self._records[pos] == record), None)
+        if pos is None:
+            return False
+        self._removed.add(pos)
+
+        if record.order_key:
+            with self._trace_lock:
+                self._traces.invalidate(record.order_key)
+        row = self._column_rows[pos]
+        if row >= 0:
+            self.columns.remove(row)
+
+        barcode = record.scanned_key
+        wip = self._wip.get(station)
+        if barcode and wip is not None and action in ("IN", "OUT"):
+            inbound = self._visible(self._by_barcode_station_action.get((barcode, station, "IN")))
+            outbound = self._visible(self._by_barcode_station_action.get((barcode, station, "OUT")))
+            wip.reset(barcode, (self._records[inbound[0]], inbound[0]) if inbound else None, bool(outbound))
+        return True
+
+    def _visible(self, positions: Optional[List[int]]) -> List[int]:
+        """位置列表中查詢可見的部分（位置依寫入順序遞增，不含已撤銷的位置）"""
+        if not positions:
+            return []
+        positions = positions[:bisect_left(positions, self._size)]
+        removed = self._removed
+        if removed:
+            return [pos for pos in positions if pos not in removed]
+        return positions
+
+    def _take(self, positions: Optional[List[int]], limit: Optional[int] = None) -> List[LogRecord]:
+        positions = self._visible(positions)
+        if limit is not None:
+            positions = positions[:limit]
+        records = self._records
+        return [records[pos] for pos in positions]
+
+    def find_by_barcode(self, barcode: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        查詢 scanned_barcode 或 new_barcode 符合的記錄
+
+        Args:
+            barcode: 條碼字串
+            limit: 最大返回筆數（None 表示不限制）
+
+        Returns:
+            記錄列表
+        """
+        return self._take(self._by_barcode.get(normalize_barcode(barcode)), limit)
+
+    def find_by_scanned(self, barcode: str, station: str, action: str) -> List[Dict]:
+        """
+        查詢在指定站點、指定動作下掃描了該條碼的記錄
+
+        Args:
+            barcode: 條碼字串
+            station: 站點代號（例如：P2）
+            action: 動作（IN 或 OUT）
+
+        Returns:
+            記錄列表
+        """
+        key = (normalize_barcode(barcode), normalize_station(station), normalize_station(action))
+        return self._take(self._by_barcode_station_action.get(key))
+
+    def has_scanned(self, barcode: str, station: str, action: str) -> bool:
+        """檢查條碼在指定站點是否有指定動作的記錄（只比對 scanned_barcode）"""
+        key = (normalize_barcode(barcode), normalize_station(station), normalize_station(action))
+        positions = self._by_barcode_station_action.get(key)
+        if not positions or positions[0] >= self._size:
+            return False
+        return not self._removed or bool(self._visible(positions))
+
+    def has_scanned_at_other_stations(self, barcode: str, exclude_station: str, action: str) -> bool:
+        """
+        檢查條碼在指定站點以外是否有指定動作的記錄（只比對 scanned_barcode）
+
+        Args:
+            barcode: 條碼字串
+            exclude_station: 要排除的站點代號
+            action: 動作（IN 或 OUT）
+        """
+        barcode_key = normalize_barcode(barcode)
+        exclude_station = normalize_station(exclude_station)
+        action = normalize_station(action)
+        for pos in self._visible(self._by_barcode.get(barcode_key)):
+            record = self._records[pos]
+            if (record.scanned_key == barcode_key and
+                    record.action_key == action and
+                    record.station_key != exclude_station):
+                return True
+        return False
+
+    def find_by_order(self, order: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        查詢工單的所有記錄（不區分大小寫，忽略前導零）
+
+        Args:
+            order: 工單號
+            limit: 最大返回筆數（None 表示不限制）
+        """
+        return self._take(self._by_order.get(normalize_order(order)), limit)
+
+    def find_by_station(self, station: str, action: str) -> List[Dict]:
+        """
+        查詢指定站點、指定動作的所有記錄
+
+        Args:
+            station: 站點代號（例如：P2）
+            action: 動作（IN 或 OUT）
+        """
+        key = (normalize_station(station), normalize_station(action))
+        return self._take(self._by_station_action.get(key))
+
+    def station_wip(self, station: str, offset: int = 0, limit: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """
+        取得站點在製條碼（已遷入、尚未遷出），依遷入時間排序
+
+        Args:
+            station: 站點代號（例如：P2）
+            offset: 略過的筆數
+            limit: 最多返回筆數（None 表示不限制）
+
+        Returns:
+            [(標準化條碼, 第一筆遷入記錄)] 列表
+        """
+        wip = self._wip.get(normalize_station(station))
+        return wip.items(offset, limit, self._size) if wip else []
+
+    def station_wip_count(self, station: str) -> int:
+        """站點在製條碼數量"""
+        wip = self._wip.get(normalize_station(station))
+        return len(wip) if wip else 0
+
+    def order_trace(self, order: str) -> Dict:
+        """
+        取得工單的追溯彙總（第一次查詢時建立，之後隨新記錄增量更新）
+
+        Args:
+            order: 工單號（不區分大小寫，忽略前導零）
+
+        Returns:
+            {"station_timeline": [...], "statistics": {...}}
+        """
+        order_key = normalize_order(order)
+        with self._trace_lock:
+            # 彙總與工單索引在同一把鎖內更新，建立時讀到的記錄不會再由 append 重複加入
+            removed = self._removed
+            positions = [pos for pos in self._by_order.get(order_key, ()) if pos not in removed]
+            return self._traces.get(order_key, lambda: [(self._records[pos], self._records[pos].epoch) for pos in positions])
@@ -0,0 +1,298 @@
+"""
+工單追溯彙總模組
+維護每個工單的站點時間軸與數量統計（投入/產出/良品/不良品、首次遷入/最後遷出、良率），
+隨每筆新記錄增量更新，追溯查詢只需讀取已計算好的結果
+"""
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.timestamps import epoch_to_datetime, timestamp_epoch
+
+# 站點順序（用於判斷上一站、下游站點，以及追溯時間軸的順序）
+STATION_ORDER = {'P1': 1, 'P2': 2, 'P3': 3, 'P4': 4, 'P5': 5}
+
+def format_duration(total_seconds: float) -> str:
+    """將秒數格式化為 HH:MM:SS"""
+    hours = int(total_seconds // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+    seconds = int(total_seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _StationRecords:
+    """單一站點的遷入/遷出記錄（依時間排序）與數量累計"""
+
+    def __init__(self):
+        self.in_records: List[Dict] = []
+        self.out_records: List[Dict] = []
+        self._in_keys: List[tuple] = []
+        self._out_keys: List[tuple] = []
+        self.in_qty = 0
+        self.out_qty = 0
+        self.out_good_qty = 0
+
+    @staticmethod
+    def _insert(records: List[Dict], keys: List[tuple], key: tuple, entry: Dict):
+        # 時間相同時保持寫入順序（與穩定排序結果相同）
+        index = bisect_right(keys, key)
+        keys.insert(index, key)
+        records.insert(index, entry)
+
+    def add(self, action: str, key: tuple, entry: Dict):
+        if action == "IN":
+            self._insert(self.in_records, self._in_keys, key, entry)
+            self.in_qty += entry["qty"]
+        else:
+            self._insert(self.out_records, self._out_keys, key, entry)
+            self.out_qty += entry["qty"]
+            if entry["status"].upper() == "G":
+                self.out_good_qty += entry["qty"]
+
+
+class OrderTrace:
+    """
+    單一工單的追溯彙總
+
+    每筆記錄依寫入時解析好的秒數插入對應站點（add_parsed），不再解析時間戳記字串；
+    result() 在有新記錄後才重新產生結果（只需走訪各站點的累計值），否則直接返回上次的結果
+    """
+
+    def __init__(self, records: Iterable[Dict] = ()):
+        self._stations: Dict[str, _StationRecords] = {}
+        self._seq = 0
+        self._result: Optional[Dict] = None
+        for record in records:
+            self.add(record)
+
+    def add(self, record: Dict):
+        """
+        加入一筆記錄（解析時間戳記，時間戳記無法解析或動作不是 IN/OUT 的記錄忽略）
+
+        Args:
+            record: 記錄字典（欄位同 COLUMNS）
+        """
+        self.add_parsed(record, timestamp_epoch(record.get("timestamp", "")))
+
+    def add_parsed(self, record: Dict, epoch: Optional[float]):
+        """
+        加入一筆已解析時間戳記的記錄
+
+        Args:
+            record: 記錄字典（欄位同 COLUMNS）
+            epoch: 時間戳記的秒數（見 timestamps.timestamp_epoch），None 表示無法解析
+        """
+        if epoch is None:
+            return
+        process = str(record.get("process", "")).upper()
+        action = str(record.get("action", "")).upper()
+        if action not in ("IN", "OUT"):
+            return
+
+        entry = {
+            "timestamp": epoch_to_datetime(epoch),
+            "timestamp_str": record.get("timestamp", ""),
+            "operator": record.get("operator", ""),
+            "qty": _to_int(record.get("qty", 0)),
+            "status": record.get("status", ""),
+            "container": record.get("container", ""),
+            "box_seq": record.get("box_seq", ""),
+            "cycle_time": _to_float(record.get("cycle_time", 0))
+        }
+        self._seq += 1
+        station = self._stations.get(process)
+        if station is None:
+            station = self._stations[process] = _StationRecords()
+        station.add(action, (epoch, self._seq), entry)
+        self._result = None
+
+    def result(self) -> Dict:
+        """
+        取得追溯結果
+
+        Returns:
+            {"station_timeline": [...], "statistics": {...}}（結果可能被共用，呼叫端不可修改）
+        """
+        if self._result is None:
+            self._result = self._build()
+        return self._result
+
+    def _build(self) -> Dict:
+        stations = self._stations
+
+        # 找到首站（第一個有 OUT 記錄的站點，按站點順序）
+        first_station = None
+        first_station_order = None
+        for process, records in stations.items():
+            if records.out_records:
+                process_order = STATION_ORDER.get(process, 999)
+                if first_station_order is None or process_order < first_station_order:
+                    first_station = process
+                    first_station_order = process_order
+
+        # 構建站點時間軸（按站點順序排序，而不是按時間）
+        station_timeline = []
+        previous_station_good_qty = None
+        total_process_time_seconds = 0
+        for process in sorted(stations.keys(), key=lambda p: STATION_ORDER.get(p, 999)):
+            records = stations[process]
+            in_records = list(records.in_records)
+            out_records = list(records.out_records)
+
+            # 找到最早的記錄時間
+            earliest_time = None
+            if in_records:
+                earliest_time = in_records[0]["timestamp"]
+            if out_records:
+                out_time = out_records[0]["timestamp"]
+                if earliest_time is None or out_time < earliest_time:
+                    earliest_time = out_time
+
+            # 投入數量：首站使用所有 IN 記錄的數量總和，其他站點使用上一站的產出良品數量
+            if process == first_station:
+                input_qty = records.in_qty
+            else:
+                input_qty = previous_station_good_qty if previous_station_good_qty is not None else 0
+            previous_station_good_qty = records.out_good_qty
+
+            # 計算總耗時間（從最早 IN 到最晚 OUT）
+            total_time = None
+            if in_records and out_records:
+                total_time = format_duration((out_records[-1]["timestamp"] - in_records[0]["timestamp"]).total_seconds())
+                hours, minutes, seconds = (int(part) for part in total_time.split(":"))
+                total_process_time_seconds += hours * 3600 + minutes * 60 + seconds
+
+            station_timeline.append({
+                "process": process,
+                "earliest_time": earliest_time.isoformat() if earliest_time else None,
+                "in_time": in_records[0]["timestamp_str"] if in_records else None,
+                "out_time": out_records[-1]["timestamp_str"] if out_records else None,
+                "total_time": total_time,
+                "input_qty": input_qty,
+                "output_qty": records.out_qty,
+                "output_good_qty": records.out_good_qty,
+                "output_bad_qty": records.out_qty - records.out_good_qty,
+                "in_records": in_records,
+                "out_records": out_records
+            })
+
+        # 總數 = 首站（最早有遷出記錄的站點）遷出的良品與不良品加總
+        first_station = None
+        first_station_time = None
+        for process, records in stations.items():
+            if records.out_records:
+                earliest_out_time = records.out_records[0]["timestamp"]
+                if first_station_time is None or earliest_out_time < first_station_time:
+                    first_station = process
+                    first_station_time = earliest_out_time
+        total_qty = stations[first_station].out_qty if first_station else 0
+
+        # 最終站（最晚有遷出記錄的站點）的良品數量
+        final_station = None
+        final_station_time = None
+        for process, records in stations.items():
+            if records.out_records:
+                latest_out_time = records.out_records[-1]["timestamp"]
+                if final_station_time is None or latest_out_time > final_station_time:
+                    final_station = process
+                    final_station_time = latest_out_time
+        final_good_qty = stations[final_station].out_good_qty if final_station else 0
+
+        # 全製程不良品 = 首站投入總數 - 最終站良品數；直通率 = 最終站良品數 / 首站投入總數 × 100%
+        total_defect_qty = total_qty - final_good_qty
+        first_pass_rate = (final_good_qty / total_qty * 100) if total_qty > 0 else 0
+
+        # 各製程站的良率 = 產出良品數量 / 投入數量（必須同時有投入和產出記錄）
+        station_yield_rates = {}
+        for process, records in stations.items():
+            if records.in_qty > 0 and records.out_records:
+                station_yield_rates[process] = round(records.out_good_qty / records.in_qty * 100, 2)
+
+        return {
+            "station_timeline": station_timeline,
+            "statistics": {
+                "total_qty": total_qty,  # 首站遷出的總數
+                "final_good_qty": final_good_qty,  # 最終站的良品數量
+                "total_defect_qty": total_defect_qty,  # 全製程不良品 = 首站投入總數 - 最終站良品數
+                "first_pass_rate": round(first_pass_rate, 2),  # 直通率 = 最終站良品數 / 首站投入總數 × 100%
+                "yield_rate": round(first_pass_rate, 2),  # 良率 = 良品/總數
+                "total_process_time": format_duration(total_process_time_seconds),  # 全製程用時（累加各製程的總耗時間）
+                "station_yield_rates": station_yield_rates  # 各製程站的良率
+            }
+        }
+
+
+class OrderTraceCache:
+    """
+    工單追溯彙總緩存
+
+    第一次查詢某工單時由該工單的所有記錄建立彙總，之後每筆新記錄只更新已建立的彙總。
+    本類別不是線程安全的，呼叫端需自行加鎖
+    """
+
+    def __init__(self, max_orders: int = 1000):
+        """
+        Args:
+            max_orders: 最多保留的工單數（超過時移除最早建立的）
+        """
+        self._traces: Dict[str, OrderTrace] = {}
+        self._max_orders = max_orders
+
+    def get(self, order_key: str, load_records: Callable[[], Iterable[Tuple[Dict, Optional[float]]]]) -> Dict:
+        """
+        取得工單的追溯結果
+
+        Args:
+            order_key: 標準化後的工單號
+            load_records: 工單尚未建立彙總時，取得該工單所有 (記錄, 時間戳記秒數) 的函式
+
+        Returns:
+            {"station_timeline": [...], "statistics": {...}}
+        """
+        trace = self._traces.get(order_key)
+        if trace is None:
+            trace = OrderTrace()
+            for record, epoch in load_records():
+                trace.add_parsed(record, epoch)
+            self.put(order_key, trace)
+        return trace.result()
+
+    def peek(self, order_key: str) -> Optional[Dict]:
+        """取得已建立彙總的工單的追溯結果（尚未建立時返回 None，不載入記錄）"""
+        trace = self._traces.get(order_key)
+        return None if trace is None else trace.result()
+
+    def put(self, order_key: str, trace: OrderTrace):
+        """
+        加入在外部建立好的彙總（呼叫端可在鎖外建立，補上建立期間新增的記錄後在鎖內加入）
+        """
+        if order_key not in self._traces and len(self._traces) >= self._max_orders:
+            self._traces.pop(next(iter(self._traces)))
+        self._traces[order_key] = trace
+
+    def on_append(self, order_key: str, record: Dict, epoch: Optional[float]):
+        """新記錄寫入時更新已建立的彙總（尚未查詢過的工單不處理）"""
+        trace = self._traces.get(order_key)
+        if trace is not None:
+            trace.add_parsed(record, epoch)
+
+    def invalidate(self, order_key: str):
+        """移除工單的彙總（記錄被撤銷時使用，下次查詢時重新建立）"""
+        self._traces.pop(order_key, None)
+
+    def clear(self):
+        """清除所有彙總"""
+        self._traces.clear()
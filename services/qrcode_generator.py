@@ -2,12 +2,22 @@
 QR Code 生成器
 根據 config/qrcode.ini 設定生成 QR Code SVG
 """
-import qrcode
-from qrcode.image.svg import SvgPathImage
 from typing import Optional
 from services.config_loader import config_loader
 
 
+def _load_qrcode():
+    """
+    延遲匯入 qrcode（會連帶載入 PIL），只在第一次生成 QR Code 時載入，不拖慢應用程式啟動
+    
+    Returns:
+        (qrcode 模組, SvgPathImage)
+    """
+    import qrcode
+    from qrcode.image.svg import SvgPathImage
+    return qrcode, SvgPathImage
+
+
 class QRCodeGenerator:
     """QR Code 生成器類別"""
     
@@ -23,6 +33,8 @@ class QRCodeGenerator:
             SVG 字串，若失敗則返回 None
         """
         try:
+            qrcode, SvgPathImage = _load_qrcode()
+            
             # 從設定檔讀取配置
             size = int(config_loader.get_value("qrcode", "QRCode", "size", "300"))
             error_correction_str = config_loader.get_value("qrcode", "QRCode", "error_correction", "M")
@@ -118,6 +130,8 @@ class QRCodeGenerator:
             SVG 字串
         """
         try:
+            qrcode, SvgPathImage = _load_qrcode()
+            
             # 從設定檔讀取配置
             error_correction_str = config_loader.get_value("qrcode", "QRCode", "error_correction", "M")
             size = int(config_loader.get_value("qrcode", "QRCode", "size", "300"))
@@ -1,14 +1,32 @@
 """
 Google Sheets 讀寫操作
 """
+import hashlib
 import os
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import TYPE_CHECKING, Dict, Optional, List
 from dotenv import load_dotenv
 import threading
 import time
+import random
+from collections import Counter
+
+from services.analytics import DIMENSIONS
+from services.cache_snapshot import CacheSnapshot
+from services.config_loader import config_loader, BASE_DIR
+from services.log_record import LogRecord
+from services.log_store import LogStore, normalize_barcode, normalize_station
+from services.sheet_quota import (
+    READ, WRITE, SheetQuotaScheduler, is_rate_limit_error
+)
+from services.storage_base import LogStorage, inbound_barcode_item
+from services.sheet_schema import (
+    COLUMNS, COLUMN_HEADERS, SheetSchema, is_header_row, to_cache_record
+)
+from services.write_journal import WriteJournal
+
+if TYPE_CHECKING:
+    import gspread
 
 load_dotenv()
 
@@ -18,63 +36,129 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-# 工作表欄位順序（內部使用，英文欄位名）
-COLUMNS = [
-    "timestamp",
-    "action",
-    "operator",
-    "order",
-    "process",
-    "sku",
-    "container",
-    "box_seq",
-    "qty",
-    "status",
-    "cycle_time",
-    "scanned_barcode",
-    "new_barcode"
-]
+# 工作表物件緩存時間（秒）
+WORKSHEET_HANDLE_TTL = 300
 
-# 工作表欄位標題（顯示用，包含中文說明）
-COLUMN_HEADERS = [
-    "timestamp (時間戳記)",
-    "action (動作)",
-    "operator (操作員)",
-    "order (工單號)",
-    "process (製程站點)",
-    "sku (產品SKU)",
-    "container (容器代號)",
-    "box_seq (箱號)",
-    "qty (數量)",
-    "status (貨態)",
-    "cycle_time (工時)",
-    "scanned_barcode (掃描條碼)",
-    "new_barcode (新條碼)"
-]
+# 寫入日誌預設路徑（相對於專案根目錄，可在 settings.ini 的 [Journal] 區段設定）
+DEFAULT_JOURNAL_PATH = "data/write_journal.jsonl"
+
+# 緩存快照預設路徑與寫入間隔（秒），可在 settings.ini 的 [Snapshot] 區段設定
+DEFAULT_SNAPSHOT_PATH = "data/log_cache.snapshot"
+DEFAULT_SNAPSHOT_INTERVAL = 60
+
+# HTTP 連線池設定（所有線程共用）
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 20
 
+def _record_fingerprint(record: Dict) -> tuple:
+    """記錄的指紋（用於比對本程序寫入的記錄與同步到的記錄）"""
+    return tuple(str(record.get(col, "")).strip() for col in COLUMNS)
 
-class SheetService:
-    """Google Sheets 服務類別"""
+
+def _row_hash(row: List) -> int:
+    """工作表一列內容的雜湊值（忽略尾端空白單元格）"""
+    values = [str(value) for value in row]
+    while values and values[-1] == "":
+        values.pop()
+    # 內建 hash() 的結果每次啟動都不同，快照中的雜湊值需要在重啟後仍可比對
+    digest = hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _column_letter(column_count: int) -> str:
+    """將欄數轉換為欄位字母（例如：13 -> M，27 -> AA）"""
+    column_count = max(column_count, 1)
+    letters = ""
+    while column_count:
+        column_count, remainder = divmod(column_count - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+class SheetService(LogStorage):
+    """
+    Google Sheets 服務類別
+    
+    查詢一致性：查詢方法從緩存索引讀取，結果包含「本程序所有寫入成功的記錄」
+    加上「截至上次同步時間（_last_sync_time）為止工作表中的所有記錄」。
+    需要看到其他程序剛寫入的資料時，查詢方法可指定 strict=True（直接查詢工作表）
+    或 max_staleness（先同步再讀取）。
     
-    def __init__(self):
-        self.client: Optional[gspread.Client] = None
+    並行：寫入與同步以 _cache_lock 互斥（同一時間只有一個線程修改緩存）；查詢不加鎖，
+    先取得目前的 LogStore 參照再讀取，完整同步以新建的 LogStore 整個替換，
+    讀取中的查詢仍使用舊的存儲（見 LogStore 的線程安全說明）。
+    
+    啟動：建構時不呼叫 Google API，首次同步由背景線程進行，完成前查詢會等待（見 readiness）。
+    已同步的記錄與同步到的列數定期寫入本機快照（見 CacheSnapshot）；重啟時先載入快照即可開始服務，
+    再從快照的列數開始增量同步，工作表在這段期間被修改時，增量同步會偵測到並改為完整同步。
+    
+    複寫模式（replica=True）：本機存儲為主要資料來源時使用，只負責將記錄追加到工作表，
+    不建立緩存、不定期同步、不使用寫入日誌（見 SheetReplicator）。
+    """
+    
+    def __init__(self, replica: bool = False):
+        """
+        Args:
+            replica: 是否以複寫模式啟動
+        """
+        self.replica = replica
+        self.client: Optional["gspread.Client"] = None
         self.sheet_id: Optional[str] = None
         # 緩存相關
-        self._cache: List[Dict] = []  # 內存緩存，存儲所有記錄
-        self._cache_lock = threading.Lock()  # 緩存鎖，確保線程安全
+        self._store = LogStore()  # 內存緩存，存儲所有記錄並維護索引
+        self._cache_lock = threading.Lock()  # 緩存寫入鎖（查詢不需持有）
         self._last_sync_time: Optional[float] = None  # 最後同步時間
         self._sync_interval = 30  # 同步間隔（秒）- 增加到 30 秒，避免速率限制
         self._sync_thread: Optional[threading.Thread] = None
         self._stop_sync = False  # 停止同步標誌
         self._sync_failure_count = 0  # 同步失敗計數
+        # 增量同步相關
+        self._sync_schema: Optional[SheetSchema] = None  # 已同步資料所使用的欄位配置
+        self._synced_row_count = 0  # 已同步的工作表列數（含標題列）
+        self._row_hashes: List[int] = []  # 已同步各列內容的雜湊值，用於偵測修改
+        self._delta_sync_count = 0  # 上次完整同步後的增量同步次數
+        self._sample_check_every = 10  # 每幾次增量同步抽樣比對一次
+        self._sample_size = 20  # 抽樣比對的列數
+        self._unsynced_writes: Dict[tuple, List[tuple]] = {}  # 本程序已寫入但尚未同步確認的記錄
+        self._synced_records: List[LogRecord] = []  # 工作表中已同步的記錄（依列順序），寫入快照使用
+        # 緩存快照（重啟時先載入快照，再從快照的列數開始增量同步）
+        self.snapshot: Optional[CacheSnapshot] = None
+        self._snapshot_interval = DEFAULT_SNAPSHOT_INTERVAL
+        self._snapshot_saved_at = 0.0
+        self._snapshot_dirty = False  # 上次寫入快照後是否同步到新的內容
+        self._snapshot_lock = threading.Lock()  # 確保同一時間只有一個線程寫入快照
+        # 首次載入（載入快照或首次同步）完成前，查詢會等待（見 _cache）
+        self._initial_load = threading.Event()
+        self._cache_source: Optional[str] = None  # 緩存內容來源：snapshot（本機快照）或 sheet（已與工作表同步）
+        # 工作表物件緩存（避免每次操作都重新取得 Spreadsheet/Worksheet 中繼資料）
+        self._worksheet = None
+        self._worksheet_opened_at = 0.0
+        self._worksheet_ttl = WORKSHEET_HANDLE_TTL
+        self._worksheet_lock = threading.Lock()
+        # 標題列欄位配置緩存（所有讀寫路徑共用，避免每次操作都讀取第一行）
+        self._schema: Optional[SheetSchema] = None
+        # API 配額排程（所有 Google Sheets 呼叫經由 _api 取得配額，429/5xx 時退避重試）
+        self._quota = SheetQuotaScheduler.from_config()
+        # 寫入日誌（掃描記錄先寫入本機日誌，再由背景線程批量寫入 Google Sheets）
+        self.journal: Optional[WriteJournal] = None
         self._initialize()
-        # 初始化後立即同步一次，然後啟動定期同步
-        if self.client and self.sheet_id:
-            print("[緩存初始化] 後端啟動，開始首次同步資料...")
-            self._sync_from_sheet()
-            self._start_periodic_sync()
-        else:
+        if not self.client or not self.sheet_id:
             print("[緩存初始化] 警告：Google Sheets 客戶端未初始化，無法同步資料")
+            self._initial_load.set()
+        elif replica:
+            print("[複寫模式] Google Sheets 只作為本機記錄的複本，不建立緩存")
+            self._initial_load.set()
+        else:
+            # 有本機快照時先載入快照；首次同步由定期同步線程在背景進行，建構時不等待網路
+            # 快照需在寫入日誌之前載入（寫入日誌會將未提交的記錄加入緩存）
+            self._init_snapshot()
+            if self._load_snapshot():
+                print("[緩存初始化] 已載入本機快照，在背景同步新增的資料...")
+            else:
+                print("[緩存初始化] 後端啟動，在背景進行首次同步（完成前查詢會等待）...")
+            self._init_journal()
+            self._start_periodic_sync(sync_now=True)
+            self.journal.start()
     
     def _initialize(self):
         """初始化 Google Sheets 客戶端"""
@@ -97,9 +181,12 @@ class SheetService:
             
             # 判斷是 Service Account 還是 OAuth 客戶端憑證
             if 'type' in cred_data and cred_data['type'] == 'service_account':
-                # Service Account 憑證
+                # Service Account 憑證（只在連線 Google Sheets 時才匯入 gspread 與 Google 認證套件）
+                import gspread
+                from google.oauth2.service_account import Credentials
                 creds = Credentials.from_service_account_file(credentials_path, scopes=SCOPE)
                 self.client = gspread.authorize(creds)
+                self._configure_http_pool()
                 self.sheet_id = sheet_id
                 print("✓ 使用 Service Account 憑證初始化成功")
             elif 'installed' in cred_data or 'web' in cred_data:
@@ -125,9 +212,111 @@ class SheetService:
             import traceback
             traceback.print_exc()
     
-    def _sync_from_sheet(self) -> bool:
+    def _configure_http_pool(self):
+        """
+        為 gspread 的授權 HTTP session 設定連線池
+        所有線程共用同一個 session，連線可重複使用（keep-alive），不必每次重新握手
         """
-        從 Google Sheets 同步所有數據到緩存
+        session = getattr(self.client, "session", None)
+        if session is None:
+            return
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+        session.mount("https://", adapter)
+    
+    def _get_worksheet(self):
+        """
+        取得 Logs 工作表物件（緩存 WORKSHEET_HANDLE_TTL 秒）
+        
+        Returns:
+            gspread Worksheet 物件
+        """
+        with self._worksheet_lock:
+            now = time.time()
+            if self._worksheet is not None and now - self._worksheet_opened_at < self._worksheet_ttl:
+                return self._worksheet
+            spreadsheet = self._api(READ, self.client.open_by_key, self.sheet_id)
+            self._worksheet = self._api(READ, spreadsheet.worksheet, "Logs")
+            self._worksheet_opened_at = now
+            # 工作表物件重新取得時，欄位配置也重新解析（標題列可能已被修改）
+            self._schema = None
+            return self._worksheet
+    
+    def _invalidate_worksheet(self):
+        """清除工作表物件與欄位配置緩存，下次操作時重新取得"""
+        with self._worksheet_lock:
+            self._worksheet = None
+            self._schema = None
+    
+    def _get_schema(self, worksheet, create: bool = False) -> Optional[SheetSchema]:
+        """
+        取得工作表的欄位配置（解析一次後緩存，工作表物件失效或完整同步時重新解析）
+        
+        Args:
+            worksheet: Logs 工作表
+            create: 第一行為空或不是標題欄時，是否寫入標題列（寫入路徑使用）
+        
+        Returns:
+            SheetSchema；工作表沒有標題列且 create=False 時返回 None
+        """
+        schema = self._schema
+        if schema is not None:
+            return schema
+        
+        headers = self._api(READ, worksheet.row_values, 1)
+        if not headers:
+            if not create:
+                return None
+            # 第一行為空，建立標題列（使用 update 而不是 append_row，確保寫入第一行）
+            self._api(WRITE, worksheet.update, 'A1', [COLUMN_HEADERS])
+            headers = COLUMN_HEADERS
+        elif not is_header_row(headers):
+            if not create:
+                return None
+            # 第一行不是標題欄，插入標題欄到第一行
+            self._api(WRITE, worksheet.insert_row, COLUMN_HEADERS, 1)
+            headers = COLUMN_HEADERS
+        
+        schema = SheetSchema(headers)
+        self._schema = schema
+        return schema
+    
+    def _api(self, kind: str, func, *args, **kwargs):
+        """
+        經由配額排程執行 Google Sheets 呼叫
+        
+        Args:
+            kind: READ 或 WRITE
+            func: gspread 方法
+        """
+        return self._quota.call(kind, func, *args, **kwargs)
+    
+    def quota_status(self) -> Dict:
+        """
+        取得 API 配額狀態（各類型的剩餘令牌與剩餘比例）
+        
+        Returns:
+            {"read": {...}, "write": {...}}
+        """
+        return self._quota.status()
+    
+    def _handle_api_error(self, error: Exception):
+        """
+        API 呼叫失敗時的處理：非速率限制的錯誤可能是工作表被刪除、改名或連線失效，
+        清除工作表物件緩存（速率限制錯誤則保留，避免增加 API 調用）
+        """
+        if not is_rate_limit_error(error):
+            self._invalidate_worksheet()
+    
+    def _sync_from_sheet(self, full: bool = False) -> bool:
+        """
+        從 Google Sheets 同步數據到緩存
+        
+        預設使用增量同步：只讀取上次同步後新增的列（工作表實務上只會追加）。
+        偵測到列數減少、最後一列被修改或抽樣檢查不一致時，改為完整同步。
+        
+        Args:
+            full: 是否強制完整同步
         
         Returns:
             是否同步成功
@@ -136,82 +325,32 @@ class SheetService:
             return False
         
         try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
+            worksheet = self._get_worksheet()
             
-            # 讀取所有記錄
             try:
-                headers = worksheet.row_values(1)
-                if not headers or len(headers) == 0:
-                    # 沒有標題列，可能是空工作表
-                    with self._cache_lock:
-                        self._cache = []
-                        self._last_sync_time = time.time()
-                    print("[緩存同步] 工作表為空，清空緩存")
-                    return True
+                if not full and self._sync_schema and self._synced_row_count > 0:
+                    synced = self._sync_delta(worksheet)
+                    if synced is not None:
+                        self._on_sync_success()
+                        self._save_snapshot()
+                        return synced
                 
-                # 檢查第一行是否為標題欄
-                first_cell = headers[0] if headers else ""
-                is_header_row = False
-                if first_cell:
-                    header_keywords = ["timestamp", "時間戳記", "action", "動作"]
-                    first_cell_lower = str(first_cell).lower()
-                    is_header_row = any(keyword in first_cell_lower for keyword in header_keywords)
-                
-                if not is_header_row:
-                    # 第一行不是標題欄，可能是空工作表
-                    with self._cache_lock:
-                        self._cache = []
-                        self._last_sync_time = time.time()
-                    print("[緩存同步] 工作表沒有標題列，清空緩存")
-                    return True
-                
-                # 建立標題對應字典
-                header_to_column = {}
-                for i, header in enumerate(headers):
-                    if "(" in header:
-                        column_name = header.split("(")[0].strip()
-                    else:
-                        column_name = header.strip()
-                    
-                    if column_name in COLUMNS:
-                        header_to_column[header] = column_name
-                    elif i < len(COLUMNS):
-                        header_to_column[header] = COLUMNS[i]
-                
-                # 讀取所有記錄（從第二行開始）
-                all_records = worksheet.get_all_records()
-                records = []
-                for record in all_records:
-                    new_record = {}
-                    for header, value in record.items():
-                        column_name = header_to_column.get(header, header.split("(")[0].strip() if "(" in header else header)
-                        new_record[column_name] = str(value) if value is not None else ""
-                    records.append(new_record)
-                
-                # 更新緩存
-                with self._cache_lock:
-                    self._cache = records
-                    self._last_sync_time = time.time()
-                
-                # 同步成功，重置失敗計數
-                if self._sync_failure_count > 0:
-                    self._sync_failure_count = 0
-                    print(f"[緩存同步] 同步恢復正常，間隔恢復為 {self._sync_interval} 秒")
-                
-                print(f"[緩存同步] 成功同步 {len(records)} 筆記錄到緩存")
-                return True
+                synced = self._sync_full(worksheet)
+                self._on_sync_success()
+                self._save_snapshot()
+                return synced
                 
             except Exception as e:
+                self._handle_api_error(e)
                 print(f"[緩存同步] 讀取記錄失敗：{e}")
                 import traceback
                 traceback.print_exc()
                 return False
                 
         except Exception as e:
-            error_str = str(e)
+            self._handle_api_error(e)
             # 檢查是否為速率限制錯誤
-            if '429' in error_str or 'Quota exceeded' in error_str or 'RATE_LIMIT_EXCEEDED' in error_str:
+            if is_rate_limit_error(e):
                 self._sync_failure_count += 1
                 print(f"[緩存同步] 速率限制錯誤（第 {self._sync_failure_count} 次），將延長同步間隔")
                 # 如果連續失敗，增加同步間隔
@@ -225,19 +364,290 @@ class SheetService:
                 traceback.print_exc()
             return False
     
-    def _start_periodic_sync(self):
-        """啟動定期同步線程"""
+    def _on_sync_success(self):
+        """同步成功，重置失敗計數"""
+        self._cache_source = "sheet"
+        if self._sync_failure_count > 0:
+            self._sync_failure_count = 0
+            print(f"[緩存同步] 同步恢復正常，間隔恢復為 {self._sync_interval} 秒")
+    
+    def _sync_full(self, worksheet) -> bool:
+        """
+        完整同步：讀取整個工作表並重建緩存
+        
+        Args:
+            worksheet: Logs 工作表
+        
+        Returns:
+            是否同步成功
+        """
+        started_at = time.time()
+        all_values = self._api(READ, worksheet.get_all_values)
+        headers = all_values[0] if all_values else []
+        
+        if not headers or not is_header_row(headers):
+            # 沒有標題列，可能是空工作表
+            with self._cache_lock:
+                self._store = LogStore()
+                self._unsynced_writes = {}
+                self._synced_records = []
+                self._sync_schema = None
+                self._row_hashes = []
+                self._synced_row_count = 0
+                self._last_sync_time = time.time()
+            print("[緩存同步] 工作表為空或沒有標題列，清空緩存")
+            return True
+        
+        schema = SheetSchema(headers)
+        rows = all_values[1:]
+        records = [LogRecord.from_mapping(schema.to_record(row)) for row in rows if any(row)]
+        
+        # 在鎖外建立索引，再整體替換緩存，避免阻塞查詢
+        store = LogStore(records)
+        # 順便更新共用的欄位配置緩存（標題列可能已被修改）
+        self._schema = schema
+        with self._cache_lock:
+            # 本程序寫入但尚未出現在工作表中的記錄（寫入發生在讀取之後）需保留
+            pending = self._match_unsynced(records)
+            for written_at, record in pending:
+                # written_at 為 None 表示仍在寫入日誌中、尚未寫入工作表
+                if written_at is None or written_at >= started_at:
+                    store.append(record)
+                    self._unsynced_writes.setdefault(_record_fingerprint(record), []).append((written_at, record))
+            self._store = store
+            self._synced_records = records
+            self._sync_schema = schema
+            self._row_hashes = [_row_hash(row) for row in all_values]
+            self._synced_row_count = len(all_values)
+            self._delta_sync_count = 0
+            self._last_sync_time = time.time()
+            self._snapshot_dirty = True
+        
+        print(f"[緩存同步] 完整同步 {len(records)} 筆記錄到緩存")
+        return True
+    
+    def _sync_delta(self, worksheet) -> Optional[bool]:
+        """
+        增量同步：從上次同步的最後一列開始讀取，只處理新增的列
+        
+        讀取範圍包含上次同步的最後一列，用來偵測修改或刪除；
+        每 _sample_check_every 次增量同步會額外抽樣比對一段已同步的列。
+        
+        Args:
+            worksheet: Logs 工作表
+        
+        Returns:
+            是否同步成功；若偵測到修改或刪除需要完整同步，返回 None
+        """
+        last_row = self._synced_row_count
+        last_col = _column_letter(self._sync_schema.width)
+        ranges = [f"A{last_row}:{last_col}"]
+        
+        sample_start = None
+        self._delta_sync_count += 1
+        if self._delta_sync_count % self._sample_check_every == 0 and last_row > 1:
+            sample_start = random.randint(1, last_row)
+            sample_end = min(sample_start + self._sample_size - 1, last_row)
+            ranges.append(f"A{sample_start}:{last_col}{sample_end}")
+        
+        results = self._api(READ, worksheet.batch_get, ranges)
+        tail = list(results[0]) if results else []
+        
+        # 最後一列消失（列數減少）或內容不同（被修改），改為完整同步
+        if not tail or _row_hash(tail[0]) != self._row_hashes[last_row - 1]:
+            print("[緩存同步] 偵測到工作表列被修改或刪除，改為完整同步")
+            return None
+        
+        if sample_start is not None:
+            sample = list(results[1]) if len(results) > 1 else []
+            expected = min(self._sample_size, last_row - sample_start + 1)
+            for offset in range(expected):
+                # API 會省略範圍尾端的空白列，視為空列比對
+                row = sample[offset] if offset < len(sample) else []
+                if _row_hash(row) != self._row_hashes[sample_start - 1 + offset]:
+                    print(f"[緩存同步] 抽樣檢查第 {sample_start + offset} 列不一致，改為完整同步")
+                    return None
+        
+        new_rows = tail[1:]
+        records = [LogRecord.from_mapping(self._sync_schema.to_record(row)) for row in new_rows if any(row)]
+        
+        with self._cache_lock:
+            # 本程序已寫入緩存的記錄不重複加入
+            for record in records:
+                entries = self._unsynced_writes.get(_record_fingerprint(record))
+                if entries:
+                    entries.pop(0)
+                    if not entries:
+                        del self._unsynced_writes[_record_fingerprint(record)]
+                    continue
+                self._store.append(record)
+            self._synced_records.extend(records)
+            self._row_hashes.extend(_row_hash(row) for row in new_rows)
+            self._synced_row_count += len(new_rows)
+            self._last_sync_time = time.time()
+            if new_rows:
+                self._snapshot_dirty = True
+        
+        if new_rows:
+            print(f"[緩存同步] 增量同步 {len(records)} 筆新記錄（共 {self._synced_row_count} 列）")
+        return True
+    
+    def _match_unsynced(self, records: List[Dict]) -> List[tuple]:
+        """
+        將同步到的記錄與本程序尚未確認的寫入配對，返回仍未出現在工作表中的寫入
+        呼叫端需持有 _cache_lock
+        
+        Returns:
+            [(寫入時間, 記錄)] 列表
+        """
+        if not self._unsynced_writes:
+            return []
+        remaining = self._unsynced_writes
+        self._unsynced_writes = {}
+        for record in records:
+            entries = remaining.get(_record_fingerprint(record))
+            if entries:
+                entries.pop(0)
+        return [entry for entries in remaining.values() for entry in entries]
+    
+    def _remember_local_writes(self, records: List[Dict], committed: bool = True):
+        """
+        將本程序寫入的記錄加入緩存，並記錄下來以便同步時去重
+        呼叫端需持有 _cache_lock
+        
+        Args:
+            records: 緩存記錄列表
+            committed: 記錄是否已寫入工作表（False 表示仍在寫入日誌中）
+        """
+        written_at = time.time() if committed else None
+        for record in records:
+            self._store.append(record)
+            self._unsynced_writes.setdefault(_record_fingerprint(record), []).append((written_at, record))
+    
+    def _discard_local_writes(self, records: List[Dict]):
+        """
+        撤銷寫入工作表失敗的記錄：從尚未確認的寫入中移除，並從緩存撤銷（只處理這些記錄，不重建緩存）。
+        已被同步讀到的記錄表示實際已寫入工作表，保留在緩存中
+        呼叫端需持有 _cache_lock
+        """
+        for record in records:
+            fingerprint = _record_fingerprint(record)
+            entries = self._unsynced_writes.get(fingerprint, [])
+            for i, (_, cached) in enumerate(entries):
+                if cached is record:
+                    del entries[i]
+                    self._store.remove(record)
+                    break
+            if fingerprint in self._unsynced_writes and not entries:
+                del self._unsynced_writes[fingerprint]
+    
+    def _mark_local_writes_committed(self, records: List[Dict]):
+        """
+        將寫入日誌中的記錄標記為已寫入工作表（同步時的保留判斷以此時間為準）
+        呼叫端需持有 _cache_lock
+        """
+        committed_at = time.time()
+        for record in records:
+            entries = self._unsynced_writes.get(_record_fingerprint(record), [])
+            for i, (written_at, cached) in enumerate(entries):
+                if written_at is None:
+                    entries[i] = (committed_at, cached)
+                    break
+    
+    def _init_snapshot(self):
+        """建立緩存快照（路徑與寫入間隔見 settings.ini 的 [Snapshot] 區段）"""
+        snapshot_path = config_loader.get_value("settings", "Snapshot", "path", DEFAULT_SNAPSHOT_PATH)
+        if not os.path.isabs(snapshot_path):
+            snapshot_path = str(BASE_DIR / snapshot_path)
+        self.snapshot = CacheSnapshot(snapshot_path)
+        self._snapshot_interval = float(config_loader.get_value(
+            "settings", "Snapshot", "min_interval", str(DEFAULT_SNAPSHOT_INTERVAL)))
+    
+    def _load_snapshot(self) -> bool:
+        """
+        從本機快照載入緩存（之後的同步從快照的列數開始增量讀取）
+        
+        Returns:
+            是否載入成功
+        """
+        if self.snapshot is None:
+            return False
+        started_at = time.time()
+        data = self.snapshot.load(self.sheet_id)
+        if data is None:
+            return False
+        records = data["records"]
+        store = LogStore(records)
+        with self._cache_lock:
+            self._store = store
+            self._synced_records = records
+            self._sync_schema = SheetSchema(data["headers"])
+            self._row_hashes = data["row_hashes"]
+            self._synced_row_count = data["row_count"]
+            self._delta_sync_count = 0
+            # 緩存時效從快照寫入時算起，max_staleness 查詢仍會視需要先同步
+            self._last_sync_time = data["saved_at"]
+            self._cache_source = "snapshot"
+        self._initial_load.set()
+        print(f"[緩存快照] 載入 {len(records)} 筆記錄（工作表前 {data['row_count']} 列），"
+              f"耗時 {time.time() - started_at:.2f} 秒")
+        return True
+    
+    def _save_snapshot(self, force: bool = False):
+        """
+        同步到新內容後寫入快照（距離上次寫入未滿 _snapshot_interval 秒時略過）
+        
+        Args:
+            force: 是否忽略寫入間隔（停止服務時使用）
+        """
+        if self.snapshot is None or not self._snapshot_dirty:
+            return
+        if not force and time.time() - self._snapshot_saved_at < self._snapshot_interval:
+            return
+        if not self._snapshot_lock.acquire(blocking=force):
+            return  # 其他線程正在寫入
+        try:
+            with self._cache_lock:
+                schema = self._sync_schema
+                row_count = self._synced_row_count
+                row_hashes = list(self._row_hashes)
+                records = self._synced_records[:]
+                self._snapshot_dirty = False
+            if schema is None:
+                return
+            self.snapshot.save(self.sheet_id, schema.headers, row_count, row_hashes, records)
+            self._snapshot_saved_at = time.time()
+        except (OSError, ValueError) as e:
+            self._snapshot_dirty = True
+            print(f"[緩存快照] 寫入快照失敗：{e}")
+        finally:
+            self._snapshot_lock.release()
+    
+    def _start_periodic_sync(self, sync_now: bool = False):
+        """
+        啟動定期同步線程
+        
+        Args:
+            sync_now: 是否在線程啟動後立即同步一次（首次同步）
+        """
         if self._sync_thread and self._sync_thread.is_alive():
             return  # 已經在運行
         
         def sync_worker():
+            if sync_now:
+                try:
+                    self._sync_from_sheet()
+                finally:
+                    # 首次同步失敗時仍開放查詢（使用快照或空緩存），之後由定期同步補上
+                    self._initial_load.set()
             while not self._stop_sync:
                 # 使用動態間隔（可能因為錯誤而調整）
                 current_interval = self._sync_interval
                 time.sleep(current_interval)
                 if not self._stop_sync:
                     print(f"[緩存同步] 開始定期同步（間隔 {current_interval} 秒）...")
-                    self._sync_from_sheet()
+                    with self._quota.background():
+                        self._sync_from_sheet()
         
         self._stop_sync = False
         self._sync_thread = threading.Thread(target=sync_worker, daemon=True)
@@ -250,6 +660,13 @@ class SheetService:
         if self._sync_thread:
             self._sync_thread.join(timeout=1)
         print("[緩存同步] 已停止定期同步線程")
+        self._save_snapshot(force=True)
+    
+    def shutdown(self):
+        """停止寫入日誌與定期同步，並寫入最後一次快照（應用程式結束時呼叫）"""
+        if self.journal is not None:
+            self.journal.stop()
+        self.stop_periodic_sync()
     
     def force_sync(self) -> bool:
         """
@@ -259,6 +676,60 @@ class SheetService:
             是否同步成功
         """
         print("[緩存同步] 手動觸發同步...")
+        return self._sync_from_sheet(full=True)
+    
+    def _cache(self) -> LogStore:
+        """
+        取得目前的緩存（查詢使用）
+        首次載入完成前會等待：查詢在 sheet_io 線程中執行，等待過久時呼叫端得到逾時（504）
+        """
+        self._initial_load.wait()
+        return self._store
+    
+    def readiness(self) -> Dict:
+        """
+        取得就緒狀態
+        
+        Returns:
+            ready（首次載入是否完成）, source（snapshot/sheet/None）, records, synced_rows,
+            last_sync_time, cache_age, sync_failures
+        """
+        age = self.cache_age()
+        return {
+            "ready": self._initial_load.is_set(),
+            "source": self._cache_source,
+            "records": len(self._store),
+            "synced_rows": self._synced_row_count,
+            "last_sync_time": datetime.fromtimestamp(self._last_sync_time).isoformat() if self._last_sync_time else None,
+            "cache_age": round(age, 1) if age is not None else None,
+            "sync_failures": self._sync_failure_count
+        }
+    
+    def cache_age(self) -> Optional[float]:
+        """
+        取得緩存距離上次同步的時間
+        
+        Returns:
+            秒數，若尚未同步過則返回 None
+        """
+        if self._last_sync_time is None:
+            return None
+        return time.time() - self._last_sync_time
+    
+    def ensure_fresh(self, max_staleness: float) -> bool:
+        """
+        確保緩存不舊於指定時效，若過期則立即同步（read-through）
+        
+        Args:
+            max_staleness: 可接受的緩存最大時效（秒）
+        
+        Returns:
+            緩存是否在時效內（同步失敗時返回 False，呼叫端仍可使用舊緩存）
+        """
+        age = self.cache_age()
+        if age is not None and age <= max_staleness:
+            return True
+        print("[緩存同步] 緩存已過期，讀取前先同步...")
         return self._sync_from_sheet()
     
     def write_log(self, log_data: Dict[str, any]) -> bool:
@@ -276,139 +747,33 @@ class SheetService:
             return False
         
         try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
+            worksheet = self._get_worksheet()
             
-            # 讀取或建立標題列
-            try:
-                headers = worksheet.row_values(1)
-                # 檢查第一行是否為空或不是標題欄
-                if not headers or len(headers) == 0:
-                    # 第一行為空，建立標題列（使用帶中文說明的標題）
-                    # 使用 update 而不是 append_row，確保寫入第一行
-                    worksheet.update('A1', [COLUMN_HEADERS])
-                    headers = COLUMN_HEADERS
-                else:
-                    # 檢查第一行是否已經是標題欄（檢查是否包含關鍵字）
-                    first_cell = headers[0] if headers else ""
-                    is_header_row = False
-                    if first_cell:
-                        # 檢查第一個單元格是否包含標題欄的關鍵字
-                        header_keywords = ["timestamp", "時間戳記", "action", "動作"]
-                        first_cell_lower = str(first_cell).lower()
-                        is_header_row = any(keyword in first_cell_lower for keyword in header_keywords)
-                    
-                    if not is_header_row:
-                        # 第一行不是標題欄，插入標題欄到第一行
-                        worksheet.insert_row(COLUMN_HEADERS, 1)
-                        headers = COLUMN_HEADERS
-                    # 如果已經是標題欄，使用現有的標題
-            except Exception as e:
-                # 如果無法讀取第一行，嘗試檢查工作表是否為空
-                try:
-                    all_values = worksheet.get_all_values()
-                    if not all_values or len(all_values) == 0:
-                        # 工作表為空，建立標題列
-                        worksheet.update('A1', [COLUMN_HEADERS])
-                        headers = COLUMN_HEADERS
-                    else:
-                        # 工作表有內容，讀取第一行作為標題
-                        headers = all_values[0] if all_values else COLUMN_HEADERS
-                        # 檢查第一行是否為標題欄
-                        first_cell = headers[0] if headers else ""
-                        is_header_row = False
-                        if first_cell:
-                            header_keywords = ["timestamp", "時間戳記", "action", "動作"]
-                            first_cell_lower = str(first_cell).lower()
-                            is_header_row = any(keyword in first_cell_lower for keyword in header_keywords)
-                        
-                        if not is_header_row:
-                            # 第一行不是標題欄，插入標題欄
-                            worksheet.insert_row(COLUMN_HEADERS, 1)
-                            headers = COLUMN_HEADERS
-                except:
-                    # 如果所有操作都失敗，使用預設標題
-                    headers = COLUMN_HEADERS
+            # 取得欄位配置（緩存），準備資料列（按照 Sheet 中的實際欄位順序）
+            schema = self._get_schema(worksheet, create=True)
+            row_data = schema.to_row(log_data)
             
-            # 建立標題到欄位的映射（根據 Sheet 中的實際標題順序）
-            header_to_column = {}
-            for i, header in enumerate(headers):
-                # 從標題中提取欄位名（例如："order (工單號)" -> "order"）
-                if "(" in header:
-                    column_name = header.split("(")[0].strip()
-                else:
-                    column_name = header.strip()
-                
-                # 如果提取的欄位名在 COLUMNS 中，使用它；否則使用索引對應的 COLUMNS
-                if column_name in COLUMNS:
-                    header_to_column[header] = column_name
-                elif i < len(COLUMNS):
-                    header_to_column[header] = COLUMNS[i]
-            
-            # 定義需要轉換為大寫的欄位（字串欄位）
-            uppercase_fields = {"action", "operator", "order", "process", "sku", "container", 
-                              "box_seq", "status", "scanned_barcode", "new_barcode"}
-            
-            # 準備資料列（按照 Sheet 中的實際欄位順序）
-            row_data = []
-            for header in headers:
-                # 找到對應的欄位名
-                column_name = header_to_column.get(header, None)
-                if not column_name:
-                    # 如果找不到對應的欄位，嘗試直接從標題提取
-                    if "(" in header:
-                        column_name = header.split("(")[0].strip()
-                    else:
-                        column_name = header.strip()
-                
-                # 取得值
-                if column_name:
-                    value = log_data.get(column_name, "")
-                else:
-                    value = ""
-                
-                # 轉換為字串並統一轉換為大寫（如果是需要轉換的欄位）
-                if value is None:
-                    value = ""
-                elif isinstance(value, datetime):
-                    value = value.strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    value = str(value)
-                    # 如果是需要轉換為大寫的欄位，統一轉換
-                    if column_name and column_name in uppercase_fields:
-                        # 特殊處理：new_barcode 欄位如果是 URL，只轉換條碼部分，保留 domain 為小寫
-                        if column_name == "new_barcode" and ("http://" in value.lower() or "https://" in value.lower() or "/b=" in value):
-                            # 分離 domain 和條碼部分
-                            if "/b=" in value:
-                                parts = value.split("/b=", 1)
-                                if len(parts) == 2:
-                                    domain_part = parts[0]  # 保留 domain 為原始大小寫
-                                    barcode_part = parts[1].upper()  # 只轉換條碼部分為大寫
-                                    value = f"{domain_part}/b={barcode_part}"
-                                else:
-                                    value = value.upper()
-                            else:
-                                value = value.upper()
-                        else:
-                            value = value.upper()
-                
-                row_data.append(value)
+            # 追加前先加入緩存並登記為尚未確認的寫入：追加期間的同步讀到這筆記錄時不會重複加入
+            cache_record = to_cache_record(log_data)
+            with self._cache_lock:
+                self._remember_local_writes([cache_record], committed=False)
             
             # 追加到工作表
-            worksheet.append_row(row_data)
+            try:
+                self._api(WRITE, worksheet.append_row, row_data)
+            except Exception:
+                with self._cache_lock:
+                    self._discard_local_writes([cache_record])
+                raise
             
-            # 寫入成功後，立即更新緩存（保持數據一致性）
             with self._cache_lock:
-                # 確保 log_data 的格式與緩存中的記錄格式一致
-                cache_record = {}
-                for col in COLUMNS:
-                    cache_record[col] = str(log_data.get(col, ""))
-                self._cache.append(cache_record)
-                print(f"[緩存更新] 已將新記錄添加到緩存（總計 {len(self._cache)} 筆）")
+                self._mark_local_writes_committed([cache_record])
+            print(f"[緩存更新] 已將新記錄添加到緩存（總計 {len(self._store)} 筆）")
             
             return True
         
         except Exception as e:
+            self._handle_api_error(e)
             print(f"寫入 Google Sheets 失敗：{e}")
             return False
     
@@ -429,195 +794,175 @@ class SheetService:
         if not log_data_list or len(log_data_list) == 0:
             return (0, [])
         
+        # 追加前先加入緩存並登記為尚未確認的寫入：追加期間的同步讀到這些記錄時不會重複加入
+        cache_records = [to_cache_record(log_data) for log_data in log_data_list]
+        with self._cache_lock:
+            self._remember_local_writes(cache_records, committed=False)
+        
         try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
-            
-            # 讀取或建立標題列（只讀取一次）
-            try:
-                headers = worksheet.row_values(1)
-                # 檢查第一行是否為空或不是標題欄
-                if not headers or len(headers) == 0:
-                    worksheet.update('A1', [COLUMN_HEADERS])
-                    headers = COLUMN_HEADERS
-                else:
-                    first_cell = headers[0] if headers else ""
-                    is_header_row = False
-                    if first_cell:
-                        header_keywords = ["timestamp", "時間戳記", "action", "動作"]
-                        first_cell_lower = str(first_cell).lower()
-                        is_header_row = any(keyword in first_cell_lower for keyword in header_keywords)
-                    
-                    if not is_header_row:
-                        worksheet.insert_row(COLUMN_HEADERS, 1)
-                        headers = COLUMN_HEADERS
-            except Exception as e:
-                try:
-                    all_values = worksheet.get_all_values()
-                    if not all_values or len(all_values) == 0:
-                        worksheet.update('A1', [COLUMN_HEADERS])
-                        headers = COLUMN_HEADERS
-                    else:
-                        headers = all_values[0] if all_values else COLUMN_HEADERS
-                        first_cell = headers[0] if headers else ""
-                        is_header_row = False
-                        if first_cell:
-                            header_keywords = ["timestamp", "時間戳記", "action", "動作"]
-                            first_cell_lower = str(first_cell).lower()
-                            is_header_row = any(keyword in first_cell_lower for keyword in header_keywords)
-                        
-                        if not is_header_row:
-                            worksheet.insert_row(COLUMN_HEADERS, 1)
-                            headers = COLUMN_HEADERS
-                except:
-                    headers = COLUMN_HEADERS
-            
-            # 建立標題到欄位的映射（只建立一次）
-            header_to_column = {}
-            for i, header in enumerate(headers):
-                if "(" in header:
-                    column_name = header.split("(")[0].strip()
-                else:
-                    column_name = header.strip()
-                
-                if column_name in COLUMNS:
-                    header_to_column[header] = column_name
-                elif i < len(COLUMNS):
-                    header_to_column[header] = COLUMNS[i]
-            
-            # 定義需要轉換為大寫的欄位
-            uppercase_fields = {"action", "operator", "order", "process", "sku", "container", 
-                              "box_seq", "status", "scanned_barcode", "new_barcode"}
-            
-            # 準備所有資料列（批量處理）
-            rows_data = []
-            for log_data in log_data_list:
-                row_data = []
-                for header in headers:
-                    column_name = header_to_column.get(header, None)
-                    if not column_name:
-                        if "(" in header:
-                            column_name = header.split("(")[0].strip()
-                        else:
-                            column_name = header.strip()
-                    
-                    if column_name:
-                        value = log_data.get(column_name, "")
-                    else:
-                        value = ""
-                    
-                    # 轉換為字串並統一轉換為大寫（如果是需要轉換的欄位）
-                    if value is None:
-                        value = ""
-                    elif isinstance(value, datetime):
-                        value = value.strftime("%Y-%m-%d %H:%M:%S")
-                    else:
-                        value = str(value)
-                        if column_name and column_name in uppercase_fields:
-                            if column_name == "new_barcode" and ("http://" in value.lower() or "https://" in value.lower() or "/b=" in value):
-                                if "/b=" in value:
-                                    parts = value.split("/b=", 1)
-                                    if len(parts) == 2:
-                                        domain_part = parts[0]
-                                        barcode_part = parts[1].upper()
-                                        value = f"{domain_part}/b={barcode_part}"
-                                    else:
-                                        value = value.upper()
-                                else:
-                                    value = value.upper()
-                            else:
-                                value = value.upper()
-                    
-                    row_data.append(value)
-                
-                rows_data.append(row_data)
-            
             # 批量追加到工作表（一次性 API 調用）
-            if rows_data:
-                worksheet.append_rows(rows_data)
-                print(f"[批量寫入] 成功寫入 {len(rows_data)} 筆記錄")
-                return (len(rows_data), [])
-            else:
-                return (0, list(range(len(log_data_list))))
+            self._append_rows(log_data_list)
+            print(f"[批量寫入] 成功寫入 {len(log_data_list)} 筆記錄")
+            with self._cache_lock:
+                self._mark_local_writes_committed(cache_records)
+            return (len(log_data_list), [])
         
         except Exception as e:
+            with self._cache_lock:
+                self._discard_local_writes(cache_records)
+            self._handle_api_error(e)
             print(f"批量寫入 Google Sheets 失敗：{e}")
             import traceback
             traceback.print_exc()
             return (0, list(range(len(log_data_list))))
     
-    def get_logs_by_barcode(self, barcode: str, limit: int = 100) -> list:
+    def _append_rows(self, log_data_list: List[Dict]):
         """
-        根據條碼查詢記錄（查詢 scanned_barcode 或 new_barcode 欄位）
-        優先從緩存讀取，避免 API 調用
+        將多筆記錄追加到工作表（一次性 API 調用，不更新緩存）
+        失敗時拋出例外
+        """
+        worksheet = self._get_worksheet()
+        # 取得欄位配置（緩存），準備所有資料列（按照 Sheet 中的實際欄位順序）
+        schema = self._get_schema(worksheet, create=True)
+        rows_data = [schema.to_row(log_data) for log_data in log_data_list]
+        self._api(WRITE, worksheet.append_rows, rows_data)
+    
+    def append_records(self, records: List[Dict]):
+        """
+        將記錄追加到工作表，不更新緩存（複寫模式使用，以背景優先級取得配額）
         
         Args:
-            barcode: 條碼字串
-            limit: 最大返回筆數
+            records: 緩存記錄格式的記錄列表
+        
+        Raises:
+            寫入失敗時拋出例外
+        """
+        try:
+            with self._quota.background():
+                self._append_rows(records)
+        except Exception as e:
+            self._handle_api_error(e)
+            raise
+    
+    def _init_journal(self):
+        """建立寫入日誌，並將上次未寫入工作表的記錄放回緩存"""
+        journal_path = config_loader.get_value("settings", "Journal", "path", DEFAULT_JOURNAL_PATH)
+        if not os.path.isabs(journal_path):
+            journal_path = str(BASE_DIR / journal_path)
+        self.journal = WriteJournal(journal_path, self._commit_journal_records,
+                                    reconcile_fn=self._reconcile_journal_records)
+        pending = self.journal.pending_records()
+        if pending:
+            with self._cache_lock:
+                self._remember_local_writes(pending, committed=False)
+    
+    def _commit_journal_records(self, records: List[Dict]) -> bool:
+        """
+        寫入日誌的提交函式：將一批記錄寫入工作表
+        
+        Args:
+            records: 緩存記錄格式的記錄列表
         
         Returns:
-            記錄列表
+            是否寫入成功
         """
-        # 標準化條碼（移除可能的 domain 前綴）
-        barcode_normalized = barcode
-        if "/b=" in barcode:
-            barcode_normalized = barcode.split("/b=")[-1]
+        # 記錄已寫入本機日誌，提交讓位給互動呼叫
+        self.append_records(records)
+        with self._cache_lock:
+            self._mark_local_writes_committed(records)
+        return True
+    
+    def _reconcile_journal_records(self, records: List[Dict]) -> List[Dict]:
+        """
+        寫入日誌的確認函式：先同步工作表，排除已經寫入工作表的記錄（依記錄內容比對），
+        避免上次提交結果不確定時重複追加
+        
+        Args:
+            records: 結果不確定的緩存記錄
         
-        # 從緩存讀取
+        Returns:
+            仍需寫入工作表的記錄
+        
+        Raises:
+            RuntimeError: 同步失敗，無法確認（寫入日誌稍後重試）
+        """
+        if not self._sync_from_sheet():
+            raise RuntimeError("同步工作表失敗，無法確認記錄是否已寫入")
+        wanted = {_record_fingerprint(record) for record in records}
         with self._cache_lock:
-            filtered = []
-            for record in self._cache:
-                scanned = str(record.get("scanned_barcode", "")).strip()
-                new = str(record.get("new_barcode", "")).strip()
-                
-                # 標準化記錄中的條碼
-                scanned_normalized = scanned
-                if "/b=" in scanned:
-                    scanned_normalized = scanned.split("/b=")[-1]
-                
-                new_normalized = new
-                if "/b=" in new:
-                    new_normalized = new.split("/b=")[-1]
-                
-                # 檢查條碼是否匹配（精確匹配）
-                if (barcode_normalized == scanned_normalized or 
-                    barcode_normalized == new_normalized):
-                    filtered.append(record)
-            
-            # 限制筆數
-            return filtered[:limit]
+            written = Counter(
+                fingerprint for fingerprint in map(_record_fingerprint, self._synced_records) if fingerprint in wanted
+            )
+            remaining = []
+            already_written = []
+            for record in records:
+                fingerprint = _record_fingerprint(record)
+                if written[fingerprint] > 0:
+                    written[fingerprint] -= 1
+                    already_written.append(record)
+                else:
+                    remaining.append(record)
+            # 同步前已在工作表中的列不會再與尚未確認的寫入配對，這些記錄從緩存撤銷（工作表中的那一列已在緩存中）
+            self._discard_local_writes(already_written)
+        if already_written:
+            print(f"[寫入日誌] {len(already_written)} 筆記錄已在工作表中，不重複寫入")
+        return remaining
     
-    def has_inbound_record(self, barcode: str) -> bool:
+    def submit_logs(self, log_data_list: List[Dict]) -> tuple:
         """
-        檢查條碼是否有遷入（IN）記錄
+        提交多筆記錄：寫入本機日誌並 fsync 後即返回成功，再由背景線程批量寫入 Google Sheets
+        記錄會立即加入緩存，之後的查詢可以看到
+        未啟用寫入日誌時（Google Sheets 客戶端未初始化），改為直接呼叫 write_logs_batch
         
         Args:
-            barcode: 條碼字串
+            log_data_list: 記錄資料字典列表，每個字典應包含所有 COLUMNS 欄位
         
         Returns:
-            如果有 IN 記錄則返回 True，否則返回 False
+            Tuple[int, list]: (成功筆數, 失敗的記錄索引列表)
         """
-        logs = self.get_logs_by_barcode(barcode, limit=10)
-        for log in logs:
-            if log.get("action", "").upper() == "IN":
-                return True
-        return False
+        if self.journal is None:
+            return self.write_logs_batch(log_data_list)
+        
+        if not log_data_list:
+            return (0, [])
+        
+        cache_records = [to_cache_record(log_data) for log_data in log_data_list]
+        try:
+            self.journal.submit(cache_records)
+        except OSError as e:
+            print(f"寫入本機日誌失敗：{e}")
+            return (0, list(range(len(log_data_list))))
+        
+        with self._cache_lock:
+            self._remember_local_writes(cache_records, committed=False)
+        print(f"[寫入日誌] 已接收 {len(cache_records)} 筆記錄，等待寫入 Google Sheets")
+        return (len(cache_records), [])
+    
+    def journal_status(self) -> Dict:
+        """
+        取得寫入日誌狀態
+        
+        Returns:
+            狀態字典（未啟用時 enabled 為 False）
+        """
+        if self.journal is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.journal.status()}
     
-    def has_outbound_record(self, barcode: str) -> bool:
+    def get_logs_by_barcode(self, barcode: str, limit: int = 100) -> list:
         """
-        檢查條碼是否有遷出（OUT）記錄
+        根據條碼查詢記錄（查詢 scanned_barcode 或 new_barcode 欄位）
+        優先從緩存讀取，避免 API 調用
         
         Args:
             barcode: 條碼字串
+            limit: 最大返回筆數
         
         Returns:
-            如果有 OUT 記錄則返回 True，否則返回 False
+            記錄列表
         """
-        logs = self.get_logs_by_barcode(barcode, limit=10)
-        for log in logs:
-            if log.get("action", "").upper() == "OUT":
-                return True
-        return False
+        # 從緩存索引讀取
+        return self._cache().find_by_barcode(barcode, limit)
     
     def has_outbound_record_at_station(self, barcode: str, station_id: str) -> bool:
         """
@@ -631,96 +976,61 @@ class SheetService:
         Returns:
             如果在指定站點有 OUT 記錄則返回 True，否則返回 False
         """
-        # 標準化條碼（移除 domain 前綴，轉大寫，去除空白）
-        barcode_norm = barcode.split("/b=")[-1] if "/b=" in barcode else barcode
-        barcode_norm = barcode_norm.strip().upper()
-        station_id_upper = station_id.upper()
-        
-        # 從緩存讀取
-        with self._cache_lock:
-            for record in self._cache:
-                action = str(record.get("action", "")).strip().upper()
-                process = str(record.get("process", "")).strip().upper()
-                
-                # 只檢查該站點的 OUT 記錄
-                if action == "OUT" and process == station_id_upper:
-                    # 檢查 scanned_barcode（遷出時掃描的條碼）
-                    scanned = str(record.get("scanned_barcode", "")).strip()
-                    scanned_norm = scanned.split("/b=")[-1] if "/b=" in scanned else scanned
-                    scanned_norm = scanned_norm.strip().upper()
-                    
-                    if scanned_norm == barcode_norm:
-                        print(f"[遷出檢查] 找到匹配：條碼 {barcode_norm} 在站點 {station_id_upper} 有遷出記錄")
-                        return True
-        
-        return False
+        # 從緩存索引讀取
+        found = self._cache().has_scanned(barcode, station_id, "OUT")
+        if found:
+            print(f"[遷出檢查] 找到匹配：條碼 {normalize_barcode(barcode)} 在站點 {station_id.upper()} 有遷出記錄")
+        return found
     
-    def has_inbound_record_at_other_stations(self, barcode: str, exclude_station_id: str) -> bool:
+    def has_inbound_record_at_other_stations(self, barcode: str, exclude_station_id: str, strict: bool = False) -> bool:
         """
         檢查條碼是否在其他站點（排除指定站點）有遷入（IN）記錄
+        從緩存索引讀取，一致性保證見 SheetService 類別說明
         
         Args:
             barcode: 條碼字串
             exclude_station_id: 要排除的站點代號（例如：P1, P2）
+            strict: 緩存中沒找到時，是否再直接查詢 Google Sheets（強一致性）
         
         Returns:
             如果在其他站點有 IN 記錄則返回 True，否則返回 False
         """
+        if self._cache().has_scanned_at_other_stations(barcode, exclude_station_id, "IN"):
+            return True
+        
+        if not strict:
+            return False
+        return self._has_inbound_record_at_other_stations_remote(barcode, exclude_station_id)
+    
+    def _has_inbound_record_at_other_stations_remote(self, barcode: str, exclude_station_id: str) -> bool:
+        """直接查詢 Google Sheets：條碼是否在其他站點有遷入（IN）記錄"""
         if not self.client or not self.sheet_id:
             return False
         
         try:
             # 標準化條碼（移除 domain 前綴）
-            barcode_norm = barcode.split("/b=")[-1] if "/b=" in barcode else barcode
-            exclude_station_upper = exclude_station_id.upper()
+            barcode_norm = normalize_barcode(barcode)
+            exclude_station_upper = normalize_station(exclude_station_id)
             
-            # 從緩存中查找
-            with self._cache_lock:
-                for record in self._cache:
-                    scanned_barcode = str(record.get("scanned_barcode", "")).strip()
-                    action = str(record.get("action", "")).upper()
-                    process = str(record.get("process", "")).upper()
-                    
-                    if (scanned_barcode == barcode_norm and 
-                        action == "IN" and 
-                        process != exclude_station_upper):
-                        return True
-            
-            # 如果緩存中沒找到，從 Google Sheets 查詢
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
+            worksheet = self._get_worksheet()
             
-            # 讀取標題列
+            # 取得欄位配置（緩存），找到 scanned_barcode、process 和 action 欄位的位置
             try:
-                headers = worksheet.row_values(1)
-                if not headers or len(headers) == 0:
-                    return False
+                schema = self._get_schema(worksheet)
             except:
                 return False
+            if schema is None:
+                return False
             
-            # 找到 scanned_barcode、process 和 action 欄位的位置
-            scanned_barcode_col = None
-            process_col = None
-            action_col = None
-            
-            for i, header in enumerate(headers):
-                if "(" in header:
-                    column_name = header.split("(")[0].strip()
-                else:
-                    column_name = header.strip()
-                
-                if column_name == "scanned_barcode":
-                    scanned_barcode_col = i + 1
-                elif column_name == "process":
-                    process_col = i + 1
-                elif column_name == "action":
-                    action_col = i + 1
+            scanned_barcode_col = schema.column_index("scanned_barcode")
+            process_col = schema.column_index("process")
+            action_col = schema.column_index("action")
             
             if not scanned_barcode_col or not process_col or not action_col:
                 return False
             
             # 使用 findall 查詢條碼
-            cells = worksheet.findall(barcode_norm)
+            cells = self._api(READ, worksheet.findall, barcode_norm)
             for cell in cells:
                 row = cell.row
                 # 檢查是否在 scanned_barcode 欄位
@@ -728,11 +1038,11 @@ class SheetService:
                     continue
                 
                 # 讀取該行的 action 和 process 欄位
-                action_value = worksheet.cell(row, action_col).value
-                process_value = worksheet.cell(row, process_col).value
+                action_value = self._api(READ, worksheet.cell, row, action_col).value
+                process_value = self._api(READ, worksheet.cell, row, process_col).value
                 
-                action = str(action_value).upper() if action_value else ""
-                process = str(process_value).upper() if process_value else ""
+                action = normalize_station(action_value)
+                process = normalize_station(process_value)
                 
                 if action == "IN" and process != exclude_station_upper:
                     return True
@@ -740,70 +1050,68 @@ class SheetService:
             return False
             
         except Exception as e:
+            self._handle_api_error(e)
             print(f"檢查其他站點遷入記錄失敗：{e}")
             return False
     
-    def has_inbound_record_at_station(self, barcode: str, station_id: str) -> bool:
+    def has_inbound_record_at_station(self, barcode: str, station_id: str, strict: bool = False) -> bool:
         """
         檢查條碼在指定站點是否有遷入（IN）記錄
-        使用 findall 直接查詢，避免讀取整個工作表
+        從緩存索引讀取，一致性保證見 SheetService 類別說明
         
         Args:
             barcode: 條碼字串
             station_id: 製程站點代號（例如：P1, P2）
+            strict: 緩存中沒找到時，是否再直接查詢 Google Sheets（強一致性）
         
         Returns:
             如果在指定站點有 IN 記錄則返回 True，否則返回 False
         """
+        if self._cache().has_scanned(barcode, station_id, "IN"):
+            return True
+        
+        if not strict:
+            return False
+        return self._has_inbound_record_at_station_remote(barcode, station_id)
+    
+    def _has_inbound_record_at_station_remote(self, barcode: str, station_id: str) -> bool:
+        """
+        直接查詢 Google Sheets：條碼在指定站點是否有遷入（IN）記錄
+        使用 findall 直接查詢，避免讀取整個工作表
+        """
         if not self.client or not self.sheet_id:
             return False
         
         try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
+            worksheet = self._get_worksheet()
             
-            # 讀取標題列
+            # 取得欄位配置（緩存），找到 scanned_barcode、process 和 action 欄位的位置
             try:
-                headers = worksheet.row_values(1)
-                if not headers or len(headers) == 0:
-                    return False
+                schema = self._get_schema(worksheet)
             except:
                 return False
+            if schema is None:
+                return False
             
-            # 找到 scanned_barcode、process 和 action 欄位的位置
-            scanned_barcode_col = None
-            process_col = None
-            action_col = None
-            
-            for i, header in enumerate(headers):
-                if "(" in header:
-                    column_name = header.split("(")[0].strip()
-                else:
-                    column_name = header.strip()
-                
-                if column_name == "scanned_barcode":
-                    scanned_barcode_col = i + 1
-                elif column_name == "process":
-                    process_col = i + 1
-                elif column_name == "action":
-                    action_col = i + 1
+            scanned_barcode_col = schema.column_index("scanned_barcode")
+            process_col = schema.column_index("process")
+            action_col = schema.column_index("action")
             
             if not scanned_barcode_col or not process_col or not action_col:
                 return False
             
             # 標準化條碼（移除 domain 前綴）
-            barcode_norm = barcode.split("/b=")[-1] if "/b=" in barcode else barcode
-            station_id_upper = station_id.upper()
+            barcode_norm = normalize_barcode(barcode)
+            station_id_upper = normalize_station(station_id)
             
             # 使用 findall 直接查詢條碼
             try:
-                cells = worksheet.findall(barcode_norm)
+                cells = self._api(READ, worksheet.findall, barcode_norm)
                 for cell in cells:
                     # 只考慮 scanned_barcode 欄位中的匹配
                     if cell.col == scanned_barcode_col:
                         # 驗證是否為完整匹配
-                        cell_value = str(cell.value).strip()
-                        cell_value_norm = cell_value.split("/b=")[-1] if "/b=" in cell_value else cell_value
+                        cell_value_norm = normalize_barcode(cell.value)
                         
                         if cell_value_norm == barcode_norm:
                             row_num = cell.row
@@ -812,12 +1120,12 @@ class SheetService:
                             
                             # 讀取該行的 process 和 action 欄位
                             try:
-                                process_value = worksheet.cell(row_num, process_col).value
-                                action_value = worksheet.cell(row_num, action_col).value if action_col else None
+                                process_value = self._api(READ, worksheet.cell, row_num, process_col).value
+                                action_value = self._api(READ, worksheet.cell, row_num, action_col).value if action_col else None
                                 
                                 # 檢查是否為 IN 記錄且 process 匹配
-                                if str(action_value).strip().upper() == "IN" and \
-                                   str(process_value).strip().upper() == station_id_upper:
+                                if normalize_station(action_value) == "IN" and \
+                                   normalize_station(process_value) == station_id_upper:
                                     return True
                             except:
                                 continue
@@ -825,19 +1133,21 @@ class SheetService:
                 return False
         
         except Exception as e:
+            self._handle_api_error(e)
             print(f"檢查遷入記錄失敗：{e}")
             return False
         
         return False
     
-    def batch_check_inbound_records(self, barcodes: list, station_id: str) -> dict:
+    def batch_check_inbound_records(self, barcodes: list, station_id: str, strict: bool = False) -> dict:
         """
         批量檢查多個條碼在指定站點是否有遷入（IN）記錄
-        優先從緩存讀取，避免 API 調用
+        從緩存索引讀取，一致性保證見 SheetService 類別說明
         
         Args:
             barcodes: 條碼字串列表
             station_id: 製程站點代號（例如：P1, P2）
+            strict: 是否對緩存中沒找到的條碼再直接查詢 Google Sheets（強一致性）
         
         Returns:
             dict: {barcode: bool} 映射，表示每個條碼是否有 IN 記錄
@@ -845,40 +1155,37 @@ class SheetService:
         if not barcodes or len(barcodes) == 0:
             return {}
         
+        store = self._cache()
+        result = {barcode: store.has_scanned(barcode, station_id, "IN") for barcode in barcodes}
+        
+        if strict:
+            missing = [barcode for barcode, found in result.items() if not found]
+            if missing:
+                result.update(self._batch_check_inbound_records_remote(missing, station_id))
+        
+        return result
+    
+    def _batch_check_inbound_records_remote(self, barcodes: list, station_id: str) -> dict:
+        """直接查詢 Google Sheets：批量檢查條碼在指定站點是否有遷入（IN）記錄"""
         result = {barcode: False for barcode in barcodes}
         
         if not self.client or not self.sheet_id:
             return result
         
         try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
+            worksheet = self._get_worksheet()
             
-            # 讀取標題列（只讀一次）
+            # 取得欄位配置（緩存），找到 scanned_barcode、process 和 action 欄位的位置
             try:
-                headers = worksheet.row_values(1)
-                if not headers or len(headers) == 0:
-                    return result
+                schema = self._get_schema(worksheet)
             except:
                 return result
+            if schema is None:
+                return result
             
-            # 找到 scanned_barcode、process 和 action 欄位的位置
-            scanned_barcode_col = None
-            process_col = None
-            action_col = None
-            
-            for i, header in enumerate(headers):
-                if "(" in header:
-                    column_name = header.split("(")[0].strip()
-                else:
-                    column_name = header.strip()
-                
-                if column_name == "scanned_barcode":
-                    scanned_barcode_col = i + 1
-                elif column_name == "process":
-                    process_col = i + 1
-                elif column_name == "action":
-                    action_col = i + 1
+            scanned_barcode_col = schema.column_index("scanned_barcode")
+            process_col = schema.column_index("process")
+            action_col = schema.column_index("action")
             
             if not scanned_barcode_col or not process_col or not action_col:
                 return result
@@ -886,10 +1193,10 @@ class SheetService:
             # 標準化條碼（移除 domain 前綴）
             barcodes_normalized = {}
             for barcode in barcodes:
-                barcode_norm = barcode.split("/b=")[-1] if "/b=" in barcode else barcode
+                barcode_norm = normalize_barcode(barcode)
                 barcodes_normalized[barcode_norm] = barcode
             
-            station_id_upper = station_id.upper()
+            station_id_upper = normalize_station(station_id)
             
             # 使用 findall 直接查詢每個條碼（只查詢 scanned_barcode 欄位）
             # 這樣可以快速定位到包含該條碼的行
@@ -899,13 +1206,12 @@ class SheetService:
                 try:
                     # 查找包含該條碼的單元格（在 scanned_barcode 欄位中）
                     # 使用完整匹配模式，避免部分匹配
-                    cells = worksheet.findall(barcode_norm)
+                    cells = self._api(READ, worksheet.findall, barcode_norm)
                     for cell in cells:
                         # 只考慮 scanned_barcode 欄位中的匹配
                         if cell.col == scanned_barcode_col:
                             # 驗證是否為完整匹配（讀取單元格值進行驗證）
-                            cell_value = str(cell.value).strip()
-                            cell_value_norm = cell_value.split("/b=")[-1] if "/b=" in cell_value else cell_value
+                            cell_value_norm = normalize_barcode(cell.value)
                             
                             if cell_value_norm == barcode_norm:
                                 if cell.row not in found_rows:
@@ -925,8 +1231,8 @@ class SheetService:
                     if row_nums:
                         # 批量讀取這些行的 process 和 action 欄位
                         # 使用 A1 表示法構建範圍
-                        process_col_letter = gspread.utils.rowcol_to_a1(1, process_col)[0]
-                        action_col_letter = gspread.utils.rowcol_to_a1(1, action_col)[0] if action_col else None
+                        process_col_letter = _column_letter(process_col)
+                        action_col_letter = _column_letter(action_col) if action_col else None
                         
                         # 構建範圍字符串（例如：D2:D100, E2:E100）
                         if len(row_nums) > 0:
@@ -938,7 +1244,7 @@ class SheetService:
                         
                         # 批量讀取
                         if ranges_to_read:
-                            batch_values = worksheet.batch_get(ranges_to_read)
+                            batch_values = self._api(READ, worksheet.batch_get, ranges_to_read)
                             
                             # 處理讀取的數據
                             process_values = batch_values[0] if batch_values else []
@@ -961,8 +1267,8 @@ class SheetService:
                                     action_value = action_row[0] if action_row else ""
                                     
                                     # 檢查是否為 IN 記錄且 process 匹配
-                                    if str(action_value).strip().upper() == "IN" and \
-                                       str(process_value).strip().upper() == station_id_upper:
+                                    if normalize_station(action_value) == "IN" and \
+                                       normalize_station(process_value) == station_id_upper:
                                         # 標記所有匹配的條碼
                                         for barcode_norm in matched_barcodes:
                                             original_barcode = barcodes_normalized[barcode_norm]
@@ -974,11 +1280,11 @@ class SheetService:
                         if row_num == 1:
                             continue
                         try:
-                            process_value = worksheet.cell(row_num, process_col).value
-                            action_value = worksheet.cell(row_num, action_col).value if action_col else None
+                            process_value = self._api(READ, worksheet.cell, row_num, process_col).value
+                            action_value = self._api(READ, worksheet.cell, row_num, action_col).value if action_col else None
                             
-                            if str(action_value).strip().upper() == "IN" and \
-                               str(process_value).strip().upper() == station_id_upper:
+                            if normalize_station(action_value) == "IN" and \
+                               normalize_station(process_value) == station_id_upper:
                                 for barcode_norm in matched_barcodes:
                                     original_barcode = barcodes_normalized[barcode_norm]
                                     result[original_barcode] = True
@@ -986,6 +1292,7 @@ class SheetService:
                             continue
         
         except Exception as e:
+            self._handle_api_error(e)
             print(f"批量檢查遷入記錄失敗：{e}")
             import traceback
             traceback.print_exc()
@@ -993,292 +1300,99 @@ class SheetService:
         
         return result
     
-    def has_outbound_record_at_downstream_stations(self, barcode: str, current_station: str) -> bool:
+    def get_logs_by_order(self, order: str, limit: int = 100, max_staleness: Optional[float] = None) -> list:
         """
-        檢查條碼在下游站點是否有遷出（OUT）記錄
+        根據工單號查詢記錄（不區分大小寫，去除前導零）
+        從緩存的工單索引讀取，不會下載整個工作表
         
         Args:
-            barcode: 條碼字串
-            current_station: 當前站點代號（例如：P2）
+            order: 工單號
+            limit: 最大返回筆數
+            max_staleness: 可接受的緩存最大時效（秒）；若指定且緩存比此值舊，
+                先同步一次再讀取（read-through）。None 表示直接使用緩存
         
         Returns:
-            如果在下游站點有 OUT 記錄則返回 True，否則返回 False
+            記錄列表
         """
-        # 定義站點順序
-        station_order = {'P1': 1, 'P2': 2, 'P3': 3, 'P4': 4, 'P5': 5}
-        current_order = station_order.get(current_station.upper(), 999)
+        if max_staleness is not None:
+            self.ensure_fresh(max_staleness)
         
-        # 如果當前站點不在定義中，返回 False
-        if current_order == 999:
-            return False
-        
-        logs = self.get_logs_by_barcode(barcode, limit=100)
-        for log in logs:
-            if log.get("action", "").upper() == "OUT":
-                log_process = log.get("process", "").upper()
-                log_order = station_order.get(log_process, 999)
-                # 如果記錄的站點順序大於當前站點，說明是下游站點
-                if log_order > current_order:
-                    return True
-        return False
+        return self._cache().find_by_order(order, limit)
     
-    def get_logs_by_order(self, order: str, limit: int = 100) -> list:
+    def get_yield_analytics(self, dimensions=DIMENSIONS, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
         """
-        根據工單號查詢記錄
+        依工單、站點、SKU、操作員分組統計良率與產能
+        統計不持有緩存鎖，不阻塞寫入與同步（只處理開始統計時已寫入的記錄）
         
         Args:
-            order: 工單號
-            limit: 最大返回筆數
-        
-        Returns:
-            記錄列表
+            dimensions: 要分組的維度
+            start: 只統計時間 >= start 的記錄（1970-01-01 起算的秒數）
+            end: 只統計時間 < end 的記錄
         """
-        if not self.client or not self.sheet_id:
-            return []
-        
-        try:
-            spreadsheet = self.client.open_by_key(self.sheet_id)
-            worksheet = spreadsheet.worksheet("Logs")
-            
-            # 檢查是否有標題列
-            try:
-                headers = worksheet.row_values(1)
-                if not headers or len(headers) == 0:
-                    # 沒有標題列，無法使用 get_all_records
-                    # 手動讀取資料
-                    all_values = worksheet.get_all_values()
-                    if len(all_values) <= 1:
-                        return []  # 只有標題列或沒有資料
-                    
-                    # 使用預設標題（英文欄位名）
-                    headers = COLUMNS
-                    records = []
-                    for row in all_values[1:]:  # 跳過標題列
-                        if len(row) > 0:  # 確保不是空行
-                            record = {}
-                            for i, header in enumerate(headers):
-                                if i < len(row):
-                                    record[header] = row[i]
-                                else:
-                                    record[header] = ""
-                            records.append(record)
-                else:
-                    # 有標題列，需要將帶中文的標題轉換為英文欄位名
-                    # 建立標題對應字典
-                    header_to_column = {}
-                    for i, header in enumerate(headers):
-                        # 從標題中提取英文欄位名（移除括號和中文）
-                        if "(" in header:
-                            # 格式：timestamp (時間戳記) -> timestamp
-                            column_name = header.split("(")[0].strip()
-                        else:
-                            # 如果沒有括號，直接使用
-                            column_name = header.strip()
-                        
-                        # 如果提取的欄位名在 COLUMNS 中，使用它；否則使用索引對應的 COLUMNS
-                        if column_name in COLUMNS:
-                            header_to_column[header] = column_name
-                        elif i < len(COLUMNS):
-                            header_to_column[header] = COLUMNS[i]
-                    
-                    # 讀取所有記錄
-                    all_records = worksheet.get_all_records()
-                    # 轉換標題為英文欄位名
-                    records = []
-                    for record in all_records:
-                        new_record = {}
-                        for header, value in record.items():
-                            # 使用對應的英文欄位名
-                            column_name = header_to_column.get(header, header.split("(")[0].strip() if "(" in header else header)
-                            new_record[column_name] = value
-                        records.append(new_record)
-            except Exception as e:
-                print(f"讀取記錄時發生錯誤：{e}")
-                return []
-            
-            # 過濾出符合工單號的記錄（不區分大小寫，去除前導零）
-            order_normalized = order.upper().lstrip('0') or '0'  # 標準化工單號
-            filtered = []
-            for record in records:
-                record_order = record.get("order", "").strip()
-                if record_order:
-                    # 標準化記錄中的工單號（轉大寫，去除前導零）
-                    record_order_normalized = record_order.upper().lstrip('0') or '0'
-                    if record_order_normalized == order_normalized:
-                        filtered.append(record)
-            
-            # 限制筆數
-            return filtered[:limit]
-        
-        except Exception as e:
-            print(f"查詢 Google Sheets 失敗：{e}")
-            return []
+        return self._cache().columns.summarize(dimensions, start, end)
     
-    def get_previous_station_barcodes(self, order: str, current_station: str) -> list:
+    def get_order_trace(self, order: str) -> Dict:
         """
-        查詢相同工單的上一站條碼（OUT 記錄）
+        取得工單的追溯彙總（從緩存讀取）
+        彙總在第一次查詢時建立，之後隨寫入與同步的每筆新記錄增量更新，不必每次重新解析所有記錄
         
         Args:
-            order: 工單號
-            current_station: 當前站點（例如：P2）
+            order: 工單號（不區分大小寫，忽略前導零）
         
         Returns:
-            上一站條碼列表，每個條碼包含：barcode, box_seq, qty, status, container
+            {"station_timeline": [...], "statistics": {...}}（結果可能被共用，呼叫端不可修改）
         """
-        # 取得所有該工單的記錄
-        logs = self.get_logs_by_order(order, limit=1000)
-        
-        # 判斷上一站（根據站點順序）
-        station_order = {'P1': 1, 'P2': 2, 'P3': 3, 'P4': 4, 'P5': 5}
-        current_order = station_order.get(current_station.upper(), 999)
-        
-        if current_order <= 1:
-            # 如果是 P1 或更早，沒有上一站
-            return []
-        
-        # 找出上一站代號
-        prev_station = None
-        for station, order_num in station_order.items():
-            if order_num == current_order - 1:
-                prev_station = station
-                break
-        
-        if not prev_station:
-            return []
+        return self._cache().order_trace(order)
+    
+    def find_by_station(self, station_id: str, action: str) -> List[Dict]:
+        """
+        查詢指定站點、指定動作的所有記錄（從緩存的站點索引讀取）
         
-        # 過濾出上一站的 OUT 記錄
-        prev_station_out_logs = []
-        for log in logs:
-            action = log.get("action", "").upper()
-            process = log.get("process", "").upper()
-            new_barcode = log.get("new_barcode", "").strip()
-            
-            # 只取上一站的 OUT 記錄，且必須有 new_barcode（表示已遷出）
-            if action == "OUT" and process == prev_station and new_barcode:
-                # 標準化條碼（移除可能的 domain 前綴）
-                barcode_normalized = new_barcode
-                if "/b=" in new_barcode:
-                    barcode_normalized = new_barcode.split("/b=")[-1]
-                
-                # 檢查該條碼是否已在當前站點遷入過
-                scanned_barcode = str(log.get("scanned_barcode", "")).strip()
-                box_seq = str(log.get("box_seq", "")).strip()
-                qty = str(log.get("qty", "")).strip()
-                status = str(log.get("status", "")).strip()
-                container = str(log.get("container", "")).strip()
-                
-                # 檢查該條碼在當前站點是否已有 IN 記錄
-                has_in = self.has_inbound_record_at_station(barcode_normalized, current_station)
-                
-                # 篩除不良品（status = 'N'）
-                status_upper = status.upper()
-                
-                if not has_in and status_upper != 'N':
-                    # 該條碼尚未在當前站點遷入，且不是不良品，加入列表
-                    prev_station_out_logs.append({
-                        "barcode": barcode_normalized,
-                        "box_seq": box_seq,
-                        "qty": qty,
-                        "status": status,
-                        "container": container,
-                        "process": process
-                    })
-        
-        # 去重（根據條碼）
-        seen_barcodes = set()
-        unique_logs = []
-        for log in prev_station_out_logs:
-            if log["barcode"] not in seen_barcodes:
-                seen_barcodes.add(log["barcode"])
-                unique_logs.append(log)
-        
-        return unique_logs
+        Args:
+            station_id: 站點代號（例如：P2）
+            action: 動作（IN 或 OUT）
+        """
+        return self._cache().find_by_station(station_id, action)
+
     
-    def get_inbound_barcodes_at_station(self, station_id: str) -> list:
+    def get_inbound_barcodes_at_station(self, station_id: str, offset: int = 0, limit: Optional[int] = None) -> list:
         """
-        查詢指定站點的所有遷入條碼（IN 記錄），但只返回尚未遷出的條碼
-        即：有 IN 記錄但沒有 OUT 記錄（在該站點）的條碼
+        查詢指定站點尚未遷出的遷入條碼，依遷入時間由早到晚排序
+        直接讀取緩存中隨每筆記錄更新的站點在製列表，耗時與返回筆數成正比
         
         Args:
             station_id: 站點代號（例如：P1, P2）
+            offset: 分頁起始位置（略過的筆數）
+            limit: 每頁筆數（None 表示不分頁）
         
         Returns:
-            遷入條碼列表（只包含尚未遷出的），每個條碼包含：barcode, order, sku, qty, timestamp, container, box_seq, status
+            遷入條碼列表，每個條碼包含：barcode, order, sku, qty, timestamp, container, box_seq, status
         """
-        if not self.client or not self.sheet_id:
-            return []
-        
-        try:
-            station_id_upper = station_id.upper()
-            inbound_barcodes = []
-            
-            # 從緩存讀取
-            with self._cache_lock:
-                # 先收集所有該站點的 IN 記錄和 OUT 記錄
-                inbound_records = []
-                outbound_barcodes = set()
-                
-                for record in self._cache:
-                    action = str(record.get("action", "")).upper()
-                    process = str(record.get("process", "")).upper()
-                    
-                    # 收集該站點的 IN 記錄
-                    if action == "IN" and process == station_id_upper:
-                        scanned_barcode = str(record.get("scanned_barcode", "")).strip()
-                        if scanned_barcode:
-                            inbound_records.append(record)
-                    
-                    # 收集該站點的 OUT 記錄的條碼（用於過濾）
-                    if action == "OUT" and process == station_id_upper:
-                        scanned_barcode = str(record.get("scanned_barcode", "")).strip()
-                        if scanned_barcode:
-                            # 標準化條碼
-                            out_barcode_norm = scanned_barcode
-                            if "/b=" in scanned_barcode:
-                                out_barcode_norm = scanned_barcode.split("/b=")[-1]
-                            out_barcode_norm = out_barcode_norm.strip().upper()
-                            outbound_barcodes.add(out_barcode_norm)
-                
-                # 處理 IN 記錄，過濾掉已有 OUT 記錄的條碼
-                seen_barcodes = set()
-                for record in inbound_records:
-                    scanned_barcode = str(record.get("scanned_barcode", "")).strip()
-                    # 標準化條碼（移除可能的 domain 前綴，轉大寫，去除空白）
-                    barcode_normalized = scanned_barcode
-                    if "/b=" in scanned_barcode:
-                        barcode_normalized = scanned_barcode.split("/b=")[-1]
-                    barcode_normalized = barcode_normalized.strip().upper()
-                    
-                    # 去重
-                    if barcode_normalized not in seen_barcodes:
-                        seen_barcodes.add(barcode_normalized)
-                        
-                        # 檢查該條碼是否在 OUT 記錄中
-                        if barcode_normalized not in outbound_barcodes:
-                            # 沒有 OUT 記錄，加入列表
-                            inbound_barcodes.append({
-                                "barcode": barcode_normalized,
-                                "order": str(record.get("order", "")).strip(),
-                                "sku": str(record.get("sku", "")).strip(),
-                                "qty": str(record.get("qty", "")).strip(),
-                                "timestamp": str(record.get("timestamp", "")).strip(),
-                                "container": str(record.get("container", "")).strip(),
-                                "box_seq": str(record.get("box_seq", "")).strip(),
-                                "status": str(record.get("status", "")).strip()
-                            })
-                        else:
-                            print(f"[遷入條碼列表] 條碼 {barcode_normalized} 在站點 {station_id_upper} 已有遷出記錄，跳過")
-            
-            # 按時間戳記排序（由早到晚）
-            inbound_barcodes.sort(key=lambda x: x.get("timestamp", ""), reverse=False)
-            
-            return inbound_barcodes
-            
-        except Exception as e:
-            print(f"查詢站點遷入條碼失敗：{e}")
-            return []
+        items = self._cache().station_wip(station_id, offset, limit)
+        return [inbound_barcode_item(barcode, record) for barcode, record in items]
+    
+    def count_inbound_barcodes_at_station(self, station_id: str) -> int:
+        """指定站點尚未遷出的遷入條碼數量"""
+        return self._cache().station_wip_count(station_id)
+
+
+
+# 全域單例實例（第一次存取 sheet_service 時才建立，僅匯入 SheetService 類別不會連線）
+_sheet_service: Optional[SheetService] = None
+_sheet_service_lock = threading.Lock()
+
+
+def get_sheet_service() -> SheetService:
+    """取得全域 SheetService 實例（第一次呼叫時建立，首次同步在背景進行）"""
+    global _sheet_service
+    with _sheet_service_lock:
+        if _sheet_service is None:
+            _sheet_service = SheetService()
+        return _sheet_service
 
 
-# 全域單例實例
-sheet_service = SheetService()
+def __getattr__(name):
+    if name == "sheet_service":
+        return get_sheet_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -0,0 +1,162 @@
+"""
+Google Sheets 非同步呼叫模組
+gspread 為同步 HTTP 呼叫，直接在 async 端點中呼叫會阻塞整個事件循環；
+此模組將 SheetService 的呼叫放到有上限的線程池中執行，並為每次呼叫設定逾時；
+只讀取緩存的呼叫使用另一個線程池，不會被等待配額的 Google Sheets 呼叫佔滿
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from services.config_loader import config_loader
+from services.sheet_quota import caller_deadline
+
+# 預設線程池大小與單次呼叫逾時（秒），可在 settings.ini 的 [SheetIO] 區段設定
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_LOCAL_WORKERS = 8
+DEFAULT_TIMEOUT = 30.0
+
+
+class SheetIOTimeout(Exception):
+    """Google Sheets 呼叫逾時"""
+
+    def __init__(self, func_name: str, timeout: float):
+        self.func_name = func_name
+        self.timeout = timeout
+        super().__init__(f"{func_name} 執行超過 {timeout} 秒")
+
+
+class SheetIO:
+    """
+    Google Sheets 非同步呼叫器
+
+    呼叫在有上限的線程池中執行，事件循環只等待結果，不會被阻塞：
+    不同站點的同時掃描可以並行處理，不再互相排隊。
+    - run：會呼叫 Google Sheets API 的呼叫（可能等待配額）
+    - run_local：只讀取緩存或本機資料的呼叫，使用另一個線程池
+    - run_write：非冪等寫入（寫入本機日誌），使用本機線程池且不設逾時
+    逾時後端點立即返回錯誤；已在線程中執行的呼叫無法中斷，會在背景完成。
+    因此非冪等寫入不設逾時，否則前端在逾時後重試會重複寫入。
+    逾時的截止時間在提交時計算並交給配額排程（caller_deadline）：
+    等待配額或退避會超過截止時間時，線程中的呼叫也會放棄，不會在端點返回後繼續佔用線程
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        default_timeout: float = DEFAULT_TIMEOUT,
+        local_workers: int = DEFAULT_LOCAL_WORKERS
+    ):
+        """
+        Args:
+            max_workers: 線程池大小（同時進行的 Google Sheets 呼叫上限）
+            default_timeout: 預設單次呼叫逾時（秒）
+            local_workers: 本機線程池大小（同時進行的緩存查詢與本機寫入上限）
+        """
+        self.max_workers = max_workers
+        self.local_workers = local_workers
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheet-io")
+        self._local_executor = ThreadPoolExecutor(max_workers=local_workers, thread_name_prefix="sheet-local")
+        self._lock = threading.Lock()
+        self._in_flight = {"sheets": 0, "local": 0}
+        self._timeout_count = 0
+
+    @classmethod
+    def from_config(cls) -> "SheetIO":
+        """從 settings.ini 的 [SheetIO] 區段讀取設定"""
+        max_workers = int(config_loader.get_value("settings", "SheetIO", "max_workers", str(DEFAULT_MAX_WORKERS)))
+        timeout = float(config_loader.get_value("settings", "SheetIO", "timeout", str(DEFAULT_TIMEOUT)))
+        local_workers = int(config_loader.get_value("settings", "SheetIO", "local_workers", str(DEFAULT_LOCAL_WORKERS)))
+        return cls(max_workers=max_workers, default_timeout=timeout, local_workers=local_workers)
+
+    def _call(self, pool: str, deadline: Optional[float], func: Callable, args: tuple, kwargs: Dict) -> Any:
+        with self._lock:
+            self._in_flight[pool] += 1
+        try:
+            with caller_deadline(deadline):
+                return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight[pool] -= 1
+
+    async def _run(self, pool: str, func: Callable, args: tuple, kwargs: Dict, timeout: Optional[float]) -> Any:
+        executor = self._executor if pool == "sheets" else self._local_executor
+        # 截止時間包含在線程池中排隊的時間
+        deadline = None if timeout is None else time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, functools.partial(self._call, pool, deadline, func, args, kwargs))
+        if timeout is None:
+            return await future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeout_count += 1
+            func_name = getattr(func, "__name__", repr(func))
+            print(f"[Sheets 呼叫] {func_name} 逾時（{timeout} 秒）")
+            raise SheetIOTimeout(func_name, timeout)
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在 Google Sheets 線程池中執行同步函式，並等待結果
+
+        Args:
+            func: 同步函式（例如：sheet_service.force_sync）
+            *args: 函式參數
+            timeout: 逾時秒數（None 使用預設值）
+            **kwargs: 函式關鍵字參數
+
+        Returns:
+            函式返回值
+
+        Raises:
+            SheetIOTimeout: 超過逾時時間仍未完成
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        return await self._run("sheets", func, args, kwargs, timeout)
+
+    async def run_local(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在本機線程池中執行只讀取緩存或本機資料的同步函式（例如：log_storage.get_order_trace），並等待結果
+
+        Raises:
+            SheetIOTimeout: 超過逾時時間仍未完成（例如：緩存首次載入尚未完成）
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        return await self._run("local", func, args, kwargs, timeout)
+
+    async def run_write(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        在本機線程池中執行非冪等寫入（例如：log_storage.submit_logs），等待完成，不設逾時：
+        逾時無法取消已開始的寫入，前端再重試會重複寫入同一批記錄
+        """
+        return await self._run("local", func, args, kwargs, None)
+
+    def status(self) -> Dict:
+        """
+        取得線程池狀態
+
+        Returns:
+            狀態字典：線程池大小、執行中的呼叫數（Google Sheets / 本機）、累計逾時次數
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "local_workers": self.local_workers,
+                "in_flight": self._in_flight["sheets"],
+                "local_in_flight": self._in_flight["local"],
+                "timeout_count": self._timeout_count
+            }
+
+    def shutdown(self):
+        """關閉線程池（不等待執行中的呼叫）"""
+        self._executor.shutdown(wait=False)
+        self._local_executor.shutdown(wait=False)
+
+
+# 建立全域實例
+sheet_io = SheetIO.from_config()
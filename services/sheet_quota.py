@@ -0,0 +1,318 @@
+"""
+Google Sheets API 配額排程模組
+所有 Google Sheets 呼叫都經過此模組：依每分鐘讀取/寫入配額以令牌桶限流，
+掃描寫入等互動呼叫優先於背景同步，遇到 429/5xx 時以指數退避（加上隨機抖動）重試
+（寫入只在 429 時重試：5xx 可能在伺服器已寫入後才返回，重試追加會產生重複的列）
+互動呼叫可帶有呼叫端的截止時間（caller_deadline），等待配額或退避會超過截止時間時立即放棄
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from services.config_loader import config_loader
+
+# 呼叫類型
+READ = "read"
+WRITE = "write"
+
+# 呼叫優先級（數字越小越優先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# 預設配額（Google Sheets API 每位使用者每分鐘 60 次讀取、60 次寫入），可在 settings.ini 的 [SheetQuota] 區段設定
+DEFAULT_READ_PER_MINUTE = 60
+DEFAULT_WRITE_PER_MINUTE = 60
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 32.0
+
+# 保留給互動呼叫的令牌比例（背景呼叫不會用掉最後這部分配額）
+INTERACTIVE_RESERVE_RATIO = 0.2
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 目前線程的呼叫截止時間（time.monotonic() 時刻）
+_deadline_local = threading.local()
+
+
+class SheetQuotaDeadlineExceeded(Exception):
+    """等待配額或重試退避會超過呼叫端的截止時間（呼叫端已放棄等待，不再繼續佔用線程與配額）"""
+
+    def __init__(self, wait: float, remaining: float):
+        self.wait = wait
+        self.remaining = remaining
+        super().__init__(f"Google Sheets 配額不足：需等待 {wait:.1f} 秒，超過剩餘時間 {max(remaining, 0.0):.1f} 秒")
+
+
+@contextmanager
+def caller_deadline(deadline: Optional[float]):
+    """
+    在此區塊內（目前線程）的 Google Sheets 呼叫以 deadline 為截止時間
+
+    Args:
+        deadline: time.monotonic() 時刻；None 表示不限時
+    """
+    previous = getattr(_deadline_local, "deadline", None)
+    _deadline_local.deadline = deadline
+    try:
+        yield
+    finally:
+        _deadline_local.deadline = previous
+
+
+def current_deadline() -> Optional[float]:
+    """目前線程的呼叫截止時間（None 表示不限時）"""
+    return getattr(_deadline_local, "deadline", None)
+
+
+def _check_deadline(wait: float, deadline: Optional[float]):
+    """等待 wait 秒會超過截止時間時拋出 SheetQuotaDeadlineExceeded"""
+    if deadline is None:
+        return
+    remaining = deadline - time.monotonic()
+    if wait > remaining:
+        raise SheetQuotaDeadlineExceeded(wait, remaining)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """檢查是否為 Google Sheets API 速率限制錯誤（含本機等待配額逾時）"""
+    if isinstance(error, SheetQuotaDeadlineExceeded) or _status_code(error) == 429:
+        return True
+    error_str = str(error)
+    return '429' in error_str or 'Quota exceeded' in error_str or 'RATE_LIMIT_EXCEEDED' in error_str
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """檢查錯誤是否值得重試（速率限制或伺服器暫時性錯誤）"""
+    if is_rate_limit_error(error):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """取得 gspread APIError 的 HTTP 狀態碼（其他例外返回 None）"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class TokenBucket:
+    """
+    令牌桶（線程安全）
+
+    容量為每分鐘配額，以固定速率補充。互動呼叫可以用完所有令牌；
+    背景呼叫只能使用保留部分以上的令牌，且有互動呼叫在等待時讓出
+    """
+
+    def __init__(self, per_minute: int, reserve_ratio: float = INTERACTIVE_RESERVE_RATIO):
+        """
+        Args:
+            per_minute: 每分鐘配額
+            reserve_ratio: 保留給互動呼叫的令牌比例
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.reserve = self.capacity * reserve_ratio
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _required(self, priority: int) -> float:
+        if priority == PRIORITY_INTERACTIVE:
+            return 1.0
+        return 1.0 + self.reserve
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None):
+        """
+        取得一個令牌（不足時阻塞等待）
+
+        Args:
+            priority: 呼叫優先級
+            deadline: 截止時間（time.monotonic() 時刻）；None 表示不限時
+
+        Raises:
+            SheetQuotaDeadlineExceeded: 令牌補充所需時間會超過截止時間
+        """
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    required = self._required(priority)
+                    blocked = priority == PRIORITY_BACKGROUND and self._waiting[PRIORITY_INTERACTIVE] > 0
+                    if not blocked and self._tokens >= required:
+                        self._tokens -= 1.0
+                        return
+                    wait = max((required - self._tokens) / self.rate, 0.01)
+                    _check_deadline(0.0 if blocked else wait, deadline)
+                    if deadline is not None:
+                        wait = min(wait, max(deadline - time.monotonic(), 0.01))
+                    self._condition.wait(wait)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def drain(self):
+        """收到 429 時清空令牌（伺服器端的配額已用完，本機計數與實際不一致）"""
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+    def status(self) -> Dict:
+        """取得令牌桶狀態"""
+        with self._condition:
+            self._refill()
+            return {
+                "per_minute": int(self.capacity),
+                "available": round(self._tokens, 2),
+                "headroom": round(max(self._tokens, 0.0) / self.capacity, 3),
+                "waiting_interactive": self._waiting[PRIORITY_INTERACTIVE],
+                "waiting_background": self._waiting[PRIORITY_BACKGROUND]
+            }
+
+
+class SheetQuotaScheduler:
+    """
+    Google Sheets API 呼叫排程器
+
+    讀取與寫入各自使用一個令牌桶。呼叫的優先級由目前線程決定：
+    背景線程（定期同步、寫入日誌提交）以 background() 標記，其餘呼叫視為互動呼叫
+    """
+
+    def __init__(
+        self,
+        read_per_minute: int = DEFAULT_READ_PER_MINUTE,
+        write_per_minute: int = DEFAULT_WRITE_PER_MINUTE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY
+    ):
+        """
+        Args:
+            read_per_minute: 每分鐘讀取配額
+            write_per_minute: 每分鐘寫入配額
+            max_retries: 429/5xx 時的最多重試次數
+            base_delay: 第一次重試的等待時間（秒）
+            max_delay: 重試等待時間上限（秒）
+        """
+        self.buckets = {READ: TokenBucket(read_per_minute), WRITE: TokenBucket(write_per_minute)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._calls = {READ: 0, WRITE: 0}
+        self._retries = {READ: 0, WRITE: 0}
+        self._throttled = {READ: 0, WRITE: 0}
+
+    @classmethod
+    def from_config(cls) -> "SheetQuotaScheduler":
+        """從 settings.ini 的 [SheetQuota] 區段讀取設定"""
+        def get(key, default):
+            return config_loader.get_value("settings", "SheetQuota", key, str(default))
+
+        return cls(
+            read_per_minute=int(get("read_per_minute", DEFAULT_READ_PER_MINUTE)),
+            write_per_minute=int(get("write_per_minute", DEFAULT_WRITE_PER_MINUTE)),
+            max_retries=int(get("max_retries", DEFAULT_MAX_RETRIES)),
+            base_delay=float(get("base_delay", DEFAULT_BASE_DELAY)),
+            max_delay=float(get("max_delay", DEFAULT_MAX_DELAY))
+        )
+
+    @contextmanager
+    def background(self):
+        """在此區塊內（目前線程）的呼叫以背景優先級執行"""
+        previous = getattr(self._local, "priority", PRIORITY_INTERACTIVE)
+        self._local.priority = PRIORITY_BACKGROUND
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self) -> int:
+        """目前線程的呼叫優先級"""
+        return getattr(self._local, "priority", PRIORITY_INTERACTIVE)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """第 attempt 次重試的等待時間（指數退避 + 完全隨機抖動）"""
+        return random.uniform(0, min(self.base_delay * (2 ** attempt), self.max_delay))
+
+    def call(self, kind: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        取得配額後執行 Google Sheets 呼叫，遇到 429/5xx 時退避重試
+
+        WRITE 呼叫（append_rows 等不具冪等性的寫入）只在 429 時重試：速率限制表示請求未被處理，
+        5xx 則可能在伺服器已寫入後才返回，重試會追加重複的列，因此直接拋出交由呼叫端處理
+
+        目前線程設有截止時間（caller_deadline）時，等待令牌或退避會超過截止時間就拋出
+        SheetQuotaDeadlineExceeded，不在呼叫端逾時返回後繼續於背景重試
+
+        Args:
+            kind: 呼叫類型（READ 或 WRITE）
+            func: gspread 方法（例如：worksheet.append_rows）
+            *args, **kwargs: 呼叫參數
+
+        Returns:
+            呼叫的返回值
+
+        Raises:
+            SheetQuotaDeadlineExceeded: 等待配額或退避會超過截止時間
+            最後一次呼叫的例外（不可重試的錯誤立即拋出）
+        """
+        bucket = self.buckets[kind]
+        priority = self.current_priority()
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            bucket.acquire(priority, deadline)
+            with self._stats_lock:
+                self._calls[kind] += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                retryable = is_rate_limit_error(e) if kind == WRITE else is_retryable_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                if is_rate_limit_error(e):
+                    bucket.drain()
+                    with self._stats_lock:
+                        self._throttled[kind] += 1
+                delay = self._backoff_delay(attempt)
+                try:
+                    _check_deadline(delay, deadline)
+                except SheetQuotaDeadlineExceeded as exceeded:
+                    raise exceeded from e
+                attempt += 1
+                with self._stats_lock:
+                    self._retries[kind] += 1
+                func_name = getattr(func, "__name__", repr(func))
+                print(f"[配額排程] {func_name} 失敗（{e}），{delay:.1f} 秒後第 {attempt} 次重試")
+                time.sleep(delay)
+
+    def status(self) -> Dict:
+        """
+        取得配額狀態
+
+        Returns:
+            狀態字典：各類型的配額、剩餘令牌、剩餘比例（headroom）、等待數、呼叫/重試/限流次數
+        """
+        result = {}
+        with self._stats_lock:
+            counters = {kind: (self._calls[kind], self._retries[kind], self._throttled[kind]) for kind in self.buckets}
+        for kind, bucket in self.buckets.items():
+            calls, retries, throttled = counters[kind]
+            result[kind] = {
+                **bucket.status(),
+                "calls": calls,
+                "retries": retries,
+                "throttled": throttled
+            }
+        return result
+
@@ -0,0 +1,155 @@
+"""
+Google Sheets 複寫模組
+本機存儲（SQLite）為主要資料來源時，由背景線程將新記錄依序批量追加到 Logs 工作表；
+已複寫到的位置（高水位）存於本機資料庫，程序重啟後從該位置繼續
+"""
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from services.timestamps import timestamp_epoch
+
+# 高水位在 replication_state 表中的名稱
+HIGH_WATER_MARK = "sheets_high_water_mark"
+
+
+class SheetReplicator:
+    """
+    Google Sheets 複寫器
+
+    每次讀取高水位之後的一批記錄，以一次 append_rows 寫入工作表，成功後才推進高水位。
+    失敗時以指數退避（加上隨機抖動）重試同一批，不會跳過，因此工作表中的順序與本機一致。
+    程序在寫入成功與推進高水位之間中斷時，該批會在重啟後再寫入一次（至少一次）
+    """
+
+    def __init__(
+        self,
+        storage,
+        append_fn: Callable[[List[Dict]], None],
+        batch_size: int = 200,
+        interval: float = 2.0,
+        max_retry_delay: float = 60.0
+    ):
+        """
+        Args:
+            storage: 本機存儲（需提供 read_since、latest_id、get_state、set_state）
+            append_fn: 追加函式，接收一批記錄，失敗時拋出例外（例如：SheetService.append_records）
+            batch_size: 每批最多複寫的記錄數
+            interval: 沒有新記錄時的檢查間隔（秒）
+            max_retry_delay: 重試退避的最長間隔（秒）
+        """
+        self.storage = storage
+        self._append_fn = append_fn
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_retry_delay = max_retry_delay
+
+        self._high_water_mark = storage.get_state(HIGH_WATER_MARK, 0)
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._retry_count = 0
+        self._next_attempt_time = 0.0
+        self._last_error: Optional[str] = None
+        self._last_replicated_at: Optional[float] = None
+        self._replicated_count = 0
+
+    def notify(self):
+        """通知有新記錄寫入（喚醒背景線程）"""
+        self._wakeup.set()
+
+    def replicate_once(self) -> bool:
+        """
+        複寫一批記錄
+
+        Returns:
+            是否有記錄且複寫成功
+        """
+        batch = self.storage.read_since(self._high_water_mark, self._batch_size)
+        if not batch:
+            return False
+
+        try:
+            self._append_fn([record for _, record in batch])
+        except Exception as e:
+            self._retry_count += 1
+            self._last_error = str(e)
+            # 指數退避（加上隨機抖動）
+            delay = min(self._interval * (2 ** self._retry_count), self._max_retry_delay)
+            self._next_attempt_time = time.time() + delay * random.uniform(0.5, 1.0)
+            print(f"[複寫] 寫入 {len(batch)} 筆記錄到 Google Sheets 失敗（第 {self._retry_count} 次）：{e}")
+            return False
+
+        last_id = batch[-1][0]
+        self.storage.set_state(HIGH_WATER_MARK, last_id)
+        self._high_water_mark = last_id
+        self._replicated_count += len(batch)
+        self._retry_count = 0
+        self._next_attempt_time = 0.0
+        self._last_error = None
+        self._last_replicated_at = time.time()
+        print(f"[複寫] 已寫入 {len(batch)} 筆記錄到 Google Sheets（高水位 {last_id}）")
+        return True
+
+    def start(self):
+        """啟動背景複寫線程"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def replicate_worker():
+            while not self._stop:
+                self._wakeup.wait(self._interval)
+                self._wakeup.clear()
+                if self._stop:
+                    break
+                if self._next_attempt_time - time.time() > 0:
+                    continue
+                try:
+                    # 連續複寫直到追上或失敗
+                    while not self._stop and self.replicate_once():
+                        pass
+                except Exception as e:
+                    print(f"[複寫] 讀取本機記錄失敗：{e}")
+
+        self._stop = False
+        self._thread = threading.Thread(target=replicate_worker, daemon=True)
+        self._thread.start()
+        print(f"[複寫] 已啟動背景複寫線程（高水位 {self._high_water_mark}）")
+
+    def stop(self, timeout: float = 5.0):
+        """停止背景複寫線程"""
+        self._stop = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def _oldest_pending_age(self) -> Optional[float]:
+        """最舊未複寫記錄的時間差（秒，依寫入時解析的時間戳記秒數計算；無法解析時返回 None）"""
+        written = self.storage.epoch_after(self._high_water_mark)
+        if written is None:
+            return None
+        return round(max(timestamp_epoch(datetime.now()) - written, 0.0), 3)
+
+    def status(self) -> Dict:
+        """
+        取得複寫狀態
+
+        Returns:
+            狀態字典：高水位、最新記錄 id、落後筆數與時間、重試狀態等
+        """
+        latest_id = self.storage.latest_id()
+        now = time.time()
+        return {
+            "high_water_mark": self._high_water_mark,
+            "latest_id": latest_id,
+            "lag_rows": max(latest_id - self._high_water_mark, 0),
+            "lag_seconds": self._oldest_pending_age(),
+            "replicated_count": self._replicated_count,
+            "retry_count": self._retry_count,
+            "next_retry_in": round(max(self._next_attempt_time - now, 0), 3) if self._retry_count else None,
+            "last_error": self._last_error,
+            "last_replicated_at": self._last_replicated_at,
+            "running": bool(self._thread and self._thread.is_alive())
+        }
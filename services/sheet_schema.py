@@ -0,0 +1,171 @@
+"""
+工作表欄位配置
+負責 Logs 工作表標題列與欄位名的對應，以及記錄與工作表列之間的轉換
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# 工作表欄位順序（內部使用，英文欄位名）
+COLUMNS = [
+    "timestamp",
+    "action",
+    "operator",
+    "order",
+    "process",
+    "sku",
+    "container",
+    "box_seq",
+    "qty",
+    "status",
+    "cycle_time",
+    "scanned_barcode",
+    "new_barcode"
+]
+
+# 工作表欄位標題（顯示用，包含中文說明）
+COLUMN_HEADERS = [
+    "timestamp (時間戳記)",
+    "action (動作)",
+    "operator (操作員)",
+    "order (工單號)",
+    "process (製程站點)",
+    "sku (產品SKU)",
+    "container (容器代號)",
+    "box_seq (箱號)",
+    "qty (數量)",
+    "status (貨態)",
+    "cycle_time (工時)",
+    "scanned_barcode (掃描條碼)",
+    "new_barcode (新條碼)"
+]
+
+# 需要轉換為大寫的欄位（字串欄位）
+UPPERCASE_FIELDS = {"action", "operator", "order", "process", "sku", "container",
+                    "box_seq", "status", "scanned_barcode", "new_barcode"}
+
+
+def format_cell(column_name: Optional[str], value) -> str:
+    """
+    將欄位值轉換為寫入工作表的字串格式
+
+    Args:
+        column_name: 欄位名（例如：order）
+        value: 原始值
+
+    Returns:
+        轉換後的字串（日期格式化，字串欄位統一轉大寫）
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+
+    value = str(value)
+    # 如果是需要轉換為大寫的欄位，統一轉換
+    if column_name and column_name in UPPERCASE_FIELDS:
+        # 特殊處理：new_barcode 欄位如果是 URL，只轉換條碼部分，保留 domain 為原始大小寫
+        if column_name == "new_barcode" and "/b=" in value:
+            domain_part, barcode_part = value.split("/b=", 1)
+            return f"{domain_part}/b={barcode_part.upper()}"
+        return value.upper()
+    return value
+
+
+def to_cache_record(log_data: Dict) -> Dict[str, str]:
+    """將寫入的記錄資料轉換為緩存記錄格式（與寫入工作表的值一致）"""
+    return {col: format_cell(col, log_data.get(col, "")) for col in COLUMNS}
+
+
+def is_header_row(headers: List[str]) -> bool:
+    """檢查第一行是否為標題欄（第一個單元格包含標題欄的關鍵字）"""
+    first_cell = headers[0] if headers else ""
+    if not first_cell:
+        return False
+    header_keywords = ["timestamp", "時間戳記", "action", "動作"]
+    first_cell_lower = str(first_cell).lower()
+    return any(keyword in first_cell_lower for keyword in header_keywords)
+
+
+def resolve_columns(headers: List[str]) -> List[str]:
+    """
+    將工作表標題轉換為欄位名列表（例如："order (工單號)" -> "order"）
+
+    Args:
+        headers: 工作表第一行的標題
+
+    Returns:
+        與標題順序相同的欄位名列表
+    """
+    columns = []
+    for i, header in enumerate(headers):
+        header = str(header)
+        column_name = header.split("(")[0].strip() if "(" in header else header.strip()
+        # 如果提取的欄位名不在 COLUMNS 中，使用索引對應的 COLUMNS
+        if column_name not in COLUMNS and i < len(COLUMNS):
+            column_name = COLUMNS[i]
+        columns.append(column_name)
+    return columns
+
+
+class SheetSchema:
+    """
+    工作表欄位配置（由標題列解析而來）
+
+    解析一次後可重複用於寫入（記錄 -> 列）、同步（列 -> 記錄）和欄位定位
+    """
+
+    def __init__(self, headers: List[str]):
+        self.headers: List[str] = list(headers)
+        self.columns: List[str] = resolve_columns(self.headers)
+        self._column_index: Dict[str, int] = {}
+        for i, column_name in enumerate(self.columns):
+            self._column_index.setdefault(column_name, i + 1)
+
+    @classmethod
+    def default(cls) -> "SheetSchema":
+        """預設欄位配置（COLUMN_HEADERS）"""
+        return cls(COLUMN_HEADERS)
+
+    @property
+    def width(self) -> int:
+        """欄位數"""
+        return len(self.columns)
+
+    def column_index(self, column_name: str) -> Optional[int]:
+        """
+        取得欄位在工作表中的欄號
+
+        Args:
+            column_name: 欄位名（例如：scanned_barcode）
+
+        Returns:
+            欄號（從 1 開始），找不到則返回 None
+        """
+        return self._column_index.get(column_name)
+
+    def to_row(self, log_data: Dict) -> List[str]:
+        """
+        將記錄資料轉換為工作表的一列（按照工作表中的實際欄位順序）
+
+        Args:
+            log_data: 記錄資料字典
+
+        Returns:
+            單元格值列表
+        """
+        return [format_cell(column_name, log_data.get(column_name, "")) for column_name in self.columns]
+
+    def to_record(self, row: List) -> Dict[str, str]:
+        """
+        將工作表的一列轉換為緩存記錄
+
+        Args:
+            row: 單元格值列表
+
+        Returns:
+            記錄字典（欄位名 -> 字串值）
+        """
+        return {
+            column_name: str(row[i]) if i < len(row) and row[i] is not None else ""
+            for i, column_name in enumerate(self.columns)
+        }
@@ -0,0 +1,368 @@
+"""
+SQLite 記錄存儲
+以本機 SQLite 資料庫（WAL 模式）保存掃描記錄，不依賴網路，可離線運作；
+條碼、工單、站點的查詢皆使用索引
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from services.analytics import DIMENSIONS, LogColumns
+from services.log_store import normalize_barcode, normalize_order, normalize_station
+from services.order_trace import OrderTrace, OrderTraceCache
+from services.timestamps import timestamp_epoch
+from services.sheet_schema import COLUMNS, to_cache_record
+from services.storage_base import LogStorage, inbound_barcode_item
+
+# SQLite 單一查詢的參數上限（舊版 SQLite 為 999）
+MAX_QUERY_PARAMS = 500
+
+_COLUMN_LIST = ", ".join(f'"{col}"' for col in COLUMNS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {", ".join(f'"{col}" TEXT NOT NULL DEFAULT ' + "''" for col in COLUMNS)},
+    scanned_key TEXT NOT NULL DEFAULT '',
+    new_key TEXT NOT NULL DEFAULT '',
+    order_key TEXT NOT NULL DEFAULT '',
+    station_key TEXT NOT NULL DEFAULT '',
+    action_key TEXT NOT NULL DEFAULT '',
+    ts_epoch REAL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_scanned ON logs (scanned_key, station_key, action_key);
+CREATE INDEX IF NOT EXISTS idx_logs_new ON logs (new_key);
+CREATE INDEX IF NOT EXISTS idx_logs_order ON logs (order_key);
+CREATE INDEX IF NOT EXISTS idx_logs_station ON logs (station_key, action_key);
+CREATE TABLE IF NOT EXISTS replication_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_INSERT = (
+    f"INSERT INTO logs ({_COLUMN_LIST}, scanned_key, new_key, order_key, station_key, action_key, ts_epoch) "
+    f"VALUES ({', '.join('?' for _ in COLUMNS)}, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class SQLiteLogStorage(LogStorage):
+    """
+    SQLite 記錄存儲
+
+    每個線程使用各自的連線（WAL 模式下讀取不會被寫入阻塞），所有連線都會登記，關閉時一併關閉。
+    標準化後的條碼、工單、站點、動作在寫入時計算一次並存入索引欄位；
+    時間戳記同樣在寫入時解析為秒數（ts_epoch），追溯彙總與分析直接讀取，不再解析字串。
+    追溯彙總與欄式存儲在鎖外由資料庫建立，只有補上建立期間新增的記錄與發布時持有鎖，不會長時間阻塞寫入
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 資料庫檔案路徑（":memory:" 僅供測試，只能在單一線程使用）
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._generation = 0  # close() 後遞增，各線程的舊連線失效
+        # 複寫到 Google Sheets 的背景線程（未啟用時為 None，見 SheetReplicator）
+        self.replicator = None
+        # 工單追溯彙總（查詢過的工單隨寫入增量更新）與分析用的欄式存儲（第一次分析時載入）
+        self._traces = OrderTraceCache()
+        self._columns: Optional[LogColumns] = None
+        self._aggregates_lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._migrate(conn)
+        print(f"[SQLite 存儲] 已開啟資料庫：{path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """取得目前線程的資料庫連線"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            # 連線只在建立它的線程使用；關閉時由呼叫 close() 的線程關閉，因此不檢查線程
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.append(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """舊版資料庫沒有 ts_epoch 欄位時新增並回填"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(logs)")}
+        if "ts_epoch" in columns:
+            return
+        with conn:
+            conn.execute("ALTER TABLE logs ADD COLUMN ts_epoch REAL")
+            rows = conn.execute("SELECT id, timestamp FROM logs").fetchall()
+            conn.executemany("UPDATE logs SET ts_epoch = ? WHERE id = ?",
+                             [(timestamp_epoch(row["timestamp"]), row["id"]) for row in rows])
+        print(f"[SQLite 存儲] 已回填 {len(rows)} 筆記錄的時間戳記秒數")
+
+    @staticmethod
+    def _to_row(record: Dict[str, str], epoch: Optional[float]) -> tuple:
+        """緩存記錄 -> 資料表一列（附標準化索引欄位與時間戳記秒數）"""
+        return tuple(record[col] for col in COLUMNS) + (
+            normalize_barcode(record["scanned_barcode"]),
+            normalize_barcode(record["new_barcode"]),
+            normalize_order(record["order"]),
+            normalize_station(record["process"]),
+            normalize_station(record["action"]),
+            epoch,
+        )
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict[str, str]:
+        return {col: row[col] for col in COLUMNS}
+
+    def _query(self, where: str, params: tuple, limit: Optional[int] = None) -> List[Dict]:
+        sql = f"SELECT {_COLUMN_LIST} FROM logs WHERE {where} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = params + (limit,)
+        return [self._to_record(row) for row in self._connection().execute(sql, params)]
+
+    def _query_parsed(self, where: str, params: tuple) -> List[tuple]:
+        """查詢記錄與寫入時解析好的時間戳記秒數，返回 [(記錄, 秒數)]"""
+        sql = f"SELECT {_COLUMN_LIST}, ts_epoch FROM logs WHERE {where} ORDER BY id"
+        return [(self._to_record(row), row["ts_epoch"]) for row in self._connection().execute(sql, params)]
+
+    def _exists(self, where: str, params: tuple) -> bool:
+        row = self._connection().execute(f"SELECT 1 FROM logs WHERE {where} LIMIT 1", params).fetchone()
+        return row is not None
+
+    def write_logs_batch(self, log_data_list: list) -> tuple:
+        """
+        批量寫入多筆記錄（單一交易）
+
+        Returns:
+            Tuple[int, list]: (成功筆數, 失敗的記錄索引列表)
+        """
+        if not log_data_list:
+            return (0, [])
+
+        records = [to_cache_record(log_data) for log_data in log_data_list]
+        epochs = [timestamp_epoch(record["timestamp"]) for record in records]
+        rows = [self._to_row(record, epoch) for record, epoch in zip(records, epochs)]
+        conn = self._connection()
+        # 提交與更新追溯彙總、欄式存儲在同一把鎖內完成，避免同時建立的彙總重複計入這批記錄
+        with self._aggregates_lock:
+            try:
+                with conn:
+                    conn.executemany(_INSERT, rows)
+            except sqlite3.Error as e:
+                print(f"寫入 SQLite 失敗：{e}")
+                return (0, list(range(len(log_data_list))))
+            for record, epoch in zip(records, epochs):
+                self._traces.on_append(normalize_order(record.get("order")), record, epoch)
+                if self._columns is not None:
+                    self._columns.append_parsed(record, epoch)
+        if self.replicator is not None:
+            self.replicator.notify()
+        return (len(rows), [])
+
+    def get_logs_by_barcode(self, barcode: str, limit: int = 100) -> list:
+        """根據條碼查詢記錄（scanned_barcode 或 new_barcode 符合）"""
+        key = normalize_barcode(barcode)
+        if not key:
+            return []
+        return self._query("scanned_key = ? OR new_key = ?", (key, key), limit)
+
+    def get_logs_by_order(self, order: str, limit: int = 100, max_staleness: Optional[float] = None) -> list:
+        """根據工單號查詢記錄（本機資料庫即為最新資料，max_staleness 不使用）"""
+        key = normalize_order(order)
+        if not key:
+            return []
+        return self._query("order_key = ?", (key,), limit)
+
+    def get_order_trace(self, order: str) -> Dict:
+        """取得工單的追溯彙總（第一次查詢時由資料庫建立，之後隨寫入增量更新）"""
+        key = normalize_order(order)
+        if not key:
+            return super().get_order_trace(order)
+        with self._aggregates_lock:
+            result = self._traces.peek(key)
+        if result is not None:
+            return result
+
+        # 在鎖外讀取 latest_id 以前的記錄建立彙總（寫入在鎖內提交，latest_id 以前的記錄都已提交）
+        latest = self.latest_id()
+        trace = OrderTrace()
+        for record, epoch in self._query_parsed("order_key = ? AND id <= ?", (key, latest)):
+            trace.add_parsed(record, epoch)
+        with self._aggregates_lock:
+            # 建立期間其他線程可能已發布（之後的寫入已更新該彙總）
+            result = self._traces.peek(key)
+            if result is not None:
+                return result
+            for record, epoch in self._query_parsed("order_key = ? AND id > ?", (key, latest)):
+                trace.add_parsed(record, epoch)
+            self._traces.put(key, trace)
+            return trace.result()
+
+    def get_yield_analytics(self, dimensions=DIMENSIONS, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """依工單、站點、SKU、操作員分組統計良率與產能（欄式存儲第一次使用時由資料庫載入，之後隨寫入追加）"""
+        columns = self._columns
+        if columns is None:
+            # 在鎖外載入 latest_id 以前的記錄，鎖內只補上載入期間新增的記錄並發布
+            latest = self.latest_id()
+            built = LogColumns()
+            for record, epoch in self._query_parsed("id <= ?", (latest,)):
+                built.append_parsed(record, epoch)
+            with self._aggregates_lock:
+                if self._columns is None:
+                    for record, epoch in self._query_parsed("id > ?", (latest,)):
+                        built.append_parsed(record, epoch)
+                    self._columns = built
+                columns = self._columns
+        return columns.summarize(dimensions, start, end)
+
+    def find_by_station(self, station_id: str, action: str) -> List[Dict]:
+        """查詢指定站點、指定動作的所有記錄"""
+        return self._query("station_key = ? AND action_key = ?",
+                           (normalize_station(station_id), normalize_station(action)))
+
+    def has_inbound_record_at_station(self, barcode: str, station_id: str, strict: bool = False) -> bool:
+        """檢查條碼在指定站點是否有遷入（IN）記錄（本機資料庫即為最新資料，strict 不使用）"""
+        return self._exists("scanned_key = ? AND station_key = ? AND action_key = 'IN'",
+                            (normalize_barcode(barcode), normalize_station(station_id)))
+
+    def has_outbound_record_at_station(self, barcode: str, station_id: str) -> bool:
+        """檢查條碼在指定站點是否有遷出（OUT）記錄"""
+        found = self._exists("scanned_key = ? AND station_key = ? AND action_key = 'OUT'",
+                             (normalize_barcode(barcode), normalize_station(station_id)))
+        if found:
+            print(f"[遷出檢查] 找到匹配：條碼 {normalize_barcode(barcode)} 在站點 {station_id.upper()} 有遷出記錄")
+        return found
+
+    def has_inbound_record_at_other_stations(self, barcode: str, exclude_station_id: str, strict: bool = False) -> bool:
+        """檢查條碼是否在其他站點（排除指定站點）有遷入（IN）記錄"""
+        return self._exists("scanned_key = ? AND station_key != ? AND action_key = 'IN'",
+                            (normalize_barcode(barcode), normalize_station(exclude_station_id)))
+
+    def batch_check_inbound_records(self, barcodes: list, station_id: str, strict: bool = False) -> dict:
+        """
+        批量檢查多個條碼在指定站點是否有遷入（IN）記錄（每批一次查詢）
+
+        Returns:
+            dict: {barcode: bool} 映射
+        """
+        if not barcodes:
+            return {}
+
+        station = normalize_station(station_id)
+        keys = {barcode: normalize_barcode(barcode) for barcode in barcodes}
+        unique_keys = list(set(keys.values()))
+        found = set()
+        conn = self._connection()
+        for start in range(0, len(unique_keys), MAX_QUERY_PARAMS):
+            chunk = unique_keys[start:start + MAX_QUERY_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = conn.execute(
+                f"SELECT DISTINCT scanned_key FROM logs "
+                f"WHERE station_key = ? AND action_key = 'IN' AND scanned_key IN ({placeholders})",
+                (station, *chunk)
+            )
+            found.update(row[0] for row in rows)
+        return {barcode: keys[barcode] in found for barcode in barcodes}
+
+    # 站點在製條碼：每個條碼在該站點的第一筆遷入記錄，且該站點沒有該條碼的遷出記錄
+    _WIP_WHERE = (
+        "l.station_key = ? AND l.action_key = 'IN' AND l.scanned_key != '' "
+        "AND l.id = (SELECT MIN(f.id) FROM logs f WHERE f.scanned_key = l.scanned_key "
+        "AND f.station_key = l.station_key AND f.action_key = 'IN') "
+        "AND NOT EXISTS (SELECT 1 FROM logs o WHERE o.scanned_key = l.scanned_key "
+        "AND o.station_key = l.station_key AND o.action_key = 'OUT')"
+    )
+
+    def get_inbound_barcodes_at_station(self, station_id: str, offset: int = 0, limit: Optional[int] = None) -> list:
+        """
+        查詢指定站點尚未遷出的遷入條碼，依遷入時間由早到晚排序（分頁在資料庫中完成）
+        依寫入時解析的 ts_epoch 排序，不同格式的時間戳記字串也能正確排序；無法解析（NULL）的排在最前面
+        """
+        columns = ", ".join(f'l."{col}"' for col in COLUMNS)
+        sql = f"SELECT l.scanned_key, {columns} FROM logs l WHERE {self._WIP_WHERE} ORDER BY l.ts_epoch, l.id"
+        params = (normalize_station(station_id),)
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += (-1 if limit is None else limit, offset)
+        rows = self._connection().execute(sql, params)
+        return [inbound_barcode_item(row["scanned_key"], self._to_record(row)) for row in rows]
+
+    def count_inbound_barcodes_at_station(self, station_id: str) -> int:
+        """指定站點尚未遷出的遷入條碼數量"""
+        sql = f"SELECT COUNT(*) FROM logs l WHERE {self._WIP_WHERE}"
+        return self._connection().execute(sql, (normalize_station(station_id),)).fetchone()[0]
+
+    def read_since(self, after_id: int, limit: int) -> List[tuple]:
+        """
+        依寫入順序讀取 id 大於 after_id 的記錄（複寫使用）
+
+        Returns:
+            [(id, 記錄)] 列表
+        """
+        rows = self._connection().execute(
+            f"SELECT id, {_COLUMN_LIST} FROM logs WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        )
+        return [(row["id"], self._to_record(row)) for row in rows]
+
+    def epoch_after(self, after_id: int) -> Optional[float]:
+        """id 大於 after_id 的第一筆記錄的時間戳記秒數（沒有記錄或時間戳記無法解析時返回 None）"""
+        row = self._connection().execute(
+            "SELECT ts_epoch FROM logs WHERE id > ? ORDER BY id LIMIT 1", (after_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def latest_id(self) -> int:
+        """最後一筆記錄的 id（沒有記錄時為 0）"""
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+
+    def get_state(self, name: str, default: int = 0) -> int:
+        """讀取持久化的狀態值（例如複寫的高水位）"""
+        row = self._connection().execute("SELECT value FROM replication_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, name: str, value: int):
+        """寫入持久化的狀態值"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO replication_state (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                (name, value)
+            )
+
+    def replication_status(self) -> Dict:
+        """取得複寫狀態（未啟用時 enabled 為 False）"""
+        if self.replicator is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.replicator.status()}
+
+    def count(self) -> int:
+        """記錄總數"""
+        return self._connection().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+    def shutdown(self):
+        """停止複寫線程（尚未複寫的記錄下次啟動時從高水位繼續）並關閉所有線程的連線"""
+        if self.replicator is not None:
+            self.replicator.stop()
+        self.close()
+
+    def close(self):
+        """關閉所有線程的連線（呼叫時其他線程不應正在查詢；之後再查詢會重新開啟連線）"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
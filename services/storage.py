@@ -0,0 +1,126 @@
+"""
+記錄存儲後端選擇
+依 settings.ini 的 [Storage] 區段建立存儲後端：
+- sheets：Google Sheets（預設）
+- sqlite：本機 SQLite 資料庫，可離線運作；replicate_to_sheets = true 時另以背景線程複寫到 Google Sheets
+
+全域實例在第一次使用時才建立（匯入本模組不會連線或讀取資料），
+應用程式啟動時由 main.py 的 lifespan 在背景線程建立
+"""
+import os
+import threading
+from typing import Optional
+
+from services.config_loader import config_loader, BASE_DIR
+from services.storage_base import LogStorage
+
+BACKEND_SHEETS = "sheets"
+BACKEND_SQLITE = "sqlite"
+
+# SQLite 資料庫預設路徑（相對於專案根目錄）
+DEFAULT_SQLITE_PATH = "data/logs.db"
+
+
+def resolve_path(path: str) -> str:
+    """將相對路徑轉換為相對於專案根目錄的絕對路徑"""
+    if os.path.isabs(path) or path == ":memory:":
+        return path
+    return str(BASE_DIR / path)
+
+
+def _start_replication(storage):
+    """本機存儲為主要資料來源時，啟動背景線程將記錄複寫到 Google Sheets"""
+    from services.sheet import SheetService
+    from services.sheet_replicator import SheetReplicator
+
+    sheet = SheetService(replica=True)
+    if not sheet.client or not sheet.sheet_id:
+        print("[複寫] 警告：Google Sheets 客戶端未初始化，不啟動複寫")
+        return
+    storage.replicator = SheetReplicator(storage, sheet.append_records)
+    storage.replicator.start()
+
+
+def create_storage(backend: str = None) -> LogStorage:
+    """
+    建立存儲後端
+
+    Args:
+        backend: 後端名稱（None 表示讀取設定檔）
+
+    Returns:
+        LogStorage 實例
+    """
+    if backend is None:
+        backend = config_loader.get_value("settings", "Storage", "backend", BACKEND_SHEETS)
+    backend = backend.strip().lower()
+
+    if backend == BACKEND_SQLITE:
+        from services.sqlite_storage import SQLiteLogStorage
+        path = config_loader.get_value("settings", "Storage", "sqlite_path", DEFAULT_SQLITE_PATH)
+        storage = SQLiteLogStorage(resolve_path(path))
+        replicate = config_loader.get_value("settings", "Storage", "replicate_to_sheets", "false")
+        if replicate.strip().lower() in ("true", "yes", "1", "on"):
+            _start_replication(storage)
+        return storage
+
+    if backend != BACKEND_SHEETS:
+        raise ValueError(f"不支援的存儲後端：{backend}（可用：{BACKEND_SHEETS}, {BACKEND_SQLITE}）")
+
+    # 只在使用 Google Sheets 後端時才匯入 gspread 並建立連線
+    from services.sheet import get_sheet_service
+    return get_sheet_service()
+
+
+_log_storage: Optional[LogStorage] = None
+_log_storage_lock = threading.Lock()
+
+
+def get_log_storage() -> LogStorage:
+    """取得全域存儲後端（第一次呼叫時建立，其他線程同時呼叫時等待建立完成）"""
+    global _log_storage
+    with _log_storage_lock:
+        if _log_storage is None:
+            _log_storage = create_storage()
+        return _log_storage
+
+
+def current_log_storage() -> Optional[LogStorage]:
+    """取得已建立的全域存儲後端（尚未建立時返回 None，不會觸發建立）"""
+    return _log_storage
+
+
+def shutdown_log_storage():
+    """停止全域存儲後端的背景線程（尚未建立時不處理）"""
+    storage = _log_storage
+    if storage is not None:
+        storage.shutdown()
+
+
+class _LazyLogStorage:
+    """
+    全域存儲後端的代理
+
+    後端已建立時直接返回其屬性；尚未建立時返回延遲解析的函式，呼叫時才建立（或等待建立完成）
+    並呼叫後端的同名方法。端點在事件迴圈上取得 log_storage.<方法> 後交給 sheet_io.run_local，
+    建立後端（載入快照、重建索引）的等待因此發生在 sheet_io 線程，不會阻塞事件迴圈。
+    透過代理只能存取方法
+    """
+
+    def __getattr__(self, name):
+        storage = _log_storage
+        if storage is not None:
+            return getattr(storage, name)
+
+        def call(*args, **kwargs):
+            return getattr(get_log_storage(), name)(*args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def __repr__(self) -> str:
+        return f"<lazy log storage: {_log_storage!r}>"
+
+
+# 全域實例
+log_storage = _LazyLogStorage()
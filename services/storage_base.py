@@ -0,0 +1,357 @@
+"""
+記錄存儲介面
+定義掃描記錄存儲後端（Google Sheets、SQLite）共同的讀寫方法；
+與後端無關的查詢邏輯（上一站條碼、站點在製條碼等）在此實作一次
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from services.analytics import DIMENSIONS
+from services.log_record import LogRecord, normalize_station
+from services.order_trace import OrderTrace, STATION_ORDER
+
+
+def _keys(record) -> LogRecord:
+    """取得記錄的標準化鍵（緩存中的 LogRecord 直接使用，其他後端返回的字典轉換一次）"""
+    return LogRecord.from_mapping(record)
+
+
+def inbound_barcode_item(barcode: str, record: Dict) -> Dict[str, str]:
+    """
+    將站點的遷入記錄轉換為在製條碼列表的項目
+
+    Args:
+        barcode: 標準化後的條碼
+        record: 第一筆遷入記錄
+    """
+    return {
+        "barcode": barcode,
+        "order": str(record.get("order", "")).strip(),
+        "sku": str(record.get("sku", "")).strip(),
+        "qty": str(record.get("qty", "")).strip(),
+        "timestamp": str(record.get("timestamp", "")).strip(),
+        "container": str(record.get("container", "")).strip(),
+        "box_seq": str(record.get("box_seq", "")).strip(),
+        "status": str(record.get("status", "")).strip()
+    }
+
+
+class LogStorage(ABC):
+    """
+    掃描記錄存儲後端
+
+    記錄以字典（或 LogRecord 等唯讀 Mapping）表示，欄位同 COLUMNS，值為寫入時的字串格式（見 sheet_schema.to_cache_record）
+    """
+
+    # ---- 寫入 ----
+
+    @abstractmethod
+    def write_logs_batch(self, log_data_list: list) -> tuple:
+        """
+        批量寫入多筆記錄
+
+        Args:
+            log_data_list: 記錄資料字典列表，每個字典應包含所有 COLUMNS 欄位
+
+        Returns:
+            Tuple[int, list]: (成功筆數, 失敗的記錄索引列表)
+        """
+
+    def write_log(self, log_data: Dict) -> bool:
+        """
+        寫入一筆記錄
+
+        Args:
+            log_data: 記錄資料字典，應包含所有 COLUMNS 欄位
+
+        Returns:
+            是否寫入成功
+        """
+        success_count, _ = self.write_logs_batch([log_data])
+        return success_count == 1
+
+    def submit_logs(self, log_data_list: List[Dict]) -> tuple:
+        """
+        提交多筆記錄（後端可先寫入本機日誌再非同步寫入，預設等同 write_logs_batch）
+
+        Returns:
+            Tuple[int, list]: (成功筆數, 失敗的記錄索引列表)
+        """
+        return self.write_logs_batch(log_data_list)
+
+    # ---- 查詢（各後端實作）----
+
+    @abstractmethod
+    def get_logs_by_barcode(self, barcode: str, limit: int = 100) -> list:
+        """
+        根據條碼查詢記錄（scanned_barcode 或 new_barcode 符合，依寫入順序）
+
+        Args:
+            barcode: 條碼字串
+            limit: 最大返回筆數
+        """
+
+    @abstractmethod
+    def get_logs_by_order(self, order: str, limit: int = 100, max_staleness: Optional[float] = None) -> list:
+        """
+        根據工單號查詢記錄（不區分大小寫，去除前導零，依寫入順序）
+
+        Args:
+            order: 工單號
+            limit: 最大返回筆數
+            max_staleness: 可接受的資料最大時效（秒），只對有緩存的後端有意義
+        """
+
+    @abstractmethod
+    def find_by_station(self, station_id: str, action: str) -> List[Dict]:
+        """
+        查詢指定站點、指定動作的所有記錄（依寫入順序）
+
+        Args:
+            station_id: 站點代號（例如：P2）
+            action: 動作（IN 或 OUT）
+        """
+
+    @abstractmethod
+    def has_inbound_record_at_station(self, barcode: str, station_id: str, strict: bool = False) -> bool:
+        """檢查條碼在指定站點是否有遷入（IN）記錄（只比對 scanned_barcode）"""
+
+    @abstractmethod
+    def has_outbound_record_at_station(self, barcode: str, station_id: str) -> bool:
+        """檢查條碼在指定站點是否有遷出（OUT）記錄（只比對 scanned_barcode）"""
+
+    @abstractmethod
+    def has_inbound_record_at_other_stations(self, barcode: str, exclude_station_id: str, strict: bool = False) -> bool:
+        """檢查條碼是否在其他站點（排除指定站點）有遷入（IN）記錄"""
+
+    @abstractmethod
+    def batch_check_inbound_records(self, barcodes: list, station_id: str, strict: bool = False) -> dict:
+        """
+        批量檢查多個條碼在指定站點是否有遷入（IN）記錄
+
+        Returns:
+            dict: {barcode: bool} 映射
+        """
+
+    @abstractmethod
+    def get_yield_analytics(self, dimensions=DIMENSIONS, start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+        """
+        依工單、站點、SKU、操作員分組統計良率與產能（見 LogColumns.summarize）
+
+        Args:
+            dimensions: 要分組的維度
+            start: 只統計時間 >= start 的記錄（1970-01-01 起算的秒數）
+            end: 只統計時間 < end 的記錄
+        """
+
+    # ---- 狀態 ----
+
+    def journal_status(self) -> Dict:
+        """取得寫入日誌狀態（未使用寫入日誌的後端返回 enabled=False）"""
+        return {"enabled": False}
+
+    def quota_status(self) -> Dict:
+        """取得 API 配額狀態（沒有配額限制的後端返回 enabled=False）"""
+        return {"enabled": False}
+
+    def replication_status(self) -> Dict:
+        """取得複寫到 Google Sheets 的狀態（未啟用複寫的後端返回 enabled=False）"""
+        return {"enabled": False}
+
+    def readiness(self) -> Dict:
+        """取得就緒狀態（ready 為 False 表示緩存尚未載入，查詢會等待；不需載入的後端一律就緒）"""
+        return {"ready": True}
+
+    def shutdown(self):
+        """停止背景線程並保存狀態（應用程式結束時呼叫；沒有背景線程的後端不需處理）"""
+
+    # ---- 共用查詢邏輯 ----
+
+    def get_order_trace(self, order: str) -> Dict:
+        """
+        取得工單的追溯彙總：站點時間軸（各站遷入/遷出記錄、投入/產出/良品/不良品數量、耗時）與全製程統計
+
+        Args:
+            order: 工單號（不區分大小寫，忽略前導零）
+
+        Returns:
+            {"station_timeline": [...], "statistics": {...}}（結果可能被共用，呼叫端不可修改）
+        """
+        return OrderTrace(self.get_logs_by_order(order, limit=None)).result()
+
+    def has_inbound_record(self, barcode: str) -> bool:
+        """
+        檢查條碼是否有遷入（IN）記錄
+
+        Args:
+            barcode: 條碼字串
+
+        Returns:
+            如果有 IN 記錄則返回 True，否則返回 False
+        """
+        logs = self.get_logs_by_barcode(barcode, limit=10)
+        return any(_keys(log).action_key == "IN" for log in logs)
+
+    def has_outbound_record(self, barcode: str) -> bool:
+        """
+        檢查條碼是否有遷出（OUT）記錄
+
+        Args:
+            barcode: 條碼字串
+
+        Returns:
+            如果有 OUT 記錄則返回 True，否則返回 False
+        """
+        logs = self.get_logs_by_barcode(barcode, limit=10)
+        return any(_keys(log).action_key == "OUT" for log in logs)
+
+    def has_outbound_record_at_downstream_stations(self, barcode: str, current_station: str) -> bool:
+        """
+        檢查條碼在下游站點是否有遷出（OUT）記錄
+
+        Args:
+            barcode: 條碼字串
+            current_station: 當前站點代號（例如：P2）
+
+        Returns:
+            如果在下游站點有 OUT 記錄則返回 True，否則返回 False
+        """
+        current_order = STATION_ORDER.get(normalize_station(current_station), 999)
+
+        # 如果當前站點不在定義中，返回 False
+        if current_order == 999:
+            return False
+
+        logs = self.get_logs_by_barcode(barcode, limit=100)
+        for log in map(_keys, logs):
+            # 如果記錄的站點順序大於當前站點，說明是下游站點
+            if log.action_key == "OUT" and STATION_ORDER.get(log.station_key, 999) > current_order:
+                return True
+        return False
+
+    def get_previous_station_barcodes(self, order: str, current_station: str) -> list:
+        """
+        查詢相同工單的上一站條碼（OUT 記錄）
+
+        Args:
+            order: 工單號
+            current_station: 當前站點（例如：P2）
+
+        Returns:
+            上一站條碼列表，每個條碼包含：barcode, box_seq, qty, status, container
+        """
+        # 取得所有該工單的記錄
+        logs = self.get_logs_by_order(order, limit=1000)
+
+        # 判斷上一站（根據站點順序）
+        current_order = STATION_ORDER.get(normalize_station(current_station), 999)
+
+        if current_order <= 1:
+            # 如果是 P1 或更早，沒有上一站
+            return []
+
+        # 找出上一站代號
+        prev_station = None
+        for station, order_num in STATION_ORDER.items():
+            if order_num == current_order - 1:
+                prev_station = station
+                break
+
+        if not prev_station:
+            return []
+
+        # 過濾出上一站的 OUT 記錄
+        prev_station_out_logs = []
+        for log in map(_keys, logs):
+            process = log.station_key
+
+            # 只取上一站的 OUT 記錄，且必須有 new_barcode（表示已遷出）
+            if log.action_key == "OUT" and process == prev_station and log.new_key:
+                # 標準化條碼（移除可能的 domain 前綴）
+                barcode_normalized = log.new_key
+
+                box_seq = str(log.get("box_seq", "")).strip()
+                qty = str(log.get("qty", "")).strip()
+                status = str(log.get("status", "")).strip()
+                container = str(log.get("container", "")).strip()
+
+                # 檢查該條碼在當前站點是否已有 IN 記錄
+                has_in = self.has_inbound_record_at_station(barcode_normalized, current_station)
+
+                # 篩除不良品（status = 'N'）
+                status_upper = status.upper()
+
+                if not has_in and status_upper != 'N':
+                    # 該條碼尚未在當前站點遷入，且不是不良品，加入列表
+                    prev_station_out_logs.append({
+                        "barcode": barcode_normalized,
+                        "box_seq": box_seq,
+                        "qty": qty,
+                        "status": status,
+                        "container": container,
+                        "process": process
+                    })
+
+        # 去重（根據條碼）
+        seen_barcodes = set()
+        unique_logs = []
+        for log in prev_station_out_logs:
+            if log["barcode"] not in seen_barcodes:
+                seen_barcodes.add(log["barcode"])
+                unique_logs.append(log)
+
+        return unique_logs
+
+    def get_inbound_barcodes_at_station(self, station_id: str, offset: int = 0, limit: Optional[int] = None) -> list:
+        """
+        查詢指定站點的所有遷入條碼（IN 記錄），但只返回尚未遷出的條碼
+        即：有 IN 記錄但沒有 OUT 記錄（在該站點）的條碼，依遷入時間由早到晚排序
+
+        Args:
+            station_id: 站點代號（例如：P1, P2）
+            offset: 分頁起始位置（略過的筆數）
+            limit: 每頁筆數（None 表示不分頁）
+
+        Returns:
+            遷入條碼列表（只包含尚未遷出的），每個條碼包含：barcode, order, sku, qty, timestamp, container, box_seq, status
+        """
+        try:
+            items = self._collect_inbound_barcodes(station_id)
+            end = None if limit is None else offset + limit
+            return items[offset:end]
+        except Exception as e:
+            print(f"查詢站點遷入條碼失敗：{e}")
+            return []
+
+    def count_inbound_barcodes_at_station(self, station_id: str) -> int:
+        """指定站點尚未遷出的遷入條碼數量（分頁用）"""
+        try:
+            return len(self._collect_inbound_barcodes(station_id))
+        except Exception as e:
+            print(f"查詢站點遷入條碼失敗：{e}")
+            return 0
+
+    def _collect_inbound_barcodes(self, station_id: str) -> list:
+        """由站點的 IN/OUT 記錄計算在製條碼列表（後端沒有專用索引時使用）"""
+        station_id_upper = normalize_station(station_id)
+        inbound_records = self.find_by_station(station_id_upper, "IN")
+        outbound_records = self.find_by_station(station_id_upper, "OUT")
+
+        # 收集該站點的 OUT 記錄的條碼（用於過濾）
+        outbound_barcodes = {_keys(record).scanned_key for record in outbound_records}
+        outbound_barcodes.discard("")
+
+        # 處理 IN 記錄（每個條碼只取第一筆），過濾掉已有 OUT 記錄的條碼
+        inbound_barcodes = []
+        seen_barcodes = set()
+        for record in inbound_records:
+            barcode_normalized = _keys(record).scanned_key
+            if not barcode_normalized or barcode_normalized in seen_barcodes:
+                continue
+            seen_barcodes.add(barcode_normalized)
+            if barcode_normalized not in outbound_barcodes:
+                inbound_barcodes.append(inbound_barcode_item(barcode_normalized, record))
+
+        # 按時間戳記排序（由早到晚）
+        inbound_barcodes.sort(key=lambda x: x.get("timestamp", ""))
+        return inbound_barcodes
@@ -0,0 +1,70 @@
+"""
+時間戳記解析模組
+記錄的 timestamp 欄位在寫入或同步時解析一次，轉換為 1970-01-01 起算的秒數（不轉換時區，
+與記錄的本地時間一致）；查詢端只使用秒數，不再重新解析字串
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+# 秒數的起點
+EPOCH = datetime(1970, 1, 1)
+
+# 支援的格式：YYYY-MM-DD HH:MM:SS[.ffffff]、YYYY/MM/DD HH:MM:SS
+# 以正規表示式一次比對，不需逐一嘗試 strptime 並處理失敗的例外
+_TIMESTAMP_PATTERN = re.compile(
+    r"(\d{4})(?:-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2}):(\d{1,2})(?:\.(\d{1,6}))?"
+    r"|/(\d{1,2})/(\d{1,2}) (\d{1,2}):(\d{1,2}):(\d{1,2}))$"
+)
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """
+    解析記錄的時間戳記
+
+    Args:
+        value: 時間戳記字串或 datetime
+
+    Returns:
+        datetime，無法解析時返回 None
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    match = _TIMESTAMP_PATTERN.match(value.strip())
+    if match is None:
+        return None
+    groups = match.groups()
+    try:
+        if groups[1] is not None:
+            fraction = groups[6] or ""
+            return datetime(int(groups[0]), int(groups[1]), int(groups[2]),
+                            int(groups[3]), int(groups[4]), int(groups[5]),
+                            int(fraction.ljust(6, "0")) if fraction else 0)
+        return datetime(int(groups[0]), int(groups[7]), int(groups[8]),
+                        int(groups[9]), int(groups[10]), int(groups[11]))
+    except ValueError:
+        # 日期或時間超出範圍（例如 13 月）
+        return None
+
+
+def timestamp_epoch(value) -> Optional[float]:
+    """
+    將時間戳記轉換為秒數
+
+    Args:
+        value: 時間戳記字串或 datetime
+
+    Returns:
+        秒數（含小數部分），無法解析時返回 None
+    """
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        return None
+    return (timestamp - EPOCH).total_seconds()
+
+
+def epoch_to_datetime(epoch: float) -> datetime:
+    """將秒數轉換回 datetime"""
+    return EPOCH + timedelta(seconds=epoch)
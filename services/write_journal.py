@@ -0,0 +1,263 @@
+"""
+寫入日誌（write-ahead journal）
+掃描記錄先追加到本機日誌檔並 fsync 後即視為成功，再由背景線程分批寫入 Google Sheets
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+class WriteJournal:
+    """
+    寫入日誌（追加式檔案 + 背景群組提交）
+
+    日誌檔為 JSON Lines 格式，每行為以下其中一種：
+    - {"seq": 序號, "log": 記錄}：待寫入的記錄
+    - {"committed": 序號}：序號（含）以前的記錄已成功寫入
+
+    背景線程依序號順序分批提交，某批提交失敗時以指數退避重試，不會跳過該批先提交後面的記錄。
+    程序重啟時會重新載入尚未提交的記錄。
+
+    提交與提交標記之間程序中斷、或提交失敗（錯誤可能在目的端已寫入後才返回）時，這些記錄的結果不確定；
+    再次提交前先以 reconcile_fn 排除目的端已存在的記錄，避免重複寫入
+    """
+
+    def __init__(
+        self,
+        path: str,
+        commit_fn: Callable[[List[Dict]], bool],
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_retry_delay: float = 60.0,
+        compact_bytes: int = 1024 * 1024,
+        reconcile_fn: Optional[Callable[[List[Dict]], List[Dict]]] = None
+    ):
+        """
+        Args:
+            path: 日誌檔路徑
+            commit_fn: 提交函式，接收一批記錄，成功返回 True
+            batch_size: 每批最多提交的記錄數
+            flush_interval: 背景線程檢查待提交記錄的間隔（秒）
+            max_retry_delay: 重試退避的最長間隔（秒）
+            compact_bytes: 全部提交後日誌檔超過此大小時清空
+            reconcile_fn: 結果不確定的記錄再次提交前呼叫，接收一批記錄，返回目的端尚未存在、仍需提交的記錄
+                          （無法確認時拋出例外，稍後重試）；None 表示直接重新提交
+        """
+        self.path = path
+        self._commit_fn = commit_fn
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retry_delay = max_retry_delay
+        self._compact_bytes = compact_bytes
+        self._reconcile_fn = reconcile_fn
+        self._uncertain_seq = 0  # 序號（含）以前待提交的記錄可能已寫入目的端
+
+        self._lock = threading.Lock()  # 保護日誌檔與待提交佇列
+        self._flush_lock = threading.Lock()  # 確保同一時間只有一個提交在進行
+        self._wakeup = threading.Event()
+        self._pending: Deque[Tuple[int, Dict, float]] = deque()  # (序號, 記錄, 寫入時間)
+        self._last_seq = 0
+        self._committed_seq = 0
+        self._retry_count = 0
+        self._next_attempt_time = 0.0
+        self._last_error: Optional[str] = None
+        self._last_commit_time: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # 上次寫入中斷留下不完整的一行，先補上換行，避免與新的記錄接在同一行
+            self._file.write("\n")
+            self._file.flush()
+
+    def _load(self):
+        """載入日誌檔，還原尚未提交的記錄"""
+        if not os.path.exists(self.path):
+            return
+
+        entries: Dict[int, Dict] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # 最後一行可能因程序中斷而不完整，忽略
+                    continue
+                if "committed" in item:
+                    self._committed_seq = max(self._committed_seq, int(item["committed"]))
+                elif "seq" in item:
+                    entries[int(item["seq"])] = item.get("log", {})
+
+        self._last_seq = max([self._committed_seq] + list(entries.keys()))
+        loaded_at = time.time()
+        for seq in sorted(entries):
+            if seq > self._committed_seq:
+                self._pending.append((seq, entries[seq], loaded_at))
+
+        if self._pending:
+            # 上次可能在寫入目的端之後、寫入提交標記之前中斷
+            self._uncertain_seq = self._pending[-1][0]
+            print(f"[寫入日誌] 載入 {len(self._pending)} 筆尚未寫入 Google Sheets 的記錄")
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def pending_records(self) -> List[Dict]:
+        """取得尚未提交的記錄（依序號順序）"""
+        with self._lock:
+            return [record for _, record, _ in self._pending]
+
+    def submit(self, records: List[Dict]) -> List[int]:
+        """
+        追加記錄到日誌檔並 fsync，返回後即保證記錄不會遺失
+
+        Args:
+            records: 記錄列表（值需可 JSON 序列化）
+
+        Returns:
+            分配給各記錄的序號列表
+        """
+        if not records:
+            return []
+
+        with self._lock:
+            seqs = []
+            lines = []
+            for record in records:
+                self._last_seq += 1
+                seqs.append(self._last_seq)
+                lines.append(json.dumps({"seq": self._last_seq, "log": record}, ensure_ascii=False))
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            submitted_at = time.time()
+            for seq, record in zip(seqs, records):
+                self._pending.append((seq, record, submitted_at))
+
+        self._wakeup.set()
+        return seqs
+
+    def flush_once(self) -> bool:
+        """
+        提交一批待提交記錄（背景線程呼叫，也可手動呼叫）
+
+        Returns:
+            是否有記錄且提交成功
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)[:self._batch_size]
+            if not batch:
+                return False
+
+            try:
+                records = [record for _, record, _ in batch]
+                if batch[0][0] <= self._uncertain_seq and self._reconcile_fn is not None:
+                    records = self._reconcile_fn(records)
+                success = self._commit_fn(records) if records else True
+                error = None if success else "提交函式返回失敗"
+            except Exception as e:
+                success = False
+                error = str(e)
+
+            if not success:
+                self._uncertain_seq = max(self._uncertain_seq, batch[-1][0])
+                self._retry_count += 1
+                self._last_error = error
+                # 指數退避（加上隨機抖動），避免持續撞到速率限制
+                delay = min(self._flush_interval * (2 ** self._retry_count), self._max_retry_delay)
+                self._next_attempt_time = time.time() + delay * random.uniform(0.5, 1.0)
+                print(f"[寫入日誌] 提交 {len(batch)} 筆記錄失敗（第 {self._retry_count} 次）：{error}")
+                return False
+
+            last_seq = batch[-1][0]
+            with self._lock:
+                for _ in batch:
+                    self._pending.popleft()
+                self._committed_seq = last_seq
+                self._write_commit_marker(last_seq)
+            self._retry_count = 0
+            self._next_attempt_time = 0.0
+            self._last_error = None
+            self._last_commit_time = time.time()
+            print(f"[寫入日誌] 已提交 {len(batch)} 筆記錄（序號至 {last_seq}）")
+            return True
+
+    def _write_commit_marker(self, seq: int):
+        """寫入提交標記；全部提交且檔案過大時清空日誌檔。呼叫端需持有 _lock"""
+        if not self._pending and self._file.tell() >= self._compact_bytes:
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write(json.dumps({"committed": seq}) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self):
+        """啟動背景提交線程"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def flush_worker():
+            while not self._stop:
+                self._wakeup.wait(self._flush_interval)
+                self._wakeup.clear()
+                if self._stop:
+                    break
+                wait = self._next_attempt_time - time.time()
+                if wait > 0:
+                    continue
+                # 連續提交直到佇列清空或失敗
+                while not self._stop and self.flush_once():
+                    pass
+
+        self._stop = False
+        self._thread = threading.Thread(target=flush_worker, daemon=True)
+        self._thread.start()
+        print(f"[寫入日誌] 已啟動背景提交線程（日誌檔：{self.path}）")
+
+    def stop(self, timeout: float = 5.0):
+        """停止背景提交線程（尚未提交的記錄保留在日誌檔中，下次啟動時繼續提交）"""
+        self._stop = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def status(self) -> Dict:
+        """
+        取得日誌狀態
+
+        Returns:
+            狀態字典：待提交筆數、序號、最舊待提交記錄的等待時間、最近錯誤等
+        """
+        with self._lock:
+            pending = len(self._pending)
+            oldest = self._pending[0][2] if self._pending else None
+            committed_seq = self._committed_seq
+            last_seq = self._last_seq
+        now = time.time()
+        return {
+            "path": self.path,
+            "pending": pending,
+            "last_seq": last_seq,
+            "committed_seq": committed_seq,
+            "oldest_pending_age": round(now - oldest, 3) if oldest is not None else None,
+            "retry_count": self._retry_count,
+            "next_retry_in": round(max(self._next_attempt_time - now, 0), 3) if self._retry_count else None,
+            "last_error": self._last_error,
+            "last_commit_time": self._last_commit_time,
+            "running": bool(self._thread and self._thread.is_alive())
+        }
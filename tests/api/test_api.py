@@ -102,7 +102,7 @@ class TestBarcodeCheckAPI:
         assert response.status_code == 400
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     def test_check_barcode_with_inbound_record(self, mock_sheet_service, client):
         """測試檢查已有遷入記錄的條碼"""
         from services.barcode import BarcodeGenerator
@@ -129,7 +129,7 @@ class TestBarcodeCheckAPI:
         assert data["suggested_action"] == "outbound"
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     def test_check_barcode_with_outbound_record(self, mock_sheet_service, client):
         """測試檢查已有遷出記錄的條碼"""
         from services.barcode import BarcodeGenerator
@@ -160,7 +160,7 @@ class TestInboundAPI:
     """遷入 API 測試"""
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     @patch('main.validate_process_flow')
     def test_inbound_success(self, mock_validate, mock_sheet_service, client):
         """測試成功遷入"""
@@ -202,7 +202,7 @@ class TestInboundAPI:
         assert response.status_code == 400
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     @patch('main.validate_process_flow')
     def test_inbound_flow_validation_failed(self, mock_validate, mock_sheet_service, client):
         """測試遷入流程驗證失敗"""
@@ -233,7 +233,7 @@ class TestOutboundAPI:
     """遷出 API 測試"""
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     def test_outbound_success(self, mock_sheet_service, client):
         """測試成功遷出"""
         from services.barcode import BarcodeGenerator
@@ -343,7 +343,7 @@ class TestTraceAPI:
     """追溯查詢 API 測試"""
     
     @pytest.mark.api
-    @patch('main.sheet_service')
+    @patch('main.log_storage')
     def test_trace_success(self, mock_sheet_service, client):
         """測試成功追溯查詢"""
         from services.barcode import BarcodeGenerator
@@ -352,8 +352,9 @@ class TestTraceAPI:
             "251119AA", "P1", "ST352", "A1", "01", "G", "0100"
         )
         
-        # 模擬返回記錄
-        mock_sheet_service.get_logs_by_order.return_value = [
+        from services.order_trace import OrderTrace
+        # 模擬返回記錄（追溯 API 讀取由記錄建立的工單彙總）
+        mock_sheet_service.get_order_trace.return_value = OrderTrace([
             {
                 "timestamp": "2025-01-01 10:00:00",
                 "action": "OUT",
@@ -369,7 +370,7 @@ class TestTraceAPI:
                 "scanned_barcode": "",
                 "new_barcode": test_barcode
             }
-        ]
+        ]).result()
         
         response = client.post(
             "/api/scan/trace",
@@ -382,6 +383,7 @@ class TestTraceAPI:
         assert data["success"] is True
         assert "station_timeline" in data["data"]
         assert "statistics" in data["data"]
+        assert data["data"]["statistics"]["total_qty"] == 100
     
     @pytest.mark.api
     def test_trace_invalid_barcode(self, client):
@@ -413,3 +415,16 @@ class TestRoutes:
         assert response.status_code == 302
         assert f"?b={barcode}" in response.headers.get("location", "")
 
+    
+    @pytest.mark.api
+    @patch('main.current_log_storage')
+    def test_readiness_route(self, mock_current_storage, client):
+        """測試就緒狀態：存儲尚未建立或緩存尚未載入時返回 503"""
+        mock_current_storage.return_value = None
+        assert client.get("/api/health/ready").status_code == 503
+        
+        mock_current_storage.return_value = MagicMock()
+        mock_current_storage.return_value.readiness.return_value = {"ready": True, "source": "snapshot"}
+        response = client.get("/api/health/ready")
+        assert response.status_code == 200
+        assert response.json()["data"]["source"] == "snapshot"
@@ -0,0 +1,131 @@
+"""
+記錄分析模組單元測試
+"""
+import pytest
+from services.analytics import LogColumns, to_epoch, from_epoch, NO_TIMESTAMP
+from services.log_store import LogStore
+
+
+def make_log(action, process, timestamp, qty="0100", status="G", order="251119AA", sku="ST352", operator="op01"):
+    """建立測試用的記錄資料"""
+    return {
+        "timestamp": timestamp,
+        "action": action,
+        "operator": operator,
+        "order": order,
+        "process": process,
+        "sku": sku,
+        "container": "A1",
+        "box_seq": "01",
+        "qty": qty,
+        "status": status,
+        "cycle_time": "0",
+        "scanned_barcode": "",
+        "new_barcode": ""
+    }
+
+
+LOGS = [
+    make_log("OUT", "P1", "2025-01-01 08:00:00"),
+    make_log("IN", "P2", "2025-01-01 09:00:00", operator="op02"),
+    make_log("OUT", "P2", "2025-01-01 10:00:00", qty="0080", operator="op02"),
+    make_log("OUT", "P2", "2025-01-01 10:00:00", qty="0020", status="N", operator="op02"),
+    make_log("OUT", "P1", "2025-01-02 08:00:00", order="0251120AA", sku="ST353"),
+]
+
+
+class TestLogColumns:
+    """欄式存儲測試"""
+
+    @pytest.mark.unit
+    def test_epoch_round_trip(self):
+        """測試時間戳記與秒數互轉"""
+        seconds = to_epoch("2025-01-01 08:00:00")
+        assert from_epoch(seconds) == "2025-01-01 08:00:00"
+        assert to_epoch("bad") == NO_TIMESTAMP
+
+    @pytest.mark.unit
+    def test_summarize_all_dimensions(self):
+        """測試各維度的數量、良率與產能"""
+        result = LogColumns(LOGS).summarize()
+
+        stations = {g["key"]: g for g in result["station"]}
+        assert [g["key"] for g in result["station"]] == ["P1", "P2"]
+        assert stations["P2"]["in_qty"] == 100
+        assert (stations["P2"]["good_qty"], stations["P2"]["bad_qty"]) == (80, 20)
+        assert stations["P2"]["yield_rate"] == 80.0
+        # P2 在 9:00 到 10:00 之間遷出 100
+        assert stations["P2"]["throughput_per_hour"] == 100.0
+
+        orders = {g["key"]: g for g in result["order"]}
+        assert orders["251120AA"]["out_qty"] == 100  # 工單號忽略前導零
+        assert orders["251120AA"]["throughput_per_hour"] is None
+
+        assert [g["key"] for g in result["sku"]] == ["ST352", "ST353"]
+        assert {g["key"]: g["records"] for g in result["operator"]} == {"OP01": 2, "OP02": 3}
+
+    @pytest.mark.unit
+    def test_time_range_and_dimensions(self):
+        """測試時間範圍（含起始、不含結束）與指定維度"""
+        columns = LogColumns(LOGS)
+        result = columns.summarize(("station",), start=to_epoch("2025-01-01 09:00:00"),
+                                   end=to_epoch("2025-01-02 08:00:00"))
+        assert list(result) == ["station"]
+        assert [(g["key"], g["records"]) for g in result["station"]] == [("P2", 3)]
+
+    @pytest.mark.unit
+    def test_log_store_maintains_columns(self):
+        """測試 LogStore 隨 append 追加欄式存儲"""
+        store = LogStore(LOGS[:2])
+        store.append(make_log("SCAN", "P1", "2025-01-01 08:00:00"))  # 非 IN/OUT 不列入
+        store.extend(LOGS[2:])
+        assert len(store.columns) == len(LOGS)
+        assert store.columns.summarize() == LogColumns(LOGS).summarize()
+
+    @pytest.mark.unit
+    def test_group_keys_match_record_keys(self):
+        """測試分組鍵與索引、追溯使用的標準化鍵相同（空白工單不會變成 "0"）"""
+        logs = [make_log(" out ", " p2 ", "2025-01-01 08:00:00", order=""), make_log("OUT", "P2", "2025-01-01 09:00:00", order="000")]
+        store = LogStore(logs)
+        result = store.columns.summarize(("order", "station"))
+        assert [g["key"] for g in result["order"]] == [record.order_key for record in store.records()]
+        assert [g["key"] for g in result["order"]] == ["", "0"]
+        assert [(g["key"], g["records"]) for g in result["station"]] == [("P2", 2)]
+        assert LogColumns(logs).summarize(("order", "station")) == result
+
+    @pytest.mark.unit
+    def test_oversized_qty_does_not_break_store(self):
+        """測試數量超出 int64 範圍時視為 0，記錄與欄式存儲、索引仍保持一致"""
+        store = LogStore([make_log("OUT", "P2", "2025-01-01 08:00:00", qty="9" * 30),
+                          make_log("OUT", "P2", "2025-01-01 09:00:00", qty="3000000000")])
+        assert len(store) == 2
+        assert len(store.columns) == 2
+        assert len(store.find_by_station("P2", "OUT")) == 2
+        stations = store.columns.summarize(("station",))["station"]
+        assert [(g["key"], g["records"], g["out_qty"]) for g in stations] == [("P2", 2, 3000000000)]
+
+    @pytest.mark.unit
+    def test_summary_cache_updates_incrementally(self):
+        """測試同一統計條件再次查詢時只走訪新追加的列，結果與重新統計相同"""
+        columns = LogColumns(LOGS[:3])
+        columns.summarize(("station", "order"))
+
+        accumulated = []
+        accumulate = columns._accumulate
+        columns._accumulate = lambda summary, dimensions, begin, n, start, end: (
+            accumulated.append((begin, n)), accumulate(summary, dimensions, begin, n, start, end))
+        for log in LOGS[3:]:
+            columns.append(log)
+        # 新工單的分組在緩存之後才加入字典編碼
+        assert columns.summarize(("station", "order")) == LogColumns(LOGS).summarize(("station", "order"))
+        assert columns.summarize(("station", "order")) == LogColumns(LOGS).summarize(("station", "order"))
+        assert accumulated == [(3, 5)]
+
+    @pytest.mark.unit
+    def test_summary_cache_cleared_on_remove(self):
+        """測試撤銷列後重新統計，不再包含該列"""
+        columns = LogColumns(LOGS)
+        assert columns.summarize(("station",))["station"][1]["records"] == 3
+        columns.remove(2)
+        stations = columns.summarize(("station",))["station"]
+        assert stations == LogColumns(LOGS[:2] + LOGS[3:]).summarize(("station",))["station"]
@@ -2,7 +2,7 @@
 條碼處理模組單元測試
 """
 import pytest
-from services.barcode import BarcodeParser, BarcodeGenerator, CRC16
+from services.barcode import BarcodeParser, BarcodeGenerator, BarcodeMemo, CRC16, ParsedBarcode, BARCODE_FIELDS
 
 
 class TestBarcodeParser:
@@ -48,6 +48,38 @@ class TestBarcodeParser:
         result = BarcodeParser.parse("251119AAP2ST352A101G0100X4F")
         assert result is None
     
+    @pytest.mark.unit
+    def test_parse_matches_pattern(self, sample_barcode):
+        """測試解析結果與正規表示式比對的欄位相同（含長度快速排除的情況）"""
+        variants = [sample_barcode, f" {sample_barcode}\n", sample_barcode.lower()]
+        for i, char in enumerate(sample_barcode):
+            for replacement in ("-", "A", "0", "a", "_", "٣"):
+                variants.append(sample_barcode[:i] + replacement + sample_barcode[i + 1:])
+            variants.append(sample_barcode[:i] + sample_barcode[i + 1:] + "0")
+        
+        for barcode in variants:
+            match = BarcodeParser.BARCODE_PATTERN.match(barcode.strip())
+            parsed = BarcodeParser.parse(barcode)
+            if match is None:
+                assert parsed is None, barcode
+            else:
+                assert dict(parsed) == dict(zip(BARCODE_FIELDS, match.groups())), barcode
+    
+    @pytest.mark.unit
+    def test_parsed_barcode_is_read_only_mapping(self, sample_barcode):
+        """測試解析結果可當作字典讀取，且不可修改"""
+        parsed = BarcodeParser.parse(sample_barcode)
+        assert isinstance(parsed, ParsedBarcode)
+        assert parsed.order == parsed['order'] == parsed.get('order') == parsed[0] == '251119AA'
+        assert parsed.get('missing', '') == ''
+        assert 'qty' in parsed and 'missing' not in parsed
+        assert dict(parsed) == parsed.to_dict() == dict(parsed.items())
+        assert list(parsed.keys()) == list(BARCODE_FIELDS)
+        with pytest.raises(KeyError):
+            parsed['missing']
+        with pytest.raises(AttributeError):
+            parsed.order = 'X'
+    
     @pytest.mark.unit
     def test_parse_partial_zz_barcode(self, sample_zz_barcode):
         """測試 ZZ 製程條碼（新工單）部分解析"""
@@ -186,6 +218,117 @@ class TestCRC16:
         """測試格式錯誤條碼的驗證"""
         result = CRC16.verify(sample_invalid_barcode)
         assert result is False
+    
+    @pytest.mark.unit
+    def test_table_matches_bitwise_calculation(self):
+        """測試查表計算與逐位元計算的結果相同"""
+        def bitwise_crc16(data):
+            crc = 0xFFFF
+            for byte in data.encode('utf-8'):
+                crc ^= (byte << 8)
+                for _ in range(8):
+                    crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+                    crc &= 0xFFFF
+            return format(crc, 'X').zfill(3)[-3:]
+        
+        samples = ["", "A", "251119AA-P2-ST352-A1-01-G-0100", "工單", "ZZZZZZZZ-ZZ-ZZZZZ-ZZ-99-Z-9999"]
+        samples += [f"2511{i:04d}-P{i % 9}-ST{i % 1000:03d}-A{i % 10}-{i % 100:02d}-G-{i:04d}" for i in range(500)]
+        for data in samples:
+            assert CRC16.calculate(data) == bitwise_crc16(data)
+    
+    @pytest.mark.unit
+    def test_verify_many_matches_verify(self, sample_barcode, sample_invalid_barcode):
+        """測試批量驗證與逐一驗證的結果相同"""
+        barcodes = [
+            sample_barcode,
+            sample_barcode[:-3] + "XXX",
+            sample_invalid_barcode,
+            sample_barcode + " ",
+            sample_barcode,
+        ]
+        result = CRC16.verify_many(barcodes)
+        assert result == {barcode: CRC16.verify(barcode) for barcode in barcodes}
+        assert result[sample_barcode] is True
+        assert CRC16.verify_many([]) == {}
+    
+    @pytest.mark.unit
+    def test_prefix_state_extends_to_full_checksum(self):
+        """測試前綴狀態延續計算的結果與整段計算相同，且前綴狀態可重複使用"""
+        prefix = "251119AA-P2-ST352-A1-"
+        state = CRC16.prefix(prefix)
+        for suffix in ("01-G-0100", "02-N-0050", "", "工單"):
+            assert state.extend(suffix).checksum() == CRC16.calculate(prefix + suffix)
+        assert state == CRC16.prefix(prefix)
+        assert CRC16.prefix().checksum() == CRC16.calculate("")
+        assert CRC16.prefix("2511").extend("19AA").extend("-P2") == CRC16.prefix("251119AA-P2")
+        # 前綴狀態不可修改，可作為緩存的值共用
+        with pytest.raises(AttributeError):
+            state.value = 0
+    
+    @pytest.mark.unit
+    def test_verify_many_shared_prefixes(self):
+        """測試多個工單、同一工單多箱混合時批量驗證的結果正確"""
+        barcodes = [
+            BarcodeGenerator.generate(f"2511{i % 3:04d}", "P2", "ST352", "A1", f"{i:02d}", "G", "0100")
+            for i in range(12)
+        ]
+        tampered = barcodes[4][:-3] + ("000" if barcodes[4][-3:] != "000" else "001")
+        result = CRC16.verify_many(barcodes + [tampered])
+        assert all(result[barcode] for barcode in barcodes)
+        assert result[tampered] is False
+
+
+class TestBarcodeMemo:
+    """條碼解析/校驗結果緩存測試"""
+    
+    @pytest.mark.unit
+    def test_results_match_parser_and_verify(self, sample_barcode, sample_invalid_barcode):
+        """測試緩存結果與直接解析、驗證相同，重複查詢時命中"""
+        memo = BarcodeMemo()
+        wrong_crc = sample_barcode[:-3] + "XXX"
+        for _ in range(2):
+            for barcode in (sample_barcode, wrong_crc, sample_invalid_barcode):
+                assert memo.parse(barcode) == BarcodeParser.parse(barcode)
+                assert memo.verify(barcode) == CRC16.verify(barcode)
+        assert memo.verify_many([sample_barcode, wrong_crc]) == {sample_barcode: True, wrong_crc: False}
+        
+        status = memo.status()
+        assert status["size"] == 3
+        assert status["misses"] == 3
+        assert status["hits"] == 11
+        assert status["hit_rate"] == round(11 / 14, 4)
+    
+    @pytest.mark.unit
+    def test_verify_many_caches_missing_barcodes(self, sample_barcode, sample_invalid_barcode):
+        """測試批量驗證未緩存的條碼時結果同 CRC16.verify_many，並寫入緩存"""
+        memo = BarcodeMemo()
+        memo.verify(sample_barcode)
+        series = BarcodeGenerator.generate_series(sample_barcode, [{"box_seq": f"{i:02d}"} for i in range(2, 7)])
+        barcodes = [sample_barcode, sample_invalid_barcode] + series + series[:1]
+        
+        assert memo.verify_many(barcodes) == CRC16.verify_many(barcodes)
+        assert memo.status()["size"] == 7
+        assert memo.status()["misses"] == 7
+        assert memo.parse(series[0]) == BarcodeParser.parse(series[0])
+        assert memo.status()["hits"] == 2
+    
+    @pytest.mark.unit
+    def test_evicts_least_recently_used(self):
+        """測試超過容量時移除最久未使用的條碼"""
+        memo = BarcodeMemo(max_size=2)
+        memo.parse("A")
+        memo.parse("B")
+        memo.parse("A")  # A 變為最近使用
+        memo.parse("C")  # 移除 B
+        assert memo.status()["size"] == 2
+        
+        memo.parse("A")
+        memo.parse("B")
+        assert memo.status()["hits"] == 2
+        assert memo.status()["misses"] == 4
+        
+        memo.clear()
+        assert memo.status() == {"max_size": 2, "size": 0, "hits": 0, "misses": 0, "hit_rate": None}
 
 
 class TestBarcodeGenerator:
@@ -320,4 +463,27 @@ class TestBarcodeGenerator:
         assert parsed['process'] == 'P3'
         assert parsed['order'] == old_parsed['order']
         assert parsed['sku'] == old_parsed['sku']
-
+    
+    @pytest.mark.unit
+    def test_generate_series_matches_generate(self, sample_barcode):
+        """測試一次生成多箱的結果與逐箱生成相同"""
+        boxes = [{"box_seq": "1", "qty": "50"}, {"box_seq": "02", "qty": "0050", "status": "n"}, {"box_seq": "03"}]
+        template = {"order": "251119aa", "process": "P3", "sku": "ST352", "container": "b2", "status": "G", "qty": "0100"}
+        
+        barcodes = BarcodeGenerator.generate_series(template, boxes)
+        assert barcodes == [
+            BarcodeGenerator.generate("251119aa", "P3", "ST352", "b2", "1", "G", "50"),
+            BarcodeGenerator.generate("251119aa", "P3", "ST352", "b2", "02", "n", "0050"),
+            BarcodeGenerator.generate("251119aa", "P3", "ST352", "b2", "03", "G", "0100"),
+        ]
+        assert all(CRC16.verify(barcode) for barcode in barcodes)
+    
+    @pytest.mark.unit
+    def test_generate_series_from_previous_barcode(self, sample_barcode, sample_invalid_barcode):
+        """測試以舊條碼作為共用欄位"""
+        barcodes = BarcodeGenerator.generate_series(sample_barcode, [{"box_seq": "05", "qty": "0020"}])
+        assert barcodes == [BarcodeGenerator.generate_from_previous(
+            sample_barcode, BarcodeParser.parse(sample_barcode)['process'], new_box_seq="05", new_qty="0020"
+        )]
+        assert BarcodeGenerator.generate_series(sample_invalid_barcode, [{"box_seq": "01"}]) is None
+        assert BarcodeGenerator.generate_series(sample_barcode, []) == []
@@ -0,0 +1,47 @@
+"""
+緩存快照單元測試
+"""
+import pytest
+from services.cache_snapshot import CacheSnapshot
+from services.log_record import LogRecord
+from services.sheet_schema import COLUMNS
+
+
+def make_record(box_seq, timestamp="2025-01-01 10:00:00"):
+    """建立測試用的記錄"""
+    values = dict.fromkeys(COLUMNS, "")
+    values.update(timestamp=timestamp, action="IN", order="251119AA", process="P2", box_seq=box_seq,
+                  scanned_barcode=f"251119AA-P1-ST352-A1-{box_seq}-G-0100-X4F")
+    return LogRecord.from_mapping(values)
+
+
+class TestCacheSnapshot:
+    """快照讀寫測試"""
+
+    @pytest.mark.unit
+    def test_round_trip(self, tmp_path):
+        """測試寫入後載入的記錄、列數與雜湊值相同"""
+        snapshot = CacheSnapshot(str(tmp_path / "data" / "cache.snapshot"))
+        records = [make_record("01"), make_record("02", timestamp="not a time")]
+        snapshot.save("sheet", ["h1", "h2"], 3, [1, -2, 3], records)
+
+        data = snapshot.load("sheet")
+        assert data["headers"] == ["h1", "h2"]
+        assert data["row_count"] == 3
+        assert data["row_hashes"] == [1, -2, 3]
+        assert [record.to_dict() for record in data["records"]] == [record.to_dict() for record in records]
+        assert data["records"][0].epoch == records[0].epoch
+        assert data["records"][1].epoch is None
+
+    @pytest.mark.unit
+    def test_ignores_other_sheet_and_invalid_files(self, tmp_path):
+        """測試其他工作表的快照、不存在或損壞的檔案不會被載入"""
+        path = tmp_path / "cache.snapshot"
+        snapshot = CacheSnapshot(str(path))
+        assert snapshot.load("sheet") is None
+
+        snapshot.save("sheet", ["h1"], 1, [1], [])
+        assert snapshot.load("other") is None
+
+        path.write_bytes(b"garbage")
+        assert snapshot.load("sheet") is None
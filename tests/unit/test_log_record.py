@@ -0,0 +1,74 @@
+"""
+緩存記錄模組單元測試
+"""
+import pytest
+from services.log_record import LogRecord
+from services.sheet_schema import COLUMNS
+
+
+def make_record_dict(**overrides):
+    """建立測試用的記錄字典"""
+    record = {col: "" for col in COLUMNS}
+    record.update({
+        "timestamp": "1970-01-01 00:01:00",
+        "action": "IN",
+        "order": "251119AA",
+        "process": "P2",
+        "qty": "0100",
+        "scanned_barcode": "251119AA-P1-ST352-A1-01-G-0100-X4F"
+    })
+    record.update(overrides)
+    return record
+
+
+class TestLogRecord:
+    """LogRecord 測試"""
+
+    @pytest.mark.unit
+    def test_behaves_like_dict(self):
+        """測試 Mapping 介面與字典相容"""
+        data = make_record_dict()
+        record = LogRecord.from_mapping(data)
+        assert record == data
+        assert dict(record) == data == record.to_dict()
+        assert record["order"] == record.order == "251119AA"
+        assert record.get("unknown", "x") == "x"
+        assert "epoch" not in record
+        with pytest.raises(KeyError):
+            record["epoch"]
+
+    @pytest.mark.unit
+    def test_parses_epoch_once_and_is_read_only(self):
+        """測試建立時解析時間戳記，且不可修改"""
+        record = LogRecord.from_mapping(make_record_dict())
+        assert record.epoch == 60
+        with pytest.raises(AttributeError):
+            record.order = "OTHER"
+
+    @pytest.mark.unit
+    def test_repeated_codes_share_string_objects(self):
+        """測試重複出現的代碼共用同一個字串物件"""
+        first = LogRecord.from_mapping(make_record_dict(process="".join(["P", "2"])))
+        second = LogRecord.from_mapping(make_record_dict(process="".join(["P", "2"])))
+        assert first.process is second.process
+
+    @pytest.mark.unit
+    def test_missing_and_non_string_values(self):
+        """測試缺少的欄位為空字串，非字串值轉為字串"""
+        record = LogRecord.from_mapping({"timestamp": "bad", "qty": 5, "status": None})
+        assert (record.qty, record.status, record.new_barcode) == ("5", "", "")
+        assert record.epoch is None
+        assert LogRecord.from_mapping(record) is record
+
+    @pytest.mark.unit
+    def test_canonical_keys_computed_at_ingest(self):
+        """測試標準化鍵：條碼移除 domain 並轉大寫，工單忽略前導零，已標準化的條碼沿用原字串"""
+        record = LogRecord.from_mapping(make_record_dict(
+            order="0251119aa", process=" p2 ", action="in",
+            new_barcode="http://localhost:8000/b=251119aa-p2-st352-a1-01-g-0100-abc"
+        ))
+        assert record.new_key == "251119AA-P2-ST352-A1-01-G-0100-ABC"
+        assert (record.order_key, record.station_key, record.action_key) == ("251119AA", "P2", "IN")
+        assert record.scanned_key is record.scanned_barcode
+        other = LogRecord.from_mapping(make_record_dict(process="".join(["P", "2"])))
+        assert other.station_key is record.station_key
@@ -0,0 +1,226 @@
+"""
+記錄存儲模組單元測試
+"""
+import threading
+
+import pytest
+from services.log_store import LogStore, normalize_barcode, normalize_order
+
+
+def make_record(action, process, scanned="", new="", order="251119AA", timestamp="2025-01-01 10:00:00"):
+    """建立測試用的記錄"""
+    return {
+        "timestamp": timestamp,
+        "action": action,
+        "operator": "OP01",
+        "order": order,
+        "process": process,
+        "sku": "ST352",
+        "container": "A1",
+        "box_seq": "01",
+        "qty": "0100",
+        "status": "G",
+        "cycle_time": "0",
+        "scanned_barcode": scanned,
+        "new_barcode": new
+    }
+
+
+BARCODE_P1 = "251119AA-P1-ST352-A1-01-G-0100-X4F"
+BARCODE_P2 = "251119AA-P2-ST352-A1-01-G-0100-ABC"
+
+
+class TestNormalize:
+    """標準化函式測試"""
+
+    @pytest.mark.unit
+    def test_normalize_barcode_strips_domain(self):
+        """測試移除 domain 前綴並轉大寫"""
+        assert normalize_barcode(f"http://localhost:8000/b={BARCODE_P1.lower()} ") == BARCODE_P1
+        assert normalize_barcode(None) == ""
+
+    @pytest.mark.unit
+    def test_normalize_order_strips_leading_zeros(self):
+        """測試工單號去除前導零"""
+        assert normalize_order("00abc") == "ABC"
+        assert normalize_order("000") == "0"
+        assert normalize_order("") == ""
+
+
+class TestLogStore:
+    """記錄存儲測試"""
+
+    @pytest.fixture
+    def store(self):
+        """建立包含上一站遷出與本站遷入記錄的存儲"""
+        return LogStore([
+            make_record("OUT", "P1", new=f"http://localhost:8000/b={BARCODE_P1}"),
+            make_record("IN", "P2", scanned=BARCODE_P1),
+            make_record("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2),
+        ])
+
+    @pytest.mark.unit
+    def test_find_by_barcode_matches_scanned_and_new(self, store):
+        """測試條碼索引同時涵蓋 scanned_barcode 和 new_barcode"""
+        logs = store.find_by_barcode(BARCODE_P1.lower())
+        assert [log["action"] for log in logs] == ["OUT", "IN", "OUT"]
+        assert len(store.find_by_barcode(BARCODE_P1, limit=1)) == 1
+        assert store.find_by_barcode("UNKNOWN") == []
+
+    @pytest.mark.unit
+    def test_has_scanned(self, store):
+        """測試 (條碼, 站點, 動作) 索引"""
+        assert store.has_scanned(BARCODE_P1, "p2", "in") is True
+        assert store.has_scanned(BARCODE_P1, "P2", "OUT") is True
+        assert store.has_scanned(BARCODE_P1, "P3", "IN") is False
+        # new_barcode 不列入掃描索引
+        assert store.has_scanned(BARCODE_P2, "P2", "OUT") is False
+
+    @pytest.mark.unit
+    def test_has_scanned_at_other_stations(self, store):
+        """測試其他站點的遷入檢查"""
+        assert store.has_scanned_at_other_stations(BARCODE_P1, "P3", "IN") is True
+        assert store.has_scanned_at_other_stations(BARCODE_P1, "P2", "IN") is False
+
+    @pytest.mark.unit
+    def test_find_by_order_and_station(self, store):
+        """測試工單與站點索引"""
+        assert len(store.find_by_order("0251119aa")) == 3
+        assert store.find_by_order("OTHER") == []
+        assert len(store.find_by_station("P2", "IN")) == 1
+        assert len(store.find_by_station("P2", "OUT")) == 1
+
+    @pytest.mark.unit
+    def test_append_updates_indexes(self, store):
+        """測試新增記錄後索引即時更新"""
+        store.append(make_record("IN", "P3", scanned=BARCODE_P2))
+        assert len(store) == 4
+        assert store.has_scanned(BARCODE_P2, "P3", "IN") is True
+        assert len(store.find_by_barcode(BARCODE_P2)) == 2
+
+    @pytest.mark.unit
+    def test_remove_hides_record_from_indexes(self, store):
+        """測試撤銷的記錄不再出現在索引、追溯與欄式存儲中，其他記錄不受影響"""
+        assert store.order_trace("251119AA")["statistics"]
+        outbound = make_record("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2)
+        assert store.remove(outbound) is True
+        assert store.remove(outbound) is False
+
+        assert len(store) == 2
+        assert len(store.records()) == 2
+        assert store.has_scanned(BARCODE_P1, "P2", "OUT") is False
+        assert store.find_by_barcode(BARCODE_P2) == []
+        assert len(store.find_by_order("251119AA")) == 2
+        assert [barcode for barcode, _ in store.station_wip("P2")] == [BARCODE_P1]
+        stations = {g["key"]: g for g in store.columns.summarize(("station",))["station"]}
+        assert stations["P2"]["out_qty"] == 0
+        assert store.order_trace("251119AA") == LogStore(store.records()).order_trace("251119AA")
+
+        store.remove(make_record("IN", "P2", scanned=BARCODE_P1))
+        assert store.station_wip("P2") == []
+        assert store.has_scanned(BARCODE_P1, "P2", "IN") is False
+
+
+class TestStationWip:
+    """站點在製條碼測試"""
+
+    @pytest.mark.unit
+    def test_wip_ordered_by_inbound_time(self):
+        """測試依遷入時間排序（寫入順序與時間不同時仍正確）"""
+        store = LogStore([
+            make_record("IN", "P2", scanned="B2", timestamp="2025-01-01 11:00:00"),
+            make_record("IN", "P2", scanned="B1", timestamp="2025-01-01 10:00:00"),
+            make_record("IN", "P2", scanned="B3", timestamp="2025-01-01 12:00:00"),
+            make_record("IN", "P3", scanned="B4"),
+        ])
+        assert [barcode for barcode, _ in store.station_wip("p2")] == ["B1", "B2", "B3"]
+        assert store.station_wip_count("P2") == 3
+        assert store.station_wip("P9") == []
+
+    @pytest.mark.unit
+    def test_wip_ordered_by_parsed_time_across_formats(self):
+        """測試時間戳記格式不同時依解析後的時間排序（字串排序會將 01-02 排在 01/01 之前），無法解析的排在最前面"""
+        store = LogStore([
+            make_record("IN", "P2", scanned="B3", timestamp="2025-01-02 08:00:00"),
+            make_record("IN", "P2", scanned="B2", timestamp="2025/01/01 10:00:00"),
+            make_record("IN", "P2", scanned="B1", timestamp=""),
+        ])
+        assert [barcode for barcode, _ in store.station_wip("P2")] == ["B1", "B2", "B3"]
+
+    @pytest.mark.unit
+    def test_wip_removes_outbound_and_keeps_first_inbound(self):
+        """測試遷出後移除，重複遷入只保留第一筆，遷出後再遷入不列入"""
+        store = LogStore([
+            make_record("IN", "P2", scanned="B1", timestamp="2025-01-01 10:00:00"),
+            make_record("IN", "P2", scanned="B1", timestamp="2025-01-01 10:05:00"),
+            make_record("IN", "P2", scanned="B2", timestamp="2025-01-01 11:00:00"),
+        ])
+        assert store.station_wip("P2")[0][1]["timestamp"] == "2025-01-01 10:00:00"
+
+        store.append(make_record("OUT", "P2", scanned="B1"))
+        store.append(make_record("IN", "P2", scanned="B1", timestamp="2025-01-01 12:00:00"))
+        assert [barcode for barcode, _ in store.station_wip("P2")] == ["B2"]
+        assert store.station_wip_count("P2") == 1
+
+    @pytest.mark.unit
+    def test_wip_pagination(self):
+        """測試分頁讀取"""
+        store = LogStore([
+            make_record("IN", "P2", scanned=f"B{i}", timestamp=f"2025-01-01 10:00:{i:02d}")
+            for i in range(10)
+        ])
+        for i in range(0, 10, 2):
+            store.append(make_record("OUT", "P2", scanned=f"B{i}"))
+
+        assert [barcode for barcode, _ in store.station_wip("P2", offset=1, limit=2)] == ["B3", "B5"]
+        assert [barcode for barcode, _ in store.station_wip("P2", offset=4)] == ["B9"]
+
+
+class TestConcurrentReads:
+    """查詢不加鎖時的可見性測試"""
+
+    @pytest.mark.unit
+    def test_reads_ignore_unpublished_records(self):
+        """測試索引已更新、但尚未計入 _size 的記錄不會被查詢看到"""
+        store = LogStore([
+            make_record("IN", "P2", scanned="B1", timestamp="2025-01-01 10:00:00"),
+            make_record("IN", "P2", scanned="B2", timestamp="2025-01-01 10:01:00"),
+        ])
+        store.append(make_record("IN", "P3", scanned="B1", timestamp="2025-01-01 11:00:00"))
+        store._size = 2  # 模擬寫入進行到一半
+
+        assert len(store) == 2
+        assert len(store.find_by_barcode("B1")) == 1
+        assert not store.has_scanned("B1", "P3", "IN")
+        assert not store.has_scanned_at_other_stations("B1", "P2", "IN")
+        assert store.station_wip("P3") == []
+        assert len(store.records()) == 2
+
+    @pytest.mark.unit
+    def test_reads_during_writes_see_consistent_prefix(self):
+        """測試寫入線程追加記錄時，查詢結果只會增加，不會重複或遺漏"""
+        total = 3000
+        store = LogStore()
+        errors = []
+
+        def writer():
+            for i in range(total):
+                store.append(make_record("IN", "P2", scanned=f"B{i}", timestamp="2025-01-01 10:00:00"))
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        previous = 0
+        while thread.is_alive() or previous < total:
+            records = store.find_by_order("251119AA")
+            barcodes = [barcode for barcode, _ in store.station_wip("P2")]
+            if len(records) < previous or len(set(barcodes)) != len(barcodes):
+                errors.append((previous, len(records), len(barcodes)))
+                break
+            if [r["scanned_barcode"] for r in records] != [f"B{i}" for i in range(len(records))]:
+                errors.append("order")
+                break
+            previous = len(records)
+        thread.join()
+
+        assert errors == []
+        assert len(store.find_by_order("251119AA")) == total
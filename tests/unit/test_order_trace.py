@@ -0,0 +1,111 @@
+"""
+工單追溯彙總單元測試
+"""
+import pytest
+from services.order_trace import OrderTrace, OrderTraceCache
+from services.log_store import LogStore
+from services.timestamps import timestamp_epoch
+
+
+def make_log(action, process, timestamp, qty="0100", status="G", order="251119AA", box_seq="01"):
+    """建立測試用的記錄資料"""
+    return {
+        "timestamp": timestamp,
+        "action": action,
+        "operator": "OP01",
+        "order": order,
+        "process": process,
+        "sku": "ST352",
+        "container": "A1",
+        "box_seq": box_seq,
+        "qty": qty,
+        "status": status,
+        "cycle_time": "1.5",
+        "scanned_barcode": "",
+        "new_barcode": ""
+    }
+
+
+# P1 遷出 100 良品；P2 遷入 100，遷出 90 良品 + 10 不良品
+LOGS = [
+    make_log("IN", "P1", "2025-01-01 08:00:00"),
+    make_log("OUT", "P1", "2025-01-01 09:00:00"),
+    make_log("IN", "P2", "2025-01-01 10:00:00"),
+    make_log("OUT", "P2", "2025-01-01 12:30:00", qty="0010", status="N", box_seq="02"),
+    make_log("OUT", "P2", "2025-01-01 12:00:00", qty="0090"),
+]
+
+
+class TestOrderTrace:
+    """單一工單彙總測試"""
+
+    @pytest.mark.unit
+    def test_timeline_and_statistics(self):
+        """測試站點時間軸與統計數字"""
+        result = OrderTrace(LOGS).result()
+        p1, p2 = result["station_timeline"]
+
+        assert p1["process"] == "P1"
+        assert (p1["input_qty"], p1["output_qty"], p1["output_good_qty"]) == (100, 100, 100)
+        assert p1["total_time"] == "01:00:00"
+        assert p1["earliest_time"] == "2025-01-01T08:00:00"
+
+        assert p2["input_qty"] == 100  # 上一站良品數
+        assert (p2["output_good_qty"], p2["output_bad_qty"]) == (90, 10)
+        # 遷出記錄依時間排序，out_time 為最晚一筆
+        assert [r["qty"] for r in p2["out_records"]] == [90, 10]
+        assert p2["out_time"] == "2025-01-01 12:30:00"
+        assert p2["total_time"] == "02:30:00"
+
+        stats = result["statistics"]
+        assert stats["total_qty"] == 100
+        assert stats["final_good_qty"] == 90
+        assert stats["total_defect_qty"] == 10
+        assert stats["first_pass_rate"] == 90.0
+        assert stats["total_process_time"] == "03:30:00"
+        assert stats["station_yield_rates"] == {"P1": 100.0, "P2": 90.0}
+
+    @pytest.mark.unit
+    def test_incremental_add_matches_rebuild(self):
+        """測試逐筆加入的結果與一次建立相同，且加入後重新計算"""
+        trace = OrderTrace(LOGS[:2])
+        assert trace.result()["statistics"]["final_good_qty"] == 100
+        for log in LOGS[2:]:
+            trace.add(log)
+        assert trace.result() == OrderTrace(LOGS).result()
+
+    @pytest.mark.unit
+    def test_skips_unparseable_timestamps(self):
+        """測試時間戳記無法解析的記錄被忽略"""
+        result = OrderTrace([make_log("OUT", "P1", "not a time")]).result()
+        assert result["station_timeline"] == []
+        assert result["statistics"]["total_qty"] == 0
+
+
+class TestOrderTraceCache:
+    """工單彙總緩存測試"""
+
+    @pytest.mark.unit
+    def test_only_built_orders_are_patched(self):
+        """測試只有查詢過的工單會隨新記錄更新"""
+        cache = OrderTraceCache()
+        cache.on_append("251119AA", LOGS[0], timestamp_epoch(LOGS[0]["timestamp"]))  # 尚未建立，忽略
+        loaded = []
+
+        def load():
+            loaded.append(True)
+            return [(log, timestamp_epoch(log["timestamp"])) for log in LOGS[:2]]
+
+        assert cache.get("251119AA", load)["statistics"]["total_qty"] == 100
+        for log in LOGS[2:]:
+            cache.on_append("251119AA", log, timestamp_epoch(log["timestamp"]))
+        assert cache.get("251119AA", load)["statistics"]["final_good_qty"] == 90
+        assert loaded == [True]
+
+    @pytest.mark.unit
+    def test_log_store_keeps_trace_current(self):
+        """測試 LogStore 的工單彙總隨 append 更新（工單號忽略前導零）"""
+        store = LogStore(LOGS[:2])
+        assert store.order_trace("0251119aa")["statistics"]["final_good_qty"] == 100
+        store.extend(LOGS[2:])
+        assert store.order_trace("251119AA") == OrderTrace(LOGS).result()
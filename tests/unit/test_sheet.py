@@ -4,7 +4,9 @@ Google Sheets 服務模組測試
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
-from services.sheet import SheetService
+from services.sheet import SheetService, COLUMNS
+from services.sheet_schema import to_cache_record
+from services.write_journal import WriteJournal
 
 
 class TestSheetService:
@@ -287,3 +289,300 @@ class TestSheetService:
         result = mock_sheet_service.write_log(log_data)
         assert result is False
 
+    
+    @pytest.mark.unit
+    def test_get_logs_by_order_from_cache(self, mock_sheet_service):
+        """測試工單查詢直接從緩存索引讀取（不呼叫 Google Sheets API）"""
+        mock_sheet_service._store.append({
+            "action": "IN",
+            "order": "251119AA",
+            "process": "P2",
+            "scanned_barcode": "251119AA-P1-ST352-A1-01-G-0100-X4F",
+            "new_barcode": ""
+        })
+        
+        logs = mock_sheet_service.get_logs_by_order("0251119aa")
+        
+        assert len(logs) == 1
+        mock_sheet_service.client.open_by_key.assert_not_called()
+    
+    @pytest.mark.unit
+    def test_get_logs_by_order_read_through_when_stale(self, mock_sheet_service):
+        """測試緩存過期時先同步再讀取"""
+        mock_sheet_service._last_sync_time = None
+        with patch.object(mock_sheet_service, "_sync_from_sheet", return_value=True) as mock_sync:
+            mock_sheet_service.get_logs_by_order("251119AA", max_staleness=5)
+            mock_sync.assert_called_once()
+    
+    @pytest.mark.unit
+    def test_has_inbound_record_at_station_uses_cache(self, mock_sheet_service):
+        """測試站點遷入檢查從緩存讀取，非 strict 模式不呼叫 Google Sheets API"""
+        barcode = "251119AA-P1-ST352-A1-01-G-0100-X4F"
+        mock_sheet_service._store.append({
+            "action": "IN",
+            "order": "251119AA",
+            "process": "P2",
+            "scanned_barcode": barcode,
+            "new_barcode": ""
+        })
+        
+        assert mock_sheet_service.has_inbound_record_at_station(barcode, "P2") is True
+        assert mock_sheet_service.has_inbound_record_at_station(barcode, "P3") is False
+        assert mock_sheet_service.batch_check_inbound_records([barcode], "P2") == {barcode: True}
+        assert mock_sheet_service.has_inbound_record_at_other_stations(barcode, "P3") is True
+        mock_sheet_service.client.open_by_key.assert_not_called()
+    
+    @pytest.mark.unit
+    def test_has_inbound_record_at_station_strict(self, mock_sheet_service):
+        """測試 strict 模式在緩存未命中時查詢 Google Sheets"""
+        with patch.object(mock_sheet_service, "_has_inbound_record_at_station_remote", return_value=True) as mock_remote:
+            result = mock_sheet_service.has_inbound_record_at_station("251119AA-P1-ST352-A1-01-G-0100-X4F", "P2", strict=True)
+        
+        assert result is True
+        mock_remote.assert_called_once()
+
+
+class TestSheetServiceDeltaSync:
+    """增量同步測試"""
+    
+    HEADERS = [
+        "timestamp (時間戳記)", "action (動作)", "operator (操作員)", "order (工單號)",
+        "process (製程站點)", "sku (產品SKU)", "container (容器代號)", "box_seq (箱號)",
+        "qty (數量)", "status (貨態)", "cycle_time (工時)", "scanned_barcode (掃描條碼)",
+        "new_barcode (新條碼)"
+    ]
+    
+    @staticmethod
+    def make_row(box_seq, action="IN", process="P2"):
+        """建立工作表中的一列"""
+        return ["2025-01-01 10:00:00", action, "OP01", "251119AA", process, "ST352", "A1",
+                box_seq, "0100", "G", "0", f"251119AA-P1-ST352-A1-{box_seq}-G-0100-X4F", ""]
+    
+    @pytest.fixture
+    def service(self):
+        """建立已完成首次完整同步的 SheetService"""
+        service = SheetService()
+        service.client = Mock()
+        service.sheet_id = "test_sheet_id"
+        self.sheet_rows = [self.HEADERS, self.make_row("01"), self.make_row("02")]
+        worksheet = Mock()
+        worksheet.get_all_values.side_effect = lambda: [list(row) for row in self.sheet_rows]
+        
+        def batch_get(ranges):
+            # 只支援 "A{n}:M" 形式的尾端範圍
+            start = int(ranges[0].split(":")[0][1:])
+            return [[list(row) for row in self.sheet_rows[start - 1:]]]
+        
+        worksheet.batch_get.side_effect = batch_get
+        service.client.open_by_key.return_value.worksheet.return_value = worksheet
+        self.worksheet = worksheet
+        assert service._sync_from_sheet(full=True) is True
+        return service
+    
+    @pytest.mark.unit
+    def test_delta_sync_reads_only_new_rows(self, service):
+        """測試增量同步只讀取新增的列"""
+        self.sheet_rows.append(self.make_row("03"))
+        
+        assert service._sync_from_sheet() is True
+        
+        assert len(service._store) == 3
+        assert service._synced_row_count == 4
+        self.worksheet.get_all_values.assert_called_once()
+        assert self.worksheet.batch_get.call_args[0][0][0] == "A3:M"
+    
+    @pytest.mark.unit
+    def test_delta_sync_skips_local_writes(self, service):
+        """測試本程序寫入的記錄不會在增量同步時重複加入"""
+        self.worksheet.row_values.return_value = self.HEADERS
+        log_data = dict(zip(COLUMNS, self.make_row("03")))
+        assert service.write_log(log_data) is True
+        self.sheet_rows.append(self.make_row("03"))
+        
+        service._sync_from_sheet()
+        
+        assert len(service._store) == 3
+        assert service._unsynced_writes == {}
+    
+    @pytest.mark.unit
+    def test_sync_during_batch_append_does_not_duplicate(self, service):
+        """測試追加期間執行的增量同步讀到新列時，記錄不會重複加入緩存"""
+        self.worksheet.row_values.return_value = self.HEADERS
+        
+        def append_rows(rows):
+            self.sheet_rows.extend(rows)
+            assert service._sync_from_sheet() is True
+        
+        self.worksheet.append_rows.side_effect = append_rows
+        logs = [dict(zip(COLUMNS, self.make_row(box_seq))) for box_seq in ("03", "04")]
+        assert service.write_logs_batch(logs) == (2, [])
+        
+        assert len(service._store) == 4
+        assert len(service.get_logs_by_order("251119AA")) == 4
+        assert service._unsynced_writes == {}
+    
+    @pytest.mark.unit
+    def test_failed_append_is_rolled_back(self, service):
+        """測試追加失敗時撤銷已加入緩存的記錄"""
+        self.worksheet.row_values.return_value = self.HEADERS
+        self.worksheet.append_rows.side_effect = RuntimeError("append failed")
+        logs = [dict(zip(COLUMNS, self.make_row("03")))]
+        
+        assert service.write_logs_batch(logs) == (0, [0])
+        assert len(service._store) == 2
+        assert service._unsynced_writes == {}
+    
+    @pytest.mark.unit
+    def test_delta_sync_falls_back_to_full_on_shrink(self, service):
+        """測試列數減少時改為完整同步"""
+        del self.sheet_rows[-1]
+        
+        assert service._sync_from_sheet() is True
+        
+        assert len(service._store) == 1
+        assert self.worksheet.get_all_values.call_count == 2
+
+    @pytest.mark.unit
+    def test_journaled_writes_kept_until_committed(self, service, tmp_path):
+        """測試寫入日誌中的記錄立即可查，完整同步不會丟失，提交後寫入工作表"""
+        self.worksheet.row_values.return_value = self.HEADERS
+        service.journal = WriteJournal(str(tmp_path / "journal.jsonl"), service._commit_journal_records)
+        log_data = dict(zip(COLUMNS, self.make_row("03")))
+
+        assert service.submit_logs([log_data]) == (1, [])
+        assert len(service.get_logs_by_order("251119AA")) == 3
+        self.worksheet.append_rows.assert_not_called()
+
+        service.force_sync()
+        assert len(service._store) == 3
+
+        assert service.journal.flush_once() is True
+        self.worksheet.append_rows.assert_called_once()
+        self.sheet_rows.append(self.make_row("03"))
+        service._sync_from_sheet()
+        assert len(service._store) == 3
+        assert service.journal_status()["pending"] == 0
+
+    @pytest.mark.unit
+    def test_journal_replay_skips_rows_already_written(self, service, tmp_path):
+        """測試重啟後重新提交日誌記錄前，排除上次已寫入工作表（未寫入提交標記）的記錄"""
+        self.worksheet.row_values.return_value = self.HEADERS
+        journal_path = str(tmp_path / "journal.jsonl")
+        logs = [dict(zip(COLUMNS, self.make_row(box_seq))) for box_seq in ("03", "04")]
+        WriteJournal(journal_path, lambda records: True).submit([to_cache_record(log) for log in logs])
+        # 上次追加 03 後、寫入提交標記前中斷
+        self.sheet_rows.append(self.make_row("03"))
+        assert service._sync_from_sheet() is True
+
+        with patch("services.sheet.config_loader.get_value", return_value=journal_path):
+            service._init_journal()
+        assert len(service._store) == 5
+
+        assert service.journal.flush_once() is True
+        appended = self.worksheet.append_rows.call_args[0][0]
+        assert [row[COLUMNS.index("box_seq")] for row in appended] == ["04"]
+        assert len(service._store) == 4
+        assert service.journal_status()["pending"] == 0
+
+
+    @pytest.mark.unit
+    def test_snapshot_restores_cache_and_resumes_delta_sync(self, service, tmp_path):
+        """測試重啟後從快照載入緩存，只增量同步快照之後新增的列"""
+        from services.cache_snapshot import CacheSnapshot
+        service.snapshot = CacheSnapshot(str(tmp_path / "cache.snapshot"))
+        service._save_snapshot(force=True)
+
+        restarted = SheetService()
+        restarted.client = service.client
+        restarted.sheet_id = service.sheet_id
+        restarted.snapshot = service.snapshot
+        assert restarted._load_snapshot() is True
+        assert len(restarted.get_logs_by_order("251119AA")) == 2
+
+        self.sheet_rows.append(self.make_row("03"))
+        assert restarted._sync_from_sheet() is True
+        assert len(restarted._store) == 3
+        assert restarted._synced_row_count == 4
+        self.worksheet.get_all_values.assert_called_once()
+        assert self.worksheet.batch_get.call_args[0][0][0] == "A3:M"
+
+    @pytest.mark.unit
+    def test_shutdown_stops_journal_and_saves_snapshot(self, service, tmp_path):
+        """測試結束時停止寫入日誌，並不論寫入間隔寫入最後一次快照"""
+        from services.cache_snapshot import CacheSnapshot
+        service.snapshot = CacheSnapshot(str(tmp_path / "cache.snapshot"))
+        service._snapshot_saved_at = float("inf")
+        service.journal = Mock()
+
+        service.shutdown()
+        service.journal.stop.assert_called_once()
+        assert service.snapshot.load(service.sheet_id)["row_count"] == 3
+
+    @pytest.mark.unit
+    def test_queries_wait_for_initial_load(self, service):
+        """測試首次載入完成前查詢會等待，完成後返回緩存內容"""
+        import threading
+        service._initial_load.clear()
+        assert service.readiness()["ready"] is False
+        results = []
+        reader = threading.Thread(target=lambda: results.append(service.get_logs_by_order("251119AA")))
+        reader.start()
+        reader.join(timeout=0.1)
+        assert results == []
+
+        service._initial_load.set()
+        reader.join(timeout=1)
+        assert len(results[0]) == 2
+        assert service.readiness()["source"] == "sheet"
+
+
+class TestSheetServiceWorksheetHandle:
+    """工作表物件緩存測試"""
+    
+    @pytest.fixture
+    def service(self):
+        """建立模擬 client 的 SheetService"""
+        service = SheetService()
+        service.client = Mock()
+        service.sheet_id = "test_sheet_id"
+        return service
+    
+    @pytest.mark.unit
+    def test_worksheet_handle_reused(self, service):
+        """測試工作表物件在 TTL 內重複使用"""
+        first = service._get_worksheet()
+        second = service._get_worksheet()
+        
+        assert first is second
+        service.client.open_by_key.assert_called_once()
+    
+    @pytest.mark.unit
+    def test_worksheet_handle_invalidated_on_error(self, service):
+        """測試 API 錯誤後重新取得工作表物件"""
+        service._get_worksheet()
+        service._handle_api_error(Exception("Worksheet not found"))
+        service._get_worksheet()
+        
+        assert service.client.open_by_key.call_count == 2
+    
+    @pytest.mark.unit
+    def test_worksheet_handle_kept_on_rate_limit(self, service):
+        """測試速率限制錯誤不清除工作表物件緩存"""
+        service._get_worksheet()
+        service._handle_api_error(Exception("APIError: [429]: Quota exceeded"))
+        service._get_worksheet()
+        
+        service.client.open_by_key.assert_called_once()
+    
+    @pytest.mark.unit
+    def test_header_schema_cached_across_writes(self, service):
+        """測試標題列只讀取一次，之後的寫入只需一次 API 調用"""
+        worksheet = service._get_worksheet()
+        worksheet.row_values.return_value = TestSheetServiceDeltaSync.HEADERS
+        log_data = dict(zip(COLUMNS, TestSheetServiceDeltaSync.make_row("01")))
+        
+        assert service.write_log(log_data) is True
+        assert service.write_log(log_data) is True
+        
+        worksheet.row_values.assert_called_once()
+        assert worksheet.append_row.call_count == 2
@@ -0,0 +1,87 @@
+"""
+Google Sheets 非同步呼叫模組單元測試
+"""
+import asyncio
+import threading
+import time
+import pytest
+from services.sheet_io import SheetIO, SheetIOTimeout
+from services.sheet_quota import current_deadline
+
+
+class TestSheetIO:
+    """非同步呼叫器測試"""
+
+    @pytest.fixture
+    def sheet_io(self):
+        io = SheetIO(max_workers=4, default_timeout=1.0)
+        yield io
+        io.shutdown()
+
+    @pytest.mark.unit
+    def test_run_returns_result(self, sheet_io):
+        """測試在線程池中執行並返回結果（支援關鍵字參數）"""
+        def add(a, b=0):
+            return a + b
+
+        assert asyncio.run(sheet_io.run(add, 1, b=2)) == 3
+        assert sheet_io.status()["in_flight"] == 0
+
+    @pytest.mark.unit
+    def test_run_timeout(self, sheet_io):
+        """測試逾時拋出 SheetIOTimeout 並累計次數"""
+        with pytest.raises(SheetIOTimeout):
+            asyncio.run(sheet_io.run(time.sleep, 0.3, timeout=0.05))
+        assert sheet_io.status()["timeout_count"] == 1
+
+    @pytest.mark.unit
+    def test_concurrent_calls_do_not_serialize(self, sheet_io):
+        """測試多個阻塞呼叫並行執行，不會互相排隊"""
+        async def run_all():
+            await asyncio.gather(*[sheet_io.run(time.sleep, 0.2) for _ in range(3)])
+
+        started = time.time()
+        asyncio.run(run_all())
+        assert time.time() - started < 0.5
+
+    @pytest.mark.unit
+    def test_local_calls_not_blocked_by_sheets_calls(self):
+        """測試 Google Sheets 線程池佔滿時，緩存查詢仍在本機線程池立即執行"""
+        io = SheetIO(max_workers=1, default_timeout=1.0, local_workers=1)
+        release = threading.Event()
+
+        async def run_both():
+            blocked = asyncio.ensure_future(io.run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            assert io.status()["in_flight"] == 1
+            assert await io.run_local(lambda: "cached", timeout=0.5) == "cached"
+            release.set()
+            await blocked
+
+        try:
+            asyncio.run(run_both())
+        finally:
+            release.set()
+            io.shutdown()
+
+    @pytest.mark.unit
+    def test_run_write_has_no_timeout(self, sheet_io):
+        """測試非冪等寫入等待完成，不因逾時返回（避免前端重試重複寫入）"""
+        def slow_write():
+            time.sleep(0.2)
+            return (1, [])
+
+        assert asyncio.run(sheet_io.run_write(slow_write)) == (1, [])
+        # default_timeout 縮短也不影響
+        sheet_io.default_timeout = 0.05
+        assert asyncio.run(sheet_io.run_write(slow_write)) == (1, [])
+        assert sheet_io.status()["timeout_count"] == 0
+
+    @pytest.mark.unit
+    def test_deadline_passed_to_worker_thread(self, sheet_io):
+        """測試提交時計算的截止時間交給線程中的呼叫（配額排程依此放棄等待），非冪等寫入不設截止時間"""
+        started = time.monotonic()
+        deadline = asyncio.run(sheet_io.run(current_deadline, timeout=2.0))
+        assert started + 2.0 <= deadline <= time.monotonic() + 2.0
+        assert asyncio.run(sheet_io.run_write(current_deadline)) is None
+        assert current_deadline() is None
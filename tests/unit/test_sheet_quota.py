@@ -0,0 +1,158 @@
+"""
+Google Sheets API 配額排程模組單元測試
+"""
+import threading
+import time
+from unittest.mock import Mock
+import pytest
+from services.sheet_quota import (
+    READ, WRITE, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE,
+    SheetQuotaDeadlineExceeded, SheetQuotaScheduler, TokenBucket, caller_deadline, is_retryable_error
+)
+
+
+def make_api_error(status_code):
+    """建立帶有 HTTP 狀態碼的 API 錯誤"""
+    error = Exception(f"APIError: [{status_code}]")
+    error.response = Mock(status_code=status_code)
+    return error
+
+
+class TestRetryableError:
+    """錯誤分類測試"""
+
+    @pytest.mark.unit
+    def test_rate_limit_and_server_errors_are_retryable(self):
+        """測試 429 與 5xx 可重試，其他錯誤不重試"""
+        assert is_retryable_error(make_api_error(429)) is True
+        assert is_retryable_error(make_api_error(503)) is True
+        assert is_retryable_error(Exception("Quota exceeded for quota metric")) is True
+        assert is_retryable_error(make_api_error(404)) is False
+        assert is_retryable_error(Exception("模擬錯誤")) is False
+
+
+class TestSheetQuotaScheduler:
+    """配額排程器測試"""
+
+    @pytest.fixture
+    def scheduler(self):
+        return SheetQuotaScheduler(read_per_minute=60, write_per_minute=60, base_delay=0, max_delay=0)
+
+    @pytest.mark.unit
+    def test_retries_rate_limited_call(self, scheduler):
+        """測試 429 後重試成功，並記錄限流次數"""
+        func = Mock(side_effect=[make_api_error(429), "ok"])
+
+        assert scheduler.call(WRITE, func, ["row"]) == "ok"
+        assert func.call_count == 2
+        status = scheduler.status()[WRITE]
+        assert status["retries"] == 1
+        assert status["throttled"] == 1
+
+    @pytest.mark.unit
+    def test_non_retryable_error_raises_immediately(self, scheduler):
+        """測試不可重試的錯誤立即拋出"""
+        func = Mock(side_effect=make_api_error(400))
+
+        with pytest.raises(Exception):
+            scheduler.call(READ, func)
+        assert func.call_count == 1
+
+    @pytest.mark.unit
+    def test_gives_up_after_max_retries(self, scheduler):
+        """測試超過最多重試次數後拋出最後的錯誤"""
+        func = Mock(side_effect=make_api_error(503))
+
+        with pytest.raises(Exception):
+            scheduler.call(READ, func)
+        assert func.call_count == scheduler.max_retries + 1
+
+    @pytest.mark.unit
+    def test_write_not_retried_on_server_error(self, scheduler):
+        """測試寫入遇到 5xx 時不重試（伺服器可能已寫入），讀取仍會重試"""
+        func = Mock(side_effect=make_api_error(503))
+
+        with pytest.raises(Exception):
+            scheduler.call(WRITE, func, ["row"])
+        assert func.call_count == 1
+        assert scheduler.status()[WRITE]["retries"] == 0
+
+        func = Mock(side_effect=[make_api_error(503), "ok"])
+        assert scheduler.call(READ, func) == "ok"
+        assert func.call_count == 2
+
+    @pytest.mark.unit
+    def test_headroom_reflects_usage(self, scheduler):
+        """測試剩餘比例隨呼叫減少"""
+        for _ in range(6):
+            scheduler.call(READ, lambda: None)
+        status = scheduler.status()
+        assert status[READ]["headroom"] < 1.0
+        assert status[WRITE]["headroom"] == 1.0
+        assert status[READ]["calls"] == 6
+
+    @pytest.mark.unit
+    def test_background_priority_is_thread_local(self, scheduler):
+        """測試 background() 只影響目前線程"""
+        with scheduler.background():
+            assert scheduler.current_priority() == PRIORITY_BACKGROUND
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(scheduler.current_priority()))
+            thread.start()
+            thread.join()
+            assert seen == [PRIORITY_INTERACTIVE]
+        assert scheduler.current_priority() == PRIORITY_INTERACTIVE
+
+    @pytest.mark.unit
+    def test_backoff_beyond_deadline_raises(self):
+        """測試退避等待會超過呼叫端截止時間時立即放棄，不在背景繼續重試"""
+        scheduler = SheetQuotaScheduler(base_delay=10, max_delay=10)
+        scheduler._backoff_delay = lambda attempt: 10.0
+        func = Mock(side_effect=make_api_error(429))
+
+        started = time.monotonic()
+        with caller_deadline(time.monotonic() + 1.0):
+            with pytest.raises(SheetQuotaDeadlineExceeded) as exc_info:
+                scheduler.call(READ, func)
+        assert time.monotonic() - started < 0.5
+        assert func.call_count == 1
+        assert exc_info.value.__cause__ is not None
+
+
+class TestTokenBucket:
+    """令牌桶測試"""
+
+    @pytest.mark.unit
+    def test_background_cannot_use_interactive_reserve(self):
+        """測試背景呼叫不會用掉保留給互動呼叫的令牌"""
+        bucket = TokenBucket(per_minute=600, reserve_ratio=0.5)
+        bucket._tokens = 2.0
+
+        started = time.monotonic()
+        bucket.acquire(PRIORITY_INTERACTIVE)
+        assert time.monotonic() - started < 0.05
+
+        # 剩 1 個令牌，低於保留量（300），背景呼叫需等待
+        result = []
+        thread = threading.Thread(target=lambda: result.append(bucket.acquire(PRIORITY_BACKGROUND)), daemon=True)
+        thread.start()
+        thread.join(timeout=0.1)
+        assert thread.is_alive()
+        assert bucket.status()["waiting_background"] == 1
+
+    @pytest.mark.unit
+    def test_acquire_raises_when_refill_exceeds_deadline(self):
+        """測試令牌補充所需時間超過截止時間時拋出，不阻塞等待"""
+        bucket = TokenBucket(per_minute=60)
+        bucket._tokens = 0.0
+
+        started = time.monotonic()
+        with pytest.raises(SheetQuotaDeadlineExceeded):
+            bucket.acquire(PRIORITY_INTERACTIVE, deadline=time.monotonic() + 0.5)
+        assert time.monotonic() - started < 0.1
+        assert bucket.status()["waiting_interactive"] == 0
+
+        # 截止時間足夠時等待補充後取得
+        bucket = TokenBucket(per_minute=600)
+        bucket._tokens = 0.5
+        bucket.acquire(PRIORITY_INTERACTIVE, deadline=time.monotonic() + 1.0)
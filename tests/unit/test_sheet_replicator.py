@@ -0,0 +1,93 @@
+"""
+Google Sheets 複寫模組單元測試
+"""
+import pytest
+from services.sheet_replicator import SheetReplicator, HIGH_WATER_MARK
+from services.sqlite_storage import SQLiteLogStorage
+
+
+def make_log(box_seq):
+    """建立測試用的記錄資料"""
+    return {
+        "timestamp": "2025-01-01 10:00:00",
+        "action": "OUT",
+        "operator": "OP01",
+        "order": "251119AA",
+        "process": "P1",
+        "sku": "ST352",
+        "container": "A1",
+        "box_seq": box_seq,
+        "qty": "0100",
+        "status": "G",
+        "cycle_time": "0",
+        "scanned_barcode": "",
+        "new_barcode": f"251119AA-P1-ST352-A1-{box_seq}-G-0100-X4F"
+    }
+
+
+class TestSheetReplicator:
+    """複寫器測試"""
+
+    @pytest.fixture
+    def storage(self, tmp_path):
+        storage = SQLiteLogStorage(str(tmp_path / "logs.db"))
+        storage.write_logs_batch([make_log("01"), make_log("02"), make_log("03")])
+        yield storage
+        storage.close()
+
+    @pytest.mark.unit
+    def test_replicates_in_batches_and_persists_high_water_mark(self, storage):
+        """測試分批依序複寫，並持久化高水位"""
+        appended = []
+        replicator = SheetReplicator(storage, appended.append, batch_size=2)
+
+        assert replicator.replicate_once() is True
+        assert replicator.replicate_once() is True
+        assert replicator.replicate_once() is False
+        assert [[r["box_seq"] for r in batch] for batch in appended] == [["01", "02"], ["03"]]
+        assert storage.get_state(HIGH_WATER_MARK) == 3
+        assert replicator.status()["lag_rows"] == 0
+
+    @pytest.mark.unit
+    def test_resumes_from_high_water_mark_after_restart(self, storage):
+        """測試重新建立複寫器後從高水位繼續，不重複寫入"""
+        SheetReplicator(storage, lambda records: None).replicate_once()
+        storage.write_log(make_log("04"))
+
+        appended = []
+        restarted = SheetReplicator(storage, appended.append)
+        assert restarted.status()["lag_rows"] == 1
+        restarted.replicate_once()
+        assert [[r["box_seq"] for r in batch] for batch in appended] == [["04"]]
+
+    @pytest.mark.unit
+    def test_failure_keeps_high_water_mark(self, storage):
+        """測試寫入失敗時高水位不推進，並記錄重試狀態"""
+        def failing_append(records):
+            raise Exception("APIError: [503]")
+
+        replicator = SheetReplicator(storage, failing_append)
+        assert replicator.replicate_once() is False
+
+        status = replicator.status()
+        assert status["high_water_mark"] == 0
+        assert status["lag_rows"] == 3
+        assert status["lag_seconds"] > 0
+        assert status["retry_count"] == 1
+        assert "503" in status["last_error"]
+
+    @pytest.mark.unit
+    def test_lag_seconds_uses_parsed_timestamp(self, tmp_path):
+        """測試落後時間使用寫入時解析的秒數（支援 timestamp_epoch 接受的所有格式）"""
+        storage = SQLiteLogStorage(str(tmp_path / "formats.db"))
+        storage.write_logs_batch([{**make_log("01"), "timestamp": "2025/01/01 10:00:00"},
+                                  {**make_log("02"), "timestamp": "2025-01-01 10:00:00.250"}])
+        replicator = SheetReplicator(storage, lambda records: None, batch_size=1)
+        assert replicator.status()["lag_seconds"] > 0
+        replicator.replicate_once()
+        assert replicator.status()["lag_seconds"] > 0
+
+        storage.write_log({**make_log("03"), "timestamp": "not a time"})
+        replicator.replicate_once()
+        assert replicator.status()["lag_seconds"] is None
+        storage.close()
@@ -0,0 +1,65 @@
+"""
+工作表欄位配置模組單元測試
+"""
+import pytest
+from datetime import datetime
+from services.sheet_schema import (
+    COLUMNS, COLUMN_HEADERS, SheetSchema, format_cell, is_header_row, resolve_columns
+)
+
+
+class TestSheetSchema:
+    """欄位配置測試"""
+
+    @pytest.mark.unit
+    def test_resolve_columns_from_headers(self):
+        """測試從帶中文說明的標題解析欄位名"""
+        assert resolve_columns(COLUMN_HEADERS) == COLUMNS
+
+    @pytest.mark.unit
+    def test_resolve_columns_falls_back_to_position(self):
+        """測試無法識別的標題使用位置對應的欄位名"""
+        assert resolve_columns(["時間", "action"]) == ["timestamp", "action"]
+
+    @pytest.mark.unit
+    def test_is_header_row(self):
+        """測試標題列判斷"""
+        assert is_header_row(COLUMN_HEADERS) is True
+        assert is_header_row(["2025-01-01 10:00:00", "IN"]) is False
+        assert is_header_row([]) is False
+
+    @pytest.mark.unit
+    def test_column_index(self):
+        """測試欄號查詢（從 1 開始）"""
+        schema = SheetSchema.default()
+        assert schema.width == len(COLUMNS)
+        assert schema.column_index("timestamp") == 1
+        assert schema.column_index("scanned_barcode") == 12
+        assert schema.column_index("unknown") is None
+
+    @pytest.mark.unit
+    def test_to_row_follows_sheet_order(self):
+        """測試記錄轉換為列時依照工作表的欄位順序"""
+        schema = SheetSchema(["order (工單號)", "action (動作)", "timestamp (時間戳記)"])
+        row = schema.to_row({
+            "timestamp": datetime(2025, 1, 1, 10, 0, 0),
+            "action": "in",
+            "order": "251119aa"
+        })
+        assert row == ["251119AA", "IN", "2025-01-01 10:00:00"]
+
+    @pytest.mark.unit
+    def test_to_record_pads_missing_cells(self):
+        """測試列轉換為記錄時補齊缺少的單元格"""
+        schema = SheetSchema.default()
+        record = schema.to_record(["2025-01-01 10:00:00", "IN"])
+        assert record["action"] == "IN"
+        assert record["new_barcode"] == ""
+
+    @pytest.mark.unit
+    def test_format_cell_keeps_domain_case(self):
+        """測試 new_barcode 只轉換條碼部分為大寫"""
+        value = format_cell("new_barcode", "http://Example.com/b=251119aa-p2")
+        assert value == "http://Example.com/b=251119AA-P2"
+        assert format_cell("cycle_time", 0) == "0"
+        assert format_cell("operator", None) == ""
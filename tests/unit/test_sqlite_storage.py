@@ -0,0 +1,204 @@
+"""
+SQLite 記錄存儲單元測試
+"""
+import sqlite3
+import threading
+
+import pytest
+from services import sqlite_storage
+from services.sqlite_storage import SQLiteLogStorage
+from services.storage import create_storage
+
+
+BARCODE_P1 = "251119AA-P1-ST352-A1-01-G-0100-X4F"
+BARCODE_P2 = "251119AA-P2-ST352-A1-01-G-0100-ABC"
+
+
+def make_log(action, process, scanned="", new="", order="251119AA", timestamp="2025-01-01 10:00:00", status="G"):
+    """建立測試用的記錄資料"""
+    return {
+        "timestamp": timestamp,
+        "action": action,
+        "operator": "op01",
+        "order": order,
+        "process": process,
+        "sku": "ST352",
+        "container": "A1",
+        "box_seq": "01",
+        "qty": "0100",
+        "status": status,
+        "cycle_time": 0,
+        "scanned_barcode": scanned,
+        "new_barcode": new
+    }
+
+
+class TestSQLiteLogStorage:
+    """SQLite 存儲測試"""
+
+    @pytest.fixture
+    def storage(self, tmp_path):
+        """建立包含上一站遷出與本站遷入記錄的存儲"""
+        storage = SQLiteLogStorage(str(tmp_path / "logs.db"))
+        assert storage.write_logs_batch([
+            make_log("OUT", "P1", new=f"http://localhost:8000/b={BARCODE_P1}"),
+            make_log("IN", "P2", scanned=BARCODE_P1, timestamp="2025-01-01 11:00:00"),
+        ]) == (2, [])
+        yield storage
+        storage.close()
+
+    @pytest.mark.unit
+    def test_write_formats_like_sheet(self, storage):
+        """測試寫入的值與寫入工作表的格式一致（字串欄位轉大寫）"""
+        logs = storage.get_logs_by_barcode(BARCODE_P1)
+        assert [log["action"] for log in logs] == ["OUT", "IN"]
+        assert logs[0]["operator"] == "OP01"
+        assert logs[0]["cycle_time"] == "0"
+        assert storage.get_logs_by_barcode(BARCODE_P1, limit=1)[0]["action"] == "OUT"
+
+    @pytest.mark.unit
+    def test_station_checks(self, storage):
+        """測試站點遷入/遷出檢查只比對 scanned_barcode"""
+        assert storage.has_inbound_record_at_station(BARCODE_P1.lower(), "p2") is True
+        assert storage.has_inbound_record_at_station(BARCODE_P1, "P3") is False
+        assert storage.has_outbound_record_at_station(BARCODE_P1, "P1") is False
+        assert storage.has_inbound_record_at_other_stations(BARCODE_P1, "P3") is True
+        assert storage.has_inbound_record_at_other_stations(BARCODE_P1, "P2") is False
+
+    @pytest.mark.unit
+    def test_batch_check_inbound_records(self, storage):
+        """測試批量遷入檢查保留呼叫端傳入的條碼字串"""
+        result = storage.batch_check_inbound_records([BARCODE_P1.lower(), BARCODE_P2], "P2")
+        assert result == {BARCODE_P1.lower(): True, BARCODE_P2: False}
+
+    @pytest.mark.unit
+    def test_get_logs_by_order_ignores_leading_zeros(self, storage):
+        """測試工單查詢不區分大小寫並忽略前導零"""
+        assert len(storage.get_logs_by_order("0251119aa")) == 2
+        assert storage.get_logs_by_order("OTHER") == []
+
+    @pytest.mark.unit
+    def test_inbound_barcodes_at_station(self, storage):
+        """測試站點在製條碼：遷出後不再列出"""
+        assert [item["barcode"] for item in storage.get_inbound_barcodes_at_station("P2")] == [BARCODE_P1]
+        storage.write_log(make_log("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2))
+        assert storage.get_inbound_barcodes_at_station("P2") == []
+
+    @pytest.mark.unit
+    def test_inbound_barcodes_pagination(self, storage):
+        """測試在製條碼分頁與總數，同一條碼只取第一筆遷入記錄"""
+        storage.write_logs_batch([
+            make_log("IN", "P2", scanned=BARCODE_P2, timestamp="2025-01-01 09:00:00"),
+            make_log("IN", "P2", scanned=BARCODE_P1, timestamp="2025-01-01 12:00:00"),
+        ])
+        assert storage.count_inbound_barcodes_at_station("P2") == 2
+        page = storage.get_inbound_barcodes_at_station("P2", offset=1, limit=1)
+        assert [(item["barcode"], item["timestamp"]) for item in page] == [(BARCODE_P1, "2025-01-01 11:00:00")]
+        assert len(storage.get_inbound_barcodes_at_station("P2", offset=1)) == 1
+
+    @pytest.mark.unit
+    def test_inbound_barcodes_ordered_by_parsed_time(self, storage):
+        """測試在製條碼依 ts_epoch 排序，時間戳記格式不同時仍依實際時間排序"""
+        storage.write_logs_batch([
+            make_log("IN", "P2", scanned=BARCODE_P2, timestamp="2025/01/01 10:30:00"),
+        ])
+        assert [item["barcode"] for item in storage.get_inbound_barcodes_at_station("P2")] == [BARCODE_P2, BARCODE_P1]
+
+    @pytest.mark.unit
+    def test_previous_station_barcodes(self, storage):
+        """測試上一站條碼列表排除已在本站遷入的條碼"""
+        assert storage.get_previous_station_barcodes("251119AA", "P3") == []
+        storage.write_log(make_log("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2))
+        barcodes = storage.get_previous_station_barcodes("251119AA", "P3")
+        assert [item["barcode"] for item in barcodes] == [BARCODE_P2]
+
+    @pytest.mark.unit
+    def test_order_trace_updates_on_write(self, storage):
+        """測試工單追溯彙總在寫入後更新"""
+        assert storage.get_order_trace("251119AA")["statistics"]["total_qty"] == 100
+        storage.write_log(make_log("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2,
+                                   timestamp="2025-01-01 12:00:00", status="N"))
+        trace = storage.get_order_trace("0251119aa")
+        assert [station["process"] for station in trace["station_timeline"]] == ["P1", "P2"]
+        assert trace["statistics"]["final_good_qty"] == 0
+        assert trace["statistics"]["total_defect_qty"] == 100
+
+    @pytest.mark.unit
+    def test_yield_analytics_updates_on_write(self, storage):
+        """測試良率分析在寫入後包含新記錄"""
+        assert [g["key"] for g in storage.get_yield_analytics(("station",))["station"]] == ["P1", "P2"]
+        storage.write_log(make_log("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2, status="N"))
+        station = storage.get_yield_analytics(("station",))["station"][1]
+        assert (station["key"], station["bad_qty"], station["yield_rate"]) == ("P2", 100, 0.0)
+
+    @pytest.mark.unit
+    def test_aggregates_built_outside_lock_include_concurrent_writes(self, storage):
+        """測試彙總在鎖外建立：建立期間寫入不會被阻塞，寫入的記錄在發布前補上且只計入一次"""
+        query_parsed = storage._query_parsed
+        written = []
+
+        def query_then_write(where, params):
+            rows = query_parsed(where, params)
+            if not written:
+                # 建立彙總期間不持有鎖，寫入可以立即完成
+                assert not storage._aggregates_lock.locked()
+                written.append(storage.write_log(make_log("OUT", "P2", scanned=BARCODE_P1, new=BARCODE_P2,
+                                                          timestamp="2025-01-01 12:00:00")))
+            return rows
+
+        storage._query_parsed = query_then_write
+        trace = storage.get_order_trace("251119AA")
+        assert written == [True]
+        assert [station["process"] for station in trace["station_timeline"]] == ["P1", "P2"]
+        assert trace["statistics"]["final_good_qty"] == 100
+
+        written.clear()
+        station = storage.get_yield_analytics(("station",))["station"]
+        assert written == [True]
+        assert [(g["key"], g["records"], g["out_qty"]) for g in station] == [("P1", 1, 100), ("P2", 3, 200)]
+
+    @pytest.mark.unit
+    def test_close_closes_connections_of_all_threads(self, storage):
+        """測試關閉時一併關閉其他線程開啟的連線，之後再查詢會重新開啟"""
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(storage._connection()))
+        thread.start()
+        thread.join()
+
+        storage.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            connections[0].execute("SELECT 1")
+        assert storage.count() == 2
+
+    @pytest.mark.unit
+    def test_reopen_keeps_records(self, storage):
+        """測試重新開啟資料庫後記錄仍在"""
+        reopened = SQLiteLogStorage(storage.path)
+        assert reopened.count() == 2
+        reopened.close()
+
+
+    @pytest.mark.unit
+    def test_migrates_database_without_epoch_column(self, tmp_path):
+        """測試舊版資料庫（沒有 ts_epoch 欄位）開啟時回填時間戳記秒數"""
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(sqlite_storage._SCHEMA.replace(",\n    ts_epoch REAL", ""))
+        conn.execute('INSERT INTO logs ("timestamp", "order", order_key) VALUES (?, ?, ?)',
+                     ("1970-01-01 00:01:00", "251119AA", "251119AA"))
+        conn.commit()
+        conn.close()
+
+        storage = SQLiteLogStorage(path)
+        assert storage._connection().execute("SELECT ts_epoch FROM logs").fetchone()[0] == 60
+        storage.close()
+
+
+class TestCreateStorage:
+    """存儲後端選擇測試"""
+
+    @pytest.mark.unit
+    def test_unknown_backend(self):
+        """測試不支援的後端名稱"""
+        with pytest.raises(ValueError):
+            create_storage("excel")
@@ -0,0 +1,45 @@
+"""
+存儲後端選擇模組單元測試
+"""
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+import services.storage as storage_module
+
+
+class TestLazyLogStorage:
+    """全域存儲後端代理測試"""
+
+    @pytest.fixture(autouse=True)
+    def reset_storage(self, monkeypatch):
+        monkeypatch.setattr(storage_module, "_log_storage", None)
+
+    @pytest.mark.unit
+    def test_attribute_lookup_does_not_wait_for_creation(self):
+        """測試後端建立中時取得方法不會等待，呼叫時才等待建立完成"""
+        started = threading.Event()
+        release = threading.Event()
+        backend = MagicMock()
+        backend.get_order_trace.return_value = {"order": "A"}
+
+        def slow_create():
+            started.set()
+            release.wait(5)
+            return backend
+
+        with patch.object(storage_module, "create_storage", side_effect=slow_create):
+            init = threading.Thread(target=storage_module.get_log_storage)
+            init.start()
+            assert started.wait(5)
+
+            method = storage_module.log_storage.get_order_trace
+            assert method.__name__ == "get_order_trace"
+            assert storage_module.current_log_storage() is None
+
+            release.set()
+            assert method("A") == {"order": "A"}
+            init.join(5)
+
+        backend.get_order_trace.assert_called_once_with("A")
+        assert storage_module.log_storage.get_order_trace == backend.get_order_trace
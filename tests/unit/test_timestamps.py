@@ -0,0 +1,33 @@
+"""
+時間戳記解析單元測試
+"""
+import pytest
+from datetime import datetime
+from services.timestamps import parse_timestamp, timestamp_epoch, epoch_to_datetime
+
+
+class TestParseTimestamp:
+    """時間戳記解析測試"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value, expected", [
+        ("2025-01-01 08:00:00", datetime(2025, 1, 1, 8, 0, 0)),
+        (" 2025/1/2 3:04:05 ", datetime(2025, 1, 2, 3, 4, 5)),
+        ("2025-01-01 08:00:00.25", datetime(2025, 1, 1, 8, 0, 0, 250000)),
+        ("2025-13-01 08:00:00", None),
+        ("2025/01/01 08:00:00.5", None),
+        ("2025-01-01", None),
+        ("", None),
+        (None, None),
+    ])
+    def test_supported_formats(self, value, expected):
+        """測試支援的格式與無法解析的值"""
+        assert parse_timestamp(value) == expected
+
+    @pytest.mark.unit
+    def test_epoch_round_trip(self):
+        """測試秒數與 datetime 互轉（保留微秒）"""
+        epoch = timestamp_epoch("2025-06-30 23:59:59.123456")
+        assert epoch_to_datetime(epoch) == datetime(2025, 6, 30, 23, 59, 59, 123456)
+        assert timestamp_epoch("1970-01-01 00:01:00") == 60
+        assert timestamp_epoch("bad") is None
@@ -0,0 +1,122 @@
+"""
+寫入日誌模組單元測試
+"""
+import pytest
+from services.write_journal import WriteJournal
+
+
+def make_record(box_seq):
+    """建立測試用的記錄"""
+    return {"action": "OUT", "process": "P1", "box_seq": box_seq}
+
+
+class TestWriteJournal:
+    """寫入日誌測試"""
+
+    @pytest.fixture
+    def committed(self):
+        """記錄每次提交的批次"""
+        return []
+
+    @pytest.fixture
+    def journal_path(self, tmp_path):
+        return str(tmp_path / "journal.jsonl")
+
+    @pytest.mark.unit
+    def test_pending_records_survive_restart(self, journal_path, committed):
+        """測試未提交的記錄在重新開啟後仍保留"""
+        journal = WriteJournal(journal_path, lambda records: committed.append(records) or True)
+        assert journal.submit([make_record("01"), make_record("02")]) == [1, 2]
+
+        reopened = WriteJournal(journal_path, lambda records: True)
+        assert [r["box_seq"] for r in reopened.pending_records()] == ["01", "02"]
+        assert reopened.status()["last_seq"] == 2
+
+    @pytest.mark.unit
+    def test_flush_commits_in_order(self, journal_path, committed):
+        """測試分批依序提交，提交後重新開啟不再有待提交記錄"""
+        journal = WriteJournal(journal_path, lambda records: committed.append(records) or True, batch_size=2)
+        journal.submit([make_record("01"), make_record("02"), make_record("03")])
+
+        assert journal.flush_once() is True
+        assert journal.flush_once() is True
+        assert journal.flush_once() is False
+        assert [[r["box_seq"] for r in batch] for batch in committed] == [["01", "02"], ["03"]]
+        assert journal.status()["committed_seq"] == 3
+
+        reopened = WriteJournal(journal_path, lambda records: True)
+        assert reopened.pending_records() == []
+        assert reopened.submit([make_record("04")]) == [4]
+
+    @pytest.mark.unit
+    def test_failed_commit_keeps_records_and_backs_off(self, journal_path):
+        """測試提交失敗時記錄保留在佇列前端，並記錄重試狀態"""
+        def failing_commit(records):
+            raise Exception("429 Quota exceeded")
+
+        journal = WriteJournal(journal_path, failing_commit)
+        journal.submit([make_record("01")])
+
+        assert journal.flush_once() is False
+        status = journal.status()
+        assert status["pending"] == 1
+        assert status["retry_count"] == 1
+        assert "429" in status["last_error"]
+        assert status["next_retry_in"] > 0
+
+    @pytest.mark.unit
+    def test_torn_last_line_is_ignored(self, journal_path):
+        """測試日誌檔最後一行不完整（寫入中斷）時忽略該行"""
+        journal = WriteJournal(journal_path, lambda records: True)
+        journal.submit([make_record("01")])
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write('{"seq": 2, "log": {"box_')
+
+        reopened = WriteJournal(journal_path, lambda records: True)
+        assert [r["box_seq"] for r in reopened.pending_records()] == ["01"]
+        # 之後追加的記錄不會與不完整的行接在一起
+        reopened.submit([make_record("03")])
+        again = WriteJournal(journal_path, lambda records: True)
+        assert [r["box_seq"] for r in again.pending_records()] == ["01", "03"]
+
+    @pytest.mark.unit
+    def test_reloaded_records_reconciled_before_commit(self, journal_path, committed):
+        """測試重新載入的記錄（可能已提交但未寫入提交標記）先經確認函式排除已寫入的記錄"""
+        WriteJournal(journal_path, lambda records: True).submit([make_record("01"), make_record("02")])
+
+        reconciled = []
+
+        def reconcile(records):
+            reconciled.append([r["box_seq"] for r in records])
+            return [r for r in records if r["box_seq"] != "01"]
+
+        reopened = WriteJournal(journal_path, lambda records: committed.append(records) or True,
+                                reconcile_fn=reconcile)
+        reopened.submit([make_record("03")])
+        assert reopened.flush_once() is True
+        assert reconciled == [["01", "02", "03"]]
+        assert [[r["box_seq"] for r in batch] for batch in committed] == [["02", "03"]]
+
+        # 確認過的批次之後提交的記錄不再確認
+        reopened.submit([make_record("04")])
+        assert reopened.flush_once() is True
+        assert reconciled == [["01", "02", "03"]]
+        assert reopened.status()["committed_seq"] == 4
+
+    @pytest.mark.unit
+    def test_failed_commit_reconciled_on_retry(self, journal_path, committed):
+        """測試提交失敗後重試前先確認，全部已寫入時直接標記為已提交"""
+        attempts = []
+
+        def flaky_commit(records):
+            attempts.append(records)
+            if len(attempts) == 1:
+                raise Exception("503 Service Unavailable")
+            return True
+
+        journal = WriteJournal(journal_path, flaky_commit, reconcile_fn=lambda records: [])
+        journal.submit([make_record("01")])
+        assert journal.flush_once() is False
+        assert journal.flush_once() is True
+        assert len(attempts) == 1
+        assert journal.status()["pending"] == 0